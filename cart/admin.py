@@ -10,7 +10,7 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-	list_display = ("id", "user", "session_key", "total", "created_at")
+	list_display = ("id", "user", "session_key", "total", "item_count", "created_at")
 	search_fields = ("session_key", "user__email")
 	inlines = [CartItemInline]
 
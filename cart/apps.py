@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "cart"
+
+    def ready(self) -> None:
+        from . import cleanup, utils
+
+        utils.connect_signals()
+        cleanup.start_periodic_cleanup()
+        return super().ready()
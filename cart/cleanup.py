@@ -0,0 +1,128 @@
+"""Limpieza de carritos abandonados y sesiones caducadas.
+
+Se borra por lotes de ``CART_CLEANUP_BATCH_SIZE`` filas, cada lote en su
+propia transacción corta, para no bloquear SQLite mientras atiende
+peticiones. Lo usa el comando ``purge_carts`` y, si
+``CART_CLEANUP_INTERVAL`` > 0, un hilo en segundo plano del propio proceso.
+
+Se consideran abandonados los carritos sin usuario y los carritos vacíos que
+llevan más de ``CART_ABANDONED_DAYS`` días sin cambios. Los carritos con
+productos de usuarios registrados se conservan.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Cart
+
+logger = logging.getLogger(__name__)
+
+_DB_SESSION_ENGINES = (
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+)
+
+
+def batch_size() -> int:
+    return max(1, int(getattr(settings, "CART_CLEANUP_BATCH_SIZE", 500)))
+
+
+def _delete_in_batches(queryset, size: int, pause: float = 0) -> dict:
+    """Delete `queryset` ``size`` primary keys at a time; per-model row counts."""
+    removed: dict = {}
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list("pk", flat=True)[:size])
+            if not ids:
+                break
+            _total, per_model = queryset.model.objects.filter(pk__in=ids).delete()
+        for label, count in per_model.items():
+            removed[label] = removed.get(label, 0) + count
+        if len(ids) < size:
+            break
+        if pause:
+            time.sleep(pause)
+    return removed
+
+
+def abandoned_carts(max_age: timedelta, now=None):
+    cutoff = (now or timezone.now()) - max_age
+    return (
+        Cart.objects.filter(updated_at__lt=cutoff)
+        .filter(Q(user__isnull=True) | Q(item_count=0))
+        .order_by("updated_at")
+    )
+
+
+def purge_sessions(size: int, pause: float = 0, now=None) -> int:
+    """Delete expired sessions; batched for database-backed engines."""
+    engine = settings.SESSION_ENGINE
+    if engine not in _DB_SESSION_ENGINES:
+        # Caché/cookies: el backend sabe limpiarse (o no hay nada que hacer)
+        import_module(engine).SessionStore.clear_expired()
+        return 0
+    from django.contrib.sessions.models import Session
+
+    expired = Session.objects.filter(expire_date__lt=now or timezone.now()).order_by("expire_date")
+    return sum(_delete_in_batches(expired, size, pause).values())
+
+
+def purge(max_age: timedelta | None = None, size: int | None = None, pause: float = 0, sessions: bool = True) -> dict:
+    """Run a full cleanup; returns rows removed per table and the elapsed seconds."""
+    started = time.monotonic()
+    now = timezone.now()
+    if max_age is None:
+        max_age = timedelta(days=getattr(settings, "CART_ABANDONED_DAYS", 30))
+    size = size or batch_size()
+    removed = _delete_in_batches(abandoned_carts(max_age, now), size, pause)
+    stats = {
+        "carts": removed.get("cart.Cart", 0),
+        "cart_items": removed.get("cart.CartItem", 0),
+        "sessions": purge_sessions(size, pause, now) if sessions else 0,
+    }
+    stats["seconds"] = time.monotonic() - started
+    return stats
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run_periodically(interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        try:
+            stats = purge()
+            logger.info("Limpieza de carritos: %s", stats)
+        except Exception:
+            logger.exception("Falló la limpieza periódica de carritos")
+
+
+def start_periodic_cleanup(interval: float | None = None) -> threading.Event | None:
+    """Start the background cleanup thread once per process.
+
+    Returns the event that stops it, or None when disabled
+    (``CART_CLEANUP_INTERVAL`` = 0).
+    """
+    global _worker
+    if interval is None:
+        interval = float(getattr(settings, "CART_CLEANUP_INTERVAL", 0))
+    if interval <= 0:
+        return None
+    with _worker_lock:
+        if _worker is None:
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=_run_periodically, args=(interval, stop), name="cart-cleanup", daemon=True
+            )
+            thread.start()
+            _worker = stop
+    return _worker
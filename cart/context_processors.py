@@ -1,15 +1,26 @@
 from __future__ import annotations
 
-from .utils import get_or_create_cart
+from django.utils.functional import SimpleLazyObject
 
+from .utils import get_cart
 
-def cart(request):
+
+def _safe_cart(request):
     try:
-        c = get_or_create_cart(request)
-        return {
-            'cart': c,
-            'cart_item_count': c.items.count(),
-        }
+        return get_cart(request)
     except Exception:
         # In case of migrations pending
-        return {'cart': None, 'cart_item_count': 0}
+        return None
+
+
+def cart(request):
+    """Expose the cart lazily: nothing is queried unless a template uses it,
+    and nothing is ever created (anonymous page views do no DB writes)."""
+    def item_count():
+        c = _safe_cart(request)
+        return c.item_count if c is not None else 0
+
+    return {
+        'cart': SimpleLazyObject(lambda: _safe_cart(request)),
+        'cart_item_count': SimpleLazyObject(item_count),
+    }
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cart import cleanup
+
+
+class Command(BaseCommand):
+    help = "Borra por lotes los carritos abandonados y las sesiones caducadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=float, default=getattr(settings, "CART_ABANDONED_DAYS", 30),
+            help="Días sin cambios para considerar abandonado un carrito (por defecto, CART_ABANDONED_DAYS).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=cleanup.batch_size(),
+            help="Filas borradas por transacción.",
+        )
+        parser.add_argument(
+            "--pause", type=float, default=0,
+            help="Segundos de espera entre lotes para dejar paso a las peticiones.",
+        )
+        parser.add_argument(
+            "--keep-sessions", action="store_true",
+            help="No borrar las sesiones caducadas.",
+        )
+
+    def handle(self, *args, **options):
+        stats = cleanup.purge(
+            max_age=timedelta(days=options["days"]),
+            size=max(1, options["batch_size"]),
+            pause=options["pause"],
+            sessions=not options["keep_sessions"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Eliminados {stats['carts']} carritos ({stats['cart_items']} líneas) y "
+            f"{stats['sessions']} sesiones caducadas en {stats['seconds']:.2f}s."
+        ))
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from .storage import AnonymousCart, get_store
+from .utils import _DISCARD_ATTR, _REQUEST_ATTR, materialize_cart
+
+
+class AnonymousCartMiddleware:
+    """Write the anonymous cart back to its cookie/cache after the view.
+
+    Only carts changed during the request are written. Must go after
+    SessionMiddleware and AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        store = get_store()
+        if store is None:
+            return response
+        if getattr(request, _DISCARD_ATTR, False):
+            store.delete(request, response)
+            return response
+        cart = getattr(request, _REQUEST_ATTR, None)
+        if isinstance(cart, AnonymousCart) and cart.dirty and not store.save(request, response, cart):
+            # No cabe en la cookie: pasa a filas de la sesión
+            materialize_cart(request)
+            store.delete(request, response)
+        return response
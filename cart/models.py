@@ -1,36 +1,284 @@
 from __future__ import annotations
 
+from decimal import Decimal
+
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import CheckConstraint, Q, UniqueConstraint
+from django.db import models, transaction
+from django.db.models import CheckConstraint, Count, F, OuterRef, Q, Subquery, Sum, UniqueConstraint, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from catalog.models import Product
 
 
+def resolve_batch(ops, products: dict, quantities: dict) -> list[dict]:
+	"""Fold ``(op, product_id, quantity)`` operations into final quantities.
+
+	``quantities`` (product id -> current quantity) is updated in place; a
+	quantity of 0 means the line goes away. Returns the skipped operations as
+	``{"index": i, "error": "..."}``.
+	"""
+	errors = []
+	for index, (op, pid, quantity) in enumerate(ops):
+		product = products.get(pid)
+		current = quantities.get(pid, 0)
+		if product is None:
+			errors.append({"index": index, "error": "Invalid product"})
+		elif op == "add":
+			if product.stock <= 0:
+				errors.append({"index": index, "error": "Out of stock"})
+			else:
+				quantities[pid] = min(current + max(1, quantity), product.stock)
+		elif op == "update":
+			if not current:
+				errors.append({"index": index, "error": "Item not in cart"})
+			else:
+				quantities[pid] = min(max(1, quantity), product.stock)
+		else:
+			quantities[pid] = 0
+	return errors
+
+
 class Cart(models.Model):
 	user = models.ForeignKey(
 		settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="carts"
 	)
 	session_key = models.CharField(max_length=40, unique=True, null=True, blank=True)
+	# total e item_count están desnormalizados: cada cambio de un item los
+	# actualiza con un único UPDATE (ver CartItem.save/delete)
 	total = models.DecimalField(max_digits=100, decimal_places=2, default=0)
+	item_count = models.PositiveIntegerField(default=0)
+	# Sube en cada cambio; los clientes piden solo lo cambiado desde su versión
+	version = models.PositiveBigIntegerField(default=0)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
 	class Meta:
 		verbose_name = "carrito"
 		verbose_name_plural = "carritos"
+		indexes = [
+			# La limpieza de carritos abandonados recorre por antigüedad
+			models.Index(fields=["updated_at"], name="cart_updated_at_idx"),
+		]
 
 	def __str__(self) -> str:
 		who = self.user.email if self.user_id else (self.session_key or "anónimo")
 		return f"Carrito {self.pk} – {who}"
 
 	def recalc_total(self, save: bool = True):
-		total = sum(item.subtotal for item in self.items.all())
-		self.total = total
-		if save:
-			self.save(update_fields=["total", "updated_at"])
-		return total
+		"""Recompute total and item_count from the items with one aggregate.
+
+		With ``save`` this is a single ``UPDATE ... SET total = (SELECT SUM(...))``.
+		"""
+		if not save:
+			agg = self.items.aggregate(total=Sum("subtotal"), count=Count("id"))
+			self.total = agg["total"] or Decimal("0")
+			self.item_count = agg["count"]
+			return self.total
+		items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+		Cart.objects.filter(pk=self.pk).update(
+			total=Coalesce(Subquery(items.annotate(s=Sum("subtotal")).values("s")), Value(Decimal("0"))),
+			item_count=Coalesce(Subquery(items.annotate(c=Count("id")).values("c")), Value(0)),
+			version=F("version") + 1,
+			updated_at=timezone.now(),
+		)
+		self.refresh_from_db(fields=["total", "item_count", "version", "updated_at"])
+		return self.total
+
+	@staticmethod
+	def bump(cart_id, total_delta=Decimal("0"), count_delta: int = 0) -> tuple:
+		"""Apply a change to the denormalized totals with one F() UPDATE.
+
+		Also increments the version. Returns the new ``(total, item_count,
+		version)``; callers run it inside their transaction, so the version
+		read back is the one this change produced.
+		"""
+		Cart.objects.filter(pk=cart_id).update(
+			total=F("total") + total_delta,
+			item_count=F("item_count") + count_delta,
+			version=F("version") + 1,
+			updated_at=timezone.now(),
+		)
+		return Cart.objects.filter(pk=cart_id).values_list("total", "item_count", "version").get()
+
+	def _set_counters(self, counters: tuple) -> None:
+		self.total, self.item_count, self.version = counters
+
+	# Interfaz compartida con cart.storage.AnonymousCart: vistas y plantillas
+	# usan solo estos métodos, no la relación ``items`` directamente.
+
+	def lines(self) -> list:
+		"""Items with their product, in insertion order."""
+		return list(self.items.select_related("product").order_by("id"))
+
+	def get_line(self, product_id):
+		return self.items.filter(product_id=product_id).select_related("product").first()
+
+	def is_empty(self) -> bool:
+		return not self.items.exists()
+
+	def changes_since(self, since):
+		"""``(changed lines, removed product ids)`` after version `since`.
+
+		None when the client needs the full cart (no ``since``, or a version
+		this cart never had).
+		"""
+		if since is None or since > self.version:
+			return None
+		changed = list(self.items.filter(version__gt=since).select_related("product").order_by("id"))
+		removed = list(self.tombstones.filter(version__gt=since).values_list("product_id", flat=True))
+		return changed, removed
+
+	def add_product(self, product, quantity: int) -> "CartItem":
+		"""Add `quantity` units of `product`, clamping the line to the stock."""
+		if product.stock <= 0:
+			raise ValueError("Out of stock")
+		with transaction.atomic():
+			item = self.items.filter(product=product).first()
+			if item is None:
+				item = CartItem(cart=self, product=product, quantity=min(quantity, product.stock))
+			else:
+				item.cart = self
+				item.quantity = min(item.quantity + quantity, product.stock)
+			item.unit_price = product.price
+			item.save()
+		return item
+
+	def set_quantity(self, item: "CartItem", quantity: int) -> "CartItem":
+		"""Set the quantity of an existing line (the caller clamps it)."""
+		item.cart = self
+		item.quantity = quantity
+		item.unit_price = item.product.price
+		item.save()
+		return item
+
+	def remove_product(self, product_id) -> int:
+		"""Delete the line for `product_id`; returns the number of rows removed."""
+		with transaction.atomic():
+			row = self.items.filter(product_id=product_id).values_list("id", "subtotal").first()
+			if row is None:
+				return 0
+			self._set_counters(Cart.bump(self.pk, -row[1], -1))
+			CartItem.objects.filter(pk=row[0]).delete()
+			CartItemTombstone.record(self.pk, [product_id], self.version)
+		return 1
+
+	def apply_batch(self, ops) -> list[dict]:
+		"""Apply ordered ``(op, product_id, quantity)`` operations at once.
+
+		``op`` is "add", "update" or "remove", with the same rules as the single
+		endpoints. The final quantity of every touched line is computed in
+		memory and written with one bulk INSERT, one bulk UPDATE, one DELETE
+		and one aggregate UPDATE of the totals, inside one transaction.
+		Operations that cannot be applied are skipped and reported as
+		``{"index": i, "error": "..."}``.
+		"""
+		with transaction.atomic():
+			product_ids = {pid for _op, pid, _q in ops}
+			products = Product.objects.in_bulk(product_ids)
+			items = {it.product_id: it for it in self.items.filter(product_id__in=product_ids)}
+			quantities = {pid: it.quantity for pid, it in items.items()}
+			errors = resolve_batch(ops, products, quantities)
+
+			to_create, to_update, to_delete = [], [], []
+			for pid, quantity in quantities.items():
+				item = items.get(pid)
+				if quantity <= 0:
+					if item is not None:
+						to_delete.append(item)
+				elif item is None:
+					to_create.append(CartItem(cart=self, product_id=pid, quantity=quantity, unit_price=products[pid].price))
+				elif (item.quantity, item.unit_price) != (quantity, products[pid].price):
+					item.quantity, item.unit_price = quantity, products[pid].price
+					to_update.append(item)
+			self.write_lines(to_create, to_update, to_delete)
+		return errors
+
+	def write_lines(self, created=(), updated=(), deleted=()) -> None:
+		"""Persist lines changed in memory with bulk statements.
+
+		``created`` are new ``CartItem`` objects, ``updated`` loaded items whose
+		quantity/unit_price changed and ``deleted`` loaded items to remove.
+		The totals change by the difference of the subtotals, so the cart is
+		touched by one F() UPDATE and the whole write shares one version.
+		"""
+		if not (created or updated or deleted):
+			return
+		total_delta, count_delta = Decimal("0"), len(created) - len(deleted)
+		for item in (*created, *updated):
+			previous = getattr(item, "_saved_subtotal", None) or Decimal("0")
+			item.subtotal = item.unit_price * item.quantity
+			total_delta += item.subtotal - (previous if item.pk else Decimal("0"))
+		for item in deleted:
+			total_delta -= item.subtotal
+		with transaction.atomic():
+			# Los totales se conocen por diferencia: un solo UPDATE con F()
+			self._set_counters(Cart.bump(self.pk, total_delta, count_delta))
+			if deleted:
+				CartItem.objects.filter(pk__in=[it.pk for it in deleted]).delete()
+				CartItemTombstone.record(self.pk, [it.product_id for it in deleted], self.version)
+			for item in (*created, *updated):
+				item.version = self.version
+			if updated:
+				CartItem.objects.bulk_update(updated, ["quantity", "unit_price", "subtotal", "version"])
+				for item in updated:
+					item._saved_subtotal = item.subtotal
+			if created:
+				CartItem.objects.bulk_create(created)
+
+	def merge_quantities(self, quantities: dict) -> int:
+		"""Add ``{product_id: quantity}`` to this cart with one upsert.
+
+		Lines already in the cart add up; every line is clamped to the stock
+		and products without stock are skipped. The rows are written with a
+		single ``INSERT ... ON CONFLICT (cart, product) DO UPDATE`` and the
+		totals with one F() UPDATE. Returns the number of lines written.
+		"""
+		with transaction.atomic():
+			products = Product.objects.in_bulk(list(quantities))
+			current = {
+				pid: (quantity, subtotal)
+				for pid, quantity, subtotal in self.items.filter(product_id__in=list(products))
+				.values_list("product_id", "quantity", "subtotal")
+			}
+			rows, total_delta, count_delta = [], Decimal("0"), 0
+			for pid, quantity in quantities.items():
+				product = products.get(pid)
+				if product is None or product.stock <= 0 or quantity <= 0:
+					continue
+				old_quantity, old_subtotal = current.get(pid, (0, Decimal("0")))
+				quantity = min(old_quantity + quantity, product.stock)
+				row = CartItem(
+					cart=self, product_id=pid, quantity=quantity,
+					unit_price=product.price, subtotal=product.price * quantity,
+				)
+				rows.append(row)
+				total_delta += row.subtotal - old_subtotal
+				count_delta += 0 if pid in current else 1
+			if not rows:
+				return 0
+			self._set_counters(Cart.bump(self.pk, total_delta, count_delta))
+			for row in rows:
+				row.version = self.version
+			CartItem.objects.bulk_create(
+				rows,
+				update_conflicts=True,
+				unique_fields=["cart", "product"],
+				update_fields=["quantity", "unit_price", "subtotal", "version"],
+			)
+		return len(rows)
+
+	def clear(self) -> None:
+		with transaction.atomic():
+			product_ids = list(self.items.values_list("product_id", flat=True))
+			self.items.all().delete()
+			Cart.objects.filter(pk=self.pk).update(
+				total=Decimal("0"), item_count=0, version=F("version") + 1, updated_at=timezone.now()
+			)
+			self.version = Cart.objects.filter(pk=self.pk).values_list("version", flat=True).get()
+			CartItemTombstone.record(self.pk, product_ids, self.version)
+		self.total, self.item_count = Decimal("0"), 0
 
 
 class CartItem(models.Model):
@@ -39,6 +287,8 @@ class CartItem(models.Model):
 	quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
 	unit_price = models.DecimalField(max_digits=100, decimal_places=2)
 	subtotal = models.DecimalField(max_digits=100, decimal_places=2)
+	# Versión del carrito en el último cambio de esta línea
+	version = models.PositiveBigIntegerField(default=0)
 
 	class Meta:
 		verbose_name = "item de carrito"
@@ -48,13 +298,74 @@ class CartItem(models.Model):
 			UniqueConstraint(fields=["cart", "product"], name="unique_cart_product"),
 		]
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# Subtotal guardado: el total del carrito se actualiza por diferencia
+		instance._saved_subtotal = instance.__dict__.get("subtotal")
+		return instance
+
 	def save(self, *args, **kwargs):
 		if not self.unit_price and self.product_id:
 			self.unit_price = self.product.price
 		self.subtotal = (self.unit_price or 0) * self.quantity
-		super().save(*args, **kwargs)
-		self.cart.recalc_total(save=True)
+		if kwargs.get("update_fields") is not None:
+			kwargs["update_fields"] = {*kwargs["update_fields"], "subtotal", "version"}
+		previous = getattr(self, "_saved_subtotal", None)
+		with transaction.atomic():
+			if self._state.adding or previous is not None:
+				if self._state.adding:
+					delta, count = self.subtotal, 1
+				else:
+					delta, count = self.subtotal - previous, 0
+				counters = Cart.bump(self.cart_id, delta, count)
+				self.version = counters[2]
+				super().save(*args, **kwargs)
+			else:
+				# Sin el subtotal anterior no hay diferencia fiable: agregado completo
+				super().save(*args, **kwargs)
+				cart = Cart.objects.get(pk=self.cart_id)
+				cart.recalc_total(save=True)
+				counters = (cart.total, cart.item_count, cart.version)
+				self.version = cart.version
+				CartItem.objects.filter(pk=self.pk).update(version=self.version)
+			if CartItem.cart.is_cached(self):
+				self.cart._set_counters(counters)
+		self._saved_subtotal = self.subtotal
+
+	def delete(self, *args, **kwargs):
+		with transaction.atomic():
+			counters = Cart.bump(self.cart_id, -self.subtotal, -1)
+			result = super().delete(*args, **kwargs)
+			CartItemTombstone.record(self.cart_id, [self.product_id], counters[2])
+		if CartItem.cart.is_cached(self):
+			self.cart._set_counters(counters)
+		return result
 
 	def __str__(self) -> str:
 		return f"{self.quantity} x {self.product.name}"
 
+
+class CartItemTombstone(models.Model):
+	"""Marca de una línea borrada, para las respuestas delta (``since``)."""
+
+	cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="tombstones")
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+	version = models.PositiveBigIntegerField()
+
+	class Meta:
+		constraints = [
+			UniqueConstraint(fields=["cart", "product"], name="unique_cart_tombstone"),
+		]
+
+	@classmethod
+	def record(cls, cart_id, product_ids, version: int) -> None:
+		"""Upsert one tombstone per product in a single statement."""
+		if not product_ids:
+			return
+		cls.objects.bulk_create(
+			[cls(cart_id=cart_id, product_id=pid, version=version) for pid in product_ids],
+			update_conflicts=True,
+			unique_fields=["cart", "product"],
+			update_fields=["version"],
+		)
@@ -0,0 +1,294 @@
+"""Carritos anónimos fuera de la base de datos.
+
+Los visitantes sin sesión iniciada guardan la cesta en una cookie firmada
+(``CART_ANONYMOUS_STORAGE = "cookie"``) o en la caché de Django con una
+cookie firmada que solo lleva la clave (``"cache"``). Con ``"db"`` se usan
+filas ``Cart``/``CartItem`` como siempre. También se acepta la ruta de una
+clase propia con la misma interfaz que ``CookieCartStore``.
+
+``AnonymousCart`` expone los mismos métodos que ``Cart`` (``lines``,
+``get_line``, ``add_product``, ``apply_batch``...), así que las vistas no
+distinguen entre uno y otro. Solo se convierte en filas al confirmar el
+pedido (``persist``) o al iniciar sesión, cuando se suma al carrito del
+usuario; navegar y llenar la cesta no escribe nada en la base de datos.
+"""
+from __future__ import annotations
+
+import json
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from catalog.models import Product
+from .models import Cart, CartItem, CartItemTombstone, resolve_batch
+
+_SALT = "cart.anonymous"
+
+
+class AnonymousLine:
+    """In-memory counterpart of ``CartItem``."""
+
+    __slots__ = ("product_id", "product", "quantity", "unit_price", "subtotal", "version")
+
+    def __init__(self, product_id: int, quantity: int, unit_price: Decimal, version: int, product=None):
+        self.product_id = product_id
+        self.product = product
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.subtotal = unit_price * quantity
+        self.version = version
+
+
+class AnonymousCart:
+    """Cart kept in a cookie or the cache; same interface as ``Cart``."""
+
+    pk = id = None
+    user = user_id = session_key = None
+
+    def __init__(self, data: dict | None = None):
+        data = data or {}
+        self.version = int(data.get("v", 0))
+        # Versión más antigua para la que hay marcas de borrado completas
+        self.floor = int(data.get("f", 0))
+        self._lines = {
+            int(pid): AnonymousLine(int(pid), int(q), Decimal(price), int(v))
+            for pid, (q, price, v) in data.get("i", {}).items()
+        }
+        self._removed = {int(pid): int(v) for pid, v in data.get("r", {}).items()}
+        self.dirty = False
+
+    def to_data(self) -> dict:
+        return {
+            "v": self.version,
+            "f": self.floor,
+            "i": {str(pid): [ln.quantity, str(ln.unit_price), ln.version] for pid, ln in self._lines.items()},
+            "r": {str(pid): v for pid, v in self._removed.items()},
+        }
+
+    @property
+    def total(self) -> Decimal:
+        return sum((ln.subtotal for ln in self._lines.values()), Decimal("0"))
+
+    @property
+    def item_count(self) -> int:
+        return len(self._lines)
+
+    def _load_products(self) -> None:
+        missing = [pid for pid, ln in self._lines.items() if ln.product is None]
+        if not missing:
+            return
+        products = Product.objects.in_bulk(missing)
+        for pid in missing:
+            if pid in products:
+                self._lines[pid].product = products[pid]
+            else:
+                # Producto borrado desde que se añadió
+                self.remove_product(pid)
+
+    def lines(self) -> list:
+        self._load_products()
+        return list(self._lines.values())
+
+    def get_line(self, product_id):
+        line = self._lines.get(int(product_id))
+        if line is not None and line.product is None:
+            self._load_products()
+            line = self._lines.get(int(product_id))
+        return line
+
+    def is_empty(self) -> bool:
+        return not self._lines
+
+    def quantities(self) -> dict:
+        """``{product_id: quantity}`` without loading the products."""
+        return {pid: ln.quantity for pid, ln in self._lines.items()}
+
+    def changes_since(self, since):
+        if since is None or since > self.version or since < self.floor:
+            return None
+        self._load_products()
+        changed = [ln for ln in self._lines.values() if ln.version > since]
+        removed = [pid for pid, v in self._removed.items() if v > since]
+        return changed, removed
+
+    def _touch(self) -> int:
+        self.version += 1
+        self.dirty = True
+        return self.version
+
+    def _put(self, product, quantity: int, version: int) -> AnonymousLine:
+        line = AnonymousLine(product.pk, quantity, product.price, version, product)
+        self._lines[product.pk] = line
+        self._removed.pop(product.pk, None)
+        return line
+
+    def add_product(self, product, quantity: int) -> AnonymousLine:
+        if product.stock <= 0:
+            raise ValueError("Out of stock")
+        current = self._lines.get(product.pk)
+        quantity = min((current.quantity if current else 0) + quantity, product.stock)
+        return self._put(product, quantity, self._touch())
+
+    def set_quantity(self, item: AnonymousLine, quantity: int) -> AnonymousLine:
+        return self._put(item.product, quantity, self._touch())
+
+    def remove_product(self, product_id) -> int:
+        product_id = int(product_id)
+        if product_id not in self._lines:
+            return 0
+        del self._lines[product_id]
+        self._removed[product_id] = self._touch()
+        return 1
+
+    def apply_batch(self, ops) -> list[dict]:
+        products = Product.objects.in_bulk({pid for _op, pid, _q in ops})
+        quantities = {pid: self._lines[pid].quantity for pid in products if pid in self._lines}
+        errors = resolve_batch(ops, products, quantities)
+        version = None
+        for pid, quantity in quantities.items():
+            line = self._lines.get(pid)
+            if quantity <= 0:
+                if line is not None:
+                    del self._lines[pid]
+                    version = version or self._touch()
+                    self._removed[pid] = version
+            elif line is None or (line.quantity, line.unit_price) != (quantity, products[pid].price):
+                # Un lote entero comparte una versión, como en Cart.apply_batch
+                version = version or self._touch()
+                self._put(products[pid], quantity, version)
+        return errors
+
+    def clear(self) -> None:
+        if not self._lines:
+            return
+        version = self._touch()
+        for pid in self._lines:
+            self._removed[pid] = version
+        self._lines.clear()
+
+    def drop_removed(self) -> None:
+        """Forget the tombstones; older ``since`` values get a full payload."""
+        self.floor = self.version
+        self._removed.clear()
+
+    def persist(self, session_key: str, user=None) -> Cart:
+        """Write this cart as ``Cart``/``CartItem`` rows, keeping its versions."""
+        self._load_products()
+        with transaction.atomic():
+            cart, _ = Cart.objects.update_or_create(session_key=session_key, defaults={"user": user})
+            cart.items.all().delete()
+            CartItem.objects.bulk_create([
+                CartItem(
+                    cart=cart, product_id=ln.product_id, quantity=ln.quantity,
+                    unit_price=ln.unit_price, subtotal=ln.subtotal, version=ln.version,
+                )
+                for ln in self._lines.values()
+            ])
+            # Las marcas de productos ya borrados del catálogo no hacen falta
+            existing = set(Product.objects.filter(pk__in=list(self._removed)).values_list("pk", flat=True))
+            if existing:
+                CartItemTombstone.objects.bulk_create(
+                    [CartItemTombstone(cart=cart, product_id=pid, version=v)
+                     for pid, v in self._removed.items() if pid in existing],
+                    update_conflicts=True,
+                    unique_fields=["cart", "product"],
+                    update_fields=["version"],
+                )
+            Cart.objects.filter(pk=cart.pk).update(
+                total=self.total, item_count=self.item_count, version=self.version
+            )
+            cart.refresh_from_db(fields=["total", "item_count", "version", "updated_at"])
+        return cart
+
+
+def _max_age() -> int:
+    return int(getattr(settings, "CART_ANONYMOUS_MAX_AGE", 60 * 60 * 24 * 30))
+
+
+def _cookie_name() -> str:
+    return getattr(settings, "CART_COOKIE_NAME", "petfun_cart")
+
+
+def _set_cookie(response, value: str) -> None:
+    response.set_signed_cookie(
+        _cookie_name(), value, salt=_SALT, max_age=_max_age(),
+        httponly=True, samesite="Lax", secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+
+class CookieCartStore:
+    """The whole cart, as compact JSON, in a signed cookie."""
+
+    def max_bytes(self) -> int:
+        return int(getattr(settings, "CART_COOKIE_MAX_BYTES", 3800))
+
+    def load(self, request) -> AnonymousCart | None:
+        raw = request.get_signed_cookie(_cookie_name(), default=None, salt=_SALT, max_age=_max_age())
+        if not raw:
+            return None
+        try:
+            return AnonymousCart(json.loads(raw))
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def save(self, request, response, cart: AnonymousCart) -> bool:
+        """Set the cookie; False when the cart does not fit even without tombstones."""
+        value = json.dumps(cart.to_data(), separators=(",", ":"))
+        if len(value) > self.max_bytes() and cart._removed:
+            cart.drop_removed()
+            value = json.dumps(cart.to_data(), separators=(",", ":"))
+        if len(value) > self.max_bytes():
+            return False
+        _set_cookie(response, value)
+        return True
+
+    def delete(self, request, response) -> None:
+        response.delete_cookie(_cookie_name(), samesite="Lax")
+
+
+class CacheCartStore:
+    """The cart in the cache framework; the cookie only carries its key."""
+
+    def _cache(self):
+        return caches[getattr(settings, "CART_CACHE_ALIAS", "default")]
+
+    def _token(self, request) -> str | None:
+        return request.get_signed_cookie(_cookie_name(), default=None, salt=_SALT, max_age=_max_age())
+
+    def load(self, request) -> AnonymousCart | None:
+        token = self._token(request)
+        data = self._cache().get(f"cart:{token}") if token else None
+        return AnonymousCart(data) if data else None
+
+    def save(self, request, response, cart: AnonymousCart) -> bool:
+        token = self._token(request) or secrets.token_urlsafe(24)
+        self._cache().set(f"cart:{token}", cart.to_data(), _max_age())
+        _set_cookie(response, token)
+        return True
+
+    def delete(self, request, response) -> None:
+        token = self._token(request)
+        if token:
+            self._cache().delete(f"cart:{token}")
+        response.delete_cookie(_cookie_name(), samesite="Lax")
+
+
+STORES = {
+    "cookie": CookieCartStore,
+    "cache": CacheCartStore,
+}
+_stores: dict = {}
+
+
+def get_store():
+    """Store for anonymous carts, or None when they live in the database."""
+    name = getattr(settings, "CART_ANONYMOUS_STORAGE", "db")
+    if not name or name == "db":
+        return None
+    if name not in _stores:
+        _stores[name] = (STORES.get(name) or import_string(name))()
+    return _stores[name]
@@ -0,0 +1,22 @@
+"""Helpers compartidos por los tests del carrito."""
+from __future__ import annotations
+
+import json
+from decimal import Decimal
+
+from django.urls import reverse
+
+from catalog.models import Product
+
+
+class CartTestMixin:
+    """``_product`` crea productos en ``self.cat``; ``_post`` llama a la API JSON del carrito."""
+
+    def _product(self, name, price, stock):
+        return Product.objects.create(
+            name=name, description="", price=Decimal(price), stock=stock,
+            category=self.cat, image_url=f"https://example.com/{name}.jpg",
+        )
+
+    def _post(self, name, **data):
+        return self.client.post(reverse(f"cart:{name}"), data=json.dumps(data), content_type="application/json")
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart.models import Cart
+from cart.tests.helpers import CartTestMixin
+from catalog.models import Category
+
+
+@override_settings(CART_ANONYMOUS_STORAGE="db")
+class CartBatchTests(CartTestMixin, TestCase):
+	def setUp(self):
+		self.cat = Category.objects.create(name="Lotes")
+		self.a = self._product("Hueso", "3.00", 4)
+		self.b = self._product("Rascador", "10.00", 2)
+		self.none = self._product("Agotado", "1.00", 0)
+
+	def _batch(self, ops):
+		return self._post("batch", ops=ops)
+
+	def test_ops_are_applied_in_order(self):
+		r = self._batch([
+			{"op": "add", "product_id": self.a.id, "quantity": 1},
+			{"op": "add", "product_id": self.a.id, "quantity": 10},
+			{"op": "add", "product_id": self.b.id},
+			{"op": "update", "product_id": self.b.id, "quantity": 2},
+			{"op": "add", "product_id": self.none.id},
+			{"op": "update", "product_id": 999999, "quantity": 1},
+		])
+		self.assertEqual(r.status_code, 200)
+		data = r.json()
+		quantities = {it["product_id"]: it["quantity"] for it in data["items"]}
+		self.assertEqual(quantities, {self.a.id: 4, self.b.id: 2})
+		self.assertEqual(data["total"], "32.00")
+		self.assertEqual([e["index"] for e in data["errors"]], [4, 5])
+
+		r = self._batch([
+			{"op": "remove", "product_id": self.a.id},
+			{"op": "update", "product_id": self.a.id, "quantity": 1},
+			{"op": "update", "product_id": self.b.id, "quantity": 1},
+		])
+		data = r.json()
+		self.assertEqual([(it["product_id"], it["quantity"]) for it in data["items"]], [(self.b.id, 1)])
+		self.assertEqual(data["errors"], [{"index": 1, "error": "Item not in cart"}])
+		cart = Cart.objects.get()
+		self.assertEqual((cart.total, cart.item_count), (Decimal("10.00"), 1))
+
+	def test_query_count_does_not_grow_with_ops(self):
+		self._batch([{"op": "add", "product_id": self.a.id}])
+		with CaptureQueriesContext(connection) as few:
+			self._batch([{"op": "update", "product_id": self.a.id, "quantity": 2}])
+		with CaptureQueriesContext(connection) as many:
+			self._batch([{"op": "update", "product_id": self.a.id, "quantity": n} for n in (1, 3, 2, 4, 3)])
+		self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+	def test_invalid_payloads(self):
+		self.assertEqual(self._batch([]).status_code, 400)
+		self.assertEqual(self._batch([{"op": "explode", "product_id": self.a.id}]).status_code, 400)
+		self.assertEqual(self._batch([{"op": "add"}]).status_code, 400)
+		r = self.client.post(reverse("cart:batch"), data="nope", content_type="application/json")
+		self.assertEqual(r.status_code, 400)
+		with self.settings(CART_BATCH_MAX_OPS=2):
+			ops = [{"op": "add", "product_id": self.a.id}] * 3
+			self.assertEqual(self._batch(ops).status_code, 400)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cart import cleanup
+from cart.models import Cart, CartItem
+from catalog.models import Category, Product
+
+
+class CartCleanupTests(TestCase):
+	def setUp(self):
+		cat = Category.objects.create(name="Limpieza")
+		self.product = Product.objects.create(
+			name="Arena", description="", price=Decimal("2.00"), stock=50,
+			category=cat, image_url="https://example.com/arena.jpg",
+		)
+		self.user = get_user_model().objects.create_user(
+			email="limpio@example.com", password="x", first_name="L", last_name="L",
+			phone="0", address="C", city="C", postal_code="0",
+		)
+
+	def _cart(self, days, user=None, items=1):
+		cart = Cart.objects.create(session_key=None if user else f"s{Cart.objects.count()}", user=user)
+		for _ in range(items):
+			cart.add_product(self.product, 1)
+		Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=days))
+		return cart
+
+	def test_purge_removes_only_abandoned_carts_in_batches(self):
+		old = [self._cart(40) for _ in range(5)]
+		recent = self._cart(1)
+		kept_user_cart = self._cart(40, user=self.user)
+		empty_user_cart = self._cart(40, user=self.user, items=0)
+
+		with CaptureQueriesContext(connection) as ctx:
+			stats = cleanup.purge(max_age=timedelta(days=30), size=2, sessions=False)
+		self.assertEqual((stats["carts"], stats["cart_items"]), (6, 5))
+		self.assertGreaterEqual(stats["seconds"], 0)
+		# Varios lotes: cada SELECT de ids va limitado al tamaño del lote
+		selects = [q["sql"] for q in ctx.captured_queries if "LIMIT 2" in q["sql"]]
+		self.assertEqual(len(selects), 4)
+
+		remaining = set(Cart.objects.values_list("pk", flat=True))
+		self.assertEqual(remaining, {recent.pk, kept_user_cart.pk})
+		self.assertFalse(CartItem.objects.filter(cart_id__in=[c.pk for c in old + [empty_user_cart]]).exists())
+
+	def test_command_purges_expired_sessions_and_reports(self):
+		now = timezone.now()
+		for i in range(3):
+			Session.objects.create(session_key=f"old{i}", session_data="", expire_date=now - timedelta(days=1))
+		Session.objects.create(session_key="alive", session_data="", expire_date=now + timedelta(days=1))
+		self._cart(90)
+
+		out = StringIO()
+		call_command("purge_carts", "--batch-size", "2", stdout=out)
+		self.assertIn("Eliminados 1 carritos (1 líneas) y 3 sesiones caducadas", out.getvalue())
+		self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["alive"])
+
+	def test_periodic_job(self):
+		self.assertIsNone(cleanup.start_periodic_cleanup(0))
+		stop = threading.Event()
+		with patch("cart.cleanup.purge", side_effect=lambda: stop.set()) as purge:
+			cleanup._run_periodically(0.01, stop)
+		purge.assert_called_once()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import Cart
+from cart.tests.helpers import CartTestMixin
+from catalog.models import Category
+from orders.models import Order
+
+
+class AnonymousCartStorageTests(CartTestMixin, TestCase):
+	def setUp(self):
+		self.cat = Category.objects.create(name="Almacén")
+		self.a = self._product("Cepillo", "5.00", 3)
+		self.b = self._product("Champú", "8.00", 9)
+
+	def test_cookie_cart_writes_no_rows(self):
+		self._post("add", product_id=self.a.id, quantity=5)
+		data = self._post("add", product_id=self.b.id).json()
+		self.assertEqual((data["total"], data["item_count"]), ("23.00", 2))
+		self.assertIn("petfun_cart", self.client.cookies)
+		self.assertFalse(Cart.objects.exists())
+		self.assertNotIn("sessionid", self.client.cookies)
+
+		v = data["version"]
+		data = self._post("batch", ops=[{"op": "remove", "product_id": self.a.id}], since=v).json()
+		self.assertEqual((data["items"], data["removed"]), ([], [self.a.id]))
+		self.assertEqual(self.client.get(reverse("cart:state"), {"since": data["version"]}).status_code, 304)
+
+		res = self.client.get(reverse("orders:checkout_start"))
+		self.assertContains(res, "Champú")
+		self.assertFalse(Cart.objects.exists())
+
+	def test_tampered_cookie_is_ignored(self):
+		self._post("add", product_id=self.a.id)
+		self.client.cookies["petfun_cart"] = self.client.cookies["petfun_cart"].value.replace("5.00", "0.01")
+		data = self.client.get(reverse("cart:state")).json()
+		self.assertEqual(data["items"], [])
+
+	@override_settings(CART_ANONYMOUS_STORAGE="cache")
+	def test_cache_store_keeps_only_the_key_in_the_cookie(self):
+		self._post("add", product_id=self.b.id, quantity=2)
+		self.assertNotIn("8.00", self.client.cookies["petfun_cart"].value)
+		data = self.client.get(reverse("cart:state")).json()
+		self.assertEqual([(it["product_id"], it["quantity"]) for it in data["items"]], [(self.b.id, 2)])
+		self.assertFalse(Cart.objects.exists())
+
+	@override_settings(CART_COOKIE_MAX_BYTES=60)
+	def test_cart_too_big_for_the_cookie_goes_to_the_database(self):
+		self._post("add", product_id=self.a.id)
+		self._post("add", product_id=self.b.id)
+		cart = Cart.objects.get()
+		self.assertEqual((cart.total, cart.item_count, cart.user), (Decimal("13.00"), 2, None))
+		self.assertEqual(self.client.cookies["petfun_cart"].value, "")
+		data = self._post("update", product_id=self.b.id, quantity=3).json()
+		self.assertEqual(data["total"], "29.00")
+		self.assertEqual(Cart.objects.count(), 1)
+
+	@override_settings(STRIPE_SECRET_KEY="", STRIPE_PUBLISHABLE_KEY="")
+	def test_checkout_confirm_materializes_the_cart(self):
+		self._post("add", product_id=self.a.id, quantity=2)
+		session = self.client.session
+		session["checkout_email"] = "comprador@example.com"
+		session["checkout_ship"] = {"name": "Ana", "street": "Mayor", "number": "1", "city": "Sevilla",
+			"postal_code": "41001", "country": "ES"}
+		session["checkout_payment_method"] = Order.PaymentMethod.CARD
+		session.save()
+
+		res = self.client.get(reverse("orders:checkout_confirm"))
+		self.assertEqual(res.status_code, 200)
+		order = Order.objects.get()
+		self.assertEqual(order.total, Decimal("10.00"))
+		self.assertEqual(order.items.get().quantity, 2)
+		self.assertEqual(self.client.cookies["petfun_cart"].value, "")
+		self.assertEqual(Cart.objects.get().item_count, 0)
+
+	def test_login_merges_the_anonymous_cart(self):
+		user = get_user_model().objects.create_user(
+			email="cookie@example.com", password="demo12345", first_name="C", last_name="K",
+			phone="000", address="Calle", city="Ciudad", postal_code="00000",
+		)
+		self._post("add", product_id=self.a.id, quantity=2)
+		self._post("add", product_id=self.b.id)
+		res = self.client.post(reverse("login"), data={"email": user.email, "password": "demo12345"})
+		self.assertEqual(res.status_code, 302)
+		self.assertEqual(self.client.cookies["petfun_cart"].value, "")
+		cart = Cart.objects.get()
+		self.assertEqual(cart.user, user)
+		self.assertEqual(dict(cart.items.values_list("product_id", "quantity")), {self.a.id: 2, self.b.id: 1})
+		self.assertEqual((cart.total, cart.item_count), (Decimal("18.00"), 2))
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from cart.models import Cart, CartItem
+from cart.tests.helpers import CartTestMixin
+from catalog.models import Category
+
+
+class CartDenormalizedTotalsTests(CartTestMixin, TestCase):
+	def setUp(self):
+		self.cat = Category.objects.create(name="Totales")
+		self.a = self._product("Pelota", "2.50", 10)
+		self.b = self._product("Cuerda", "4.00", 10)
+
+	def _assert_in_sync(self, cart):
+		cart.refresh_from_db()
+		items = list(cart.items.all())
+		self.assertEqual(cart.total, sum((it.subtotal for it in items), Decimal("0")))
+		self.assertEqual(cart.item_count, len(items))
+
+	def test_model_mutations_keep_totals_in_sync(self):
+		cart = Cart.objects.create(session_key="totals")
+		cart.add_product(self.a, 2)
+		cart.add_product(self.b, 1)
+		self.assertEqual((cart.total, cart.item_count), (Decimal("9.00"), 2))
+		self._assert_in_sync(cart)
+
+		item = cart.items.get(product=self.a)
+		cart.set_quantity(item, 4)
+		self._assert_in_sync(cart)
+		self.assertEqual(cart.total, Decimal("14.00"))
+
+		cart.remove_product(self.b.id)
+		self._assert_in_sync(cart)
+		CartItem.objects.create(cart=cart, product=self.b, quantity=1, unit_price=self.b.price, subtotal=0)
+		self._assert_in_sync(cart)
+		cart.items.get(product=self.b).delete()
+		self._assert_in_sync(cart)
+		cart.clear()
+		self._assert_in_sync(cart)
+		self.assertEqual(cart.item_count, 0)
+
+	def test_recalc_total_is_one_update(self):
+		cart = Cart.objects.create(session_key="recalc")
+		cart.add_product(self.a, 1)
+		Cart.objects.filter(pk=cart.pk).update(total=Decimal("999"), item_count=7)
+		with CaptureQueriesContext(connection) as ctx:
+			cart.recalc_total()
+		updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+		self.assertEqual(len(updates), 1)
+		self.assertEqual((cart.total, cart.item_count), (Decimal("2.50"), 1))
+
+	@override_settings(CART_ANONYMOUS_STORAGE="db")
+	def test_add_cost_does_not_grow_with_cart_size(self):
+		self._post("add", product_id=self.a.id, quantity=1)
+		with CaptureQueriesContext(connection) as small:
+			self._post("add", product_id=self.b.id, quantity=1)
+		for i in range(5):
+			p = self._product(f"Extra {i}", "1.00", 5)
+			self._post("add", product_id=p.id, quantity=1)
+		extra = self._product("Última", "1.00", 5)
+		with CaptureQueriesContext(connection) as large:
+			r = self._post("add", product_id=extra.id, quantity=1)
+		self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+		self.assertEqual(r.json()["total"], "12.50")
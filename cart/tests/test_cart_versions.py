@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import Cart
+from cart.tests.helpers import CartTestMixin
+from catalog.models import Category
+
+
+@override_settings(CART_ANONYMOUS_STORAGE="db")
+class CartVersionTests(CartTestMixin, TestCase):
+	def setUp(self):
+		self.cat = Category.objects.create(name="Versiones")
+		self.a = self._product("Collar", "4.00", 5)
+		self.b = self._product("Comedero", "6.00", 5)
+
+	def test_every_change_bumps_the_version(self):
+		v1 = self._post("add", product_id=self.a.id).json()["version"]
+		v2 = self._post("update", product_id=self.a.id, quantity=3).json()["version"]
+		v3 = self._post("remove", product_id=self.a.id).json()["version"]
+		self.assertLess(0, v1)
+		self.assertLess(v1, v2)
+		self.assertLess(v2, v3)
+		self.assertEqual(Cart.objects.get().version, v3)
+
+	def test_delta_has_changed_and_removed_lines_only(self):
+		v = self._post("add", product_id=self.a.id).json()["version"]
+		self._post("add", product_id=self.b.id)
+		data = self._post("update", product_id=self.b.id, quantity=2, since=v).json()
+		self.assertFalse(data["full"])
+		self.assertEqual([(it["product_id"], it["quantity"]) for it in data["items"]], [(self.b.id, 2)])
+		self.assertEqual(data["removed"], [])
+		self.assertEqual((data["total"], data["item_count"]), ("16.00", 2))
+
+		v = data["version"]
+		data = self._post("batch", ops=[{"op": "remove", "product_id": self.a.id}], since=v).json()
+		self.assertEqual((data["items"], data["removed"]), ([], [self.a.id]))
+
+		# Vuelve a añadirse: aparece en items aunque siga la marca de borrado
+		data = self._post("add", product_id=self.a.id, since=v).json()
+		self.assertEqual(data["removed"], [self.a.id])
+		self.assertEqual([it["product_id"] for it in data["items"]], [self.a.id])
+
+	def test_state_endpoint(self):
+		url = reverse("cart:state")
+		data = self.client.get(url, {"since": 0}).json()
+		self.assertEqual((data["version"], data["items"]), (0, []))
+
+		v = self._post("add", product_id=self.a.id).json()["version"]
+		self.assertEqual(self.client.get(url, {"since": v}).status_code, 304)
+		data = self.client.get(url, {"since": v - 1}).json()
+		self.assertFalse(data["full"])
+		self.assertEqual(len(data["items"]), 1)
+		# Versión desconocida o de otro carrito: respuesta completa
+		for since in ("", "x", v + 10):
+			data = self.client.get(url, {"since": since}).json()
+			self.assertTrue(data["full"])
+			self.assertEqual(len(data["items"]), 1)
+
+	def test_clear_leaves_tombstones(self):
+		v = self._post("batch", ops=[
+			{"op": "add", "product_id": self.a.id}, {"op": "add", "product_id": self.b.id},
+		]).json()["version"]
+		cart = Cart.objects.get()
+		cart.clear()
+		self.assertEqual(cart.version, Cart.objects.get().version)
+		data = self.client.get(reverse("cart:state"), {"since": v}).json()
+		self.assertEqual(sorted(data["removed"]), sorted([self.a.id, self.b.id]))
+		self.assertEqual((data["items"], data["item_count"]), ([], 0))
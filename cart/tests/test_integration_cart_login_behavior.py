@@ -3,7 +3,7 @@ from __future__ import annotations
 import json
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
@@ -12,6 +12,7 @@ from cart.models import Cart
 from cart.utils import get_or_create_cart
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 class CartLoginBehaviorIntegrationTest(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -39,7 +40,15 @@ class CartLoginBehaviorIntegrationTest(TestCase):
             sku="AN-LOGIN-1",
         )
 
-    def test_anonymous_cart_is_not_merged_on_login_new_user_cart_created(self):
+    def test_anonymous_cart_is_merged_on_login(self):
+        other = Product.objects.create(
+            name="Cuerda", short_description="", description="", price=Decimal("2.00"), stock=10,
+            category=self.product.category, image_url="https://example.com/cuerda.png", sku="AN-LOGIN-2",
+        )
+        user_cart = Cart.objects.create(user=self.user)
+        user_cart.add_product(self.product, 9)
+        user_cart.add_product(other, 1)
+
         add_url = reverse("cart:add")
         payload = {"product_id": self.product.id, "quantity": 2}
         resp = self.client.post(add_url, data=json.dumps(payload), content_type="application/json")
@@ -55,10 +64,12 @@ class CartLoginBehaviorIntegrationTest(TestCase):
 
         _ = self.client.get("/")
         req2 = self.client.request().wsgi_request
-        user_cart = get_or_create_cart(req2)
-        self.assertIsNotNone(user_cart.user)
-        self.assertEqual(user_cart.user.email, self.user.email)
-        self.assertFalse(user_cart.items.exists())
+        merged = get_or_create_cart(req2)
+        self.assertEqual(merged.pk, user_cart.pk)
+        self.assertEqual(merged.user.email, self.user.email)
+        # 9 + 2 se recorta al stock (10); la otra línea se mantiene
+        quantities = dict(merged.items.values_list("product_id", "quantity"))
+        self.assertEqual(quantities, {self.product.id: 10, other.id: 1})
+        self.assertEqual((merged.total, merged.item_count), (Decimal("37.00"), 2))
 
-        self.assertTrue(Cart.objects.filter(pk=anon_cart.pk, user__isnull=True).exists())
-        self.assertTrue(anon_cart.items.exists())
+        self.assertFalse(Cart.objects.filter(pk=anon_cart.pk).exists())
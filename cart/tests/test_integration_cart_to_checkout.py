@@ -1,17 +1,16 @@
 import json
-from types import SimpleNamespace
 from decimal import Decimal
-from unittest.mock import patch
 
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
 from catalog.models import Category, Product
+from orders import payments
 from orders.models import Order
 
 
-@override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+@override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
 class CartApiToCheckoutIntegrationTest(TestCase):
     def setUp(self):
         User = get_user_model()
@@ -46,32 +45,33 @@ class CartApiToCheckoutIntegrationTest(TestCase):
         data = resp.json()
         self.assertIn("total", data)
         self.assertEqual(len(data["items"]), 1)
-        with patch("orders.views.stripe") as mock_stripe:
-            mock_stripe.PaymentIntent.create.return_value = SimpleNamespace(id="pi_e2e_1", client_secret="cs_e2e_1")
-            payment_post = self.client.post(
-                reverse("orders:checkout_payment"),
-                data={
-                    "email": "buyer@e2e.com",
-                    "ship_name": "Buyer E2E",
-                    "ship_street": "Calle X",
-                    "ship_number": "1",
-                    "ship_floor": "",
-                    "ship_city": "Ciudad",
-                    "ship_postal_code": "00000",
-                    "ship_country": "ES",
-                },
-            )
-            self.assertEqual(payment_post.status_code, 200)
-            session = self.client.session
-            self.assertEqual(session.get("payment_intent_id"), "pi_e2e_1")
+        gateway = payments.get_gateway()
+        gateway.reset()
+        payment_post = self.client.post(
+            reverse("orders:checkout_payment"),
+            data={
+                "email": "buyer@e2e.com",
+                "ship_name": "Buyer E2E",
+                "ship_street": "Calle X",
+                "ship_number": "1",
+                "ship_floor": "",
+                "ship_city": "Ciudad",
+                "ship_postal_code": "00000",
+                "ship_country": "ES",
+            },
+        )
+        self.assertEqual(payment_post.status_code, 200)
+        session = self.client.session
+        pi_id = session.get("payment_intent_id")
+        self.assertEqual(payment_post.context["stripe_client_secret"], gateway.intents[pi_id]["client_secret"])
 
-            expected_amount = int(Decimal("12.00") * 100) * 2
-            mock_stripe.PaymentIntent.retrieve.return_value = {"id": "pi_e2e_1", "amount": expected_amount, "status": "requires_capture"}
+        expected_amount = int(Decimal("12.00") * 100) * 2
+        self.assertEqual(gateway.intents[pi_id]["amount"], expected_amount)
 
-            confirm_resp = self.client.get(reverse("orders:checkout_confirm"))
-            self.assertEqual(confirm_resp.status_code, 200)
+        confirm_resp = self.client.get(reverse("orders:checkout_confirm"))
+        self.assertEqual(confirm_resp.status_code, 200)
 
-            mock_stripe.PaymentIntent.capture.assert_called_with("pi_e2e_1")
+        self.assertIn(("capture", pi_id), gateway.calls)
 
         orders = Order.objects.filter(contact_email="buyer@e2e.com")
         self.assertEqual(orders.count(), 1)
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.sessions.models import Session
+from django.db import connection
 
 from cart.context_processors import cart as cart_ctx
-from cart.utils import get_or_create_cart
+from cart.models import Cart
+from cart.utils import get_cart, get_or_create_cart
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 class CartUtilsAndContextTests(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -50,3 +56,38 @@ class CartUtilsAndContextTests(TestCase):
         self.assertIn("cart", ctx)
         self.assertIn("cart_item_count", ctx)
         self.assertEqual(ctx["cart_item_count"], 0)
+
+
+class LazyCartTests(TestCase):
+    def _writes(self, ctx):
+        return [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"].lstrip().split(" ", 1)[0].upper() in ("INSERT", "UPDATE", "DELETE")
+        ]
+
+    def test_anonymous_page_views_do_not_write(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get("/").status_code, 200)
+            self.assertEqual(self.client.get("/catalog/").status_code, 200)
+        self.assertEqual(self._writes(ctx), [])
+        self.assertEqual(Session.objects.count(), 0)
+        self.assertEqual(Cart.objects.count(), 0)
+
+    def test_context_processor_is_lazy(self):
+        req = RequestFactory().get("/")
+        SessionMiddleware(lambda r: None).process_request(req)
+        req.user = AnonymousUser()
+        with CaptureQueriesContext(connection) as ctx:
+            data = cart_ctx(req)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertFalse(data["cart"])
+
+    def test_cart_is_memoized_per_request(self):
+        req = RequestFactory().get("/")
+        SessionMiddleware(lambda r: None).process_request(req)
+        req.user = AnonymousUser()
+        self.assertIsNone(get_cart(req))
+        cart = get_or_create_cart(req)
+        with self.assertNumQueries(0):
+            self.assertIs(get_or_create_cart(req), cart)
+            self.assertIs(get_cart(req), cart)
@@ -7,4 +7,6 @@ urlpatterns = [
     path('add/', views.add, name='add'),
     path('update/', views.update, name='update'),
     path('remove/', views.remove, name='remove'),
+    path('batch/', views.batch, name='batch'),
+    path('state/', views.state, name='state'),
 ]
@@ -1,14 +1,65 @@
 from __future__ import annotations
 
-from django.utils.crypto import get_random_string
+from django.db import transaction
 
-from .models import Cart
+from .models import Cart, CartItem
+from .storage import AnonymousCart, get_store
 
+# Atributo de la request donde se memoiza el carrito ya resuelto
+_REQUEST_ATTR = '_cart_cache'
+# Marca para que AnonymousCartMiddleware borre la cookie del carrito anónimo
+_DISCARD_ATTR = '_cart_discard'
+# Clave de sesión con el id del carrito anónimo en BD (sobrevive al cycle_key del login)
+_SESSION_CART_ID = 'cart_id'
+_MISSING = object()
 
-def get_or_create_cart(request) -> Cart:
+
+def get_cart(request) -> Cart | AnonymousCart | None:
+    """Return the cart of the logged user or session without creating anything.
+
+    Read-only: no session, no Cart row. Anonymous visitors get their
+    ``AnonymousCart`` when a cart store is configured (see ``cart.storage``);
+    a DB cart of the session is still used when there is no stored one. The
+    result (including "no cart") is memoized on the request, so every caller
+    in the same request shares one lookup.
+    """
+    cached = getattr(request, _REQUEST_ATTR, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    cart = None
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).order_by('-id').first()
+    else:
+        store = get_store()
+        if store is not None:
+            cart = store.load(request)
+        session_key = request.session.session_key
+        if cart is None and session_key:
+            cart = Cart.objects.filter(session_key=session_key).first()
+    setattr(request, _REQUEST_ATTR, cart)
+    return cart
+
+
+def get_or_create_cart(request) -> Cart | AnonymousCart:
     """Return a cart associated to the logged user or session.
     Creates the session key if missing.
+
+    Only call this when the request is about to write to the cart; pages that
+    just show it should use ``get_cart``. With a cart store, anonymous
+    visitors get a new ``AnonymousCart`` instead (no session, no rows).
     """
+    cached = getattr(request, _REQUEST_ATTR, None)
+    if cached is not None:
+        return cached
+
+    if not request.user.is_authenticated and get_store() is not None:
+        cart = get_cart(request)
+        if cart is None:
+            cart = AnonymousCart()
+            setattr(request, _REQUEST_ATTR, cart)
+        return cart
+
     if not request.session.session_key:
         # ensure session exists
         request.session.create()
@@ -26,5 +77,80 @@ def get_or_create_cart(request) -> Cart:
                 cart.save(update_fields=["session_key"])
     else:
         cart, _ = Cart.objects.get_or_create(session_key=session_key, defaults={})
+        if request.session.get(_SESSION_CART_ID) != cart.pk:
+            request.session[_SESSION_CART_ID] = cart.pk
+
+    setattr(request, _REQUEST_ATTR, cart)
+    return cart
+
 
+def materialize_cart(request) -> Cart | None:
+    """Return the cart as DB rows, persisting an ``AnonymousCart`` if needed.
+
+    Used where an order is about to be created. The stored copy is dropped
+    from the cookie/cache in the response.
+    """
+    cart = get_cart(request)
+    if not isinstance(cart, AnonymousCart):
+        return cart
+    if not request.session.session_key:
+        request.session.create()
+    cart = cart.persist(request.session.session_key)
+    request.session[_SESSION_CART_ID] = cart.pk
+    setattr(request, _REQUEST_ATTR, cart)
+    setattr(request, _DISCARD_ATTR, True)
     return cart
+
+
+def merge_on_login(request, user) -> Cart | None:
+    """Move the anonymous cart of this request into the cart of `user`.
+
+    Sources are the stored ``AnonymousCart`` (cookie/cache) and the DB cart
+    of the anonymous session. Their quantities are added to the user's cart
+    with one upsert (``Cart.merge_quantities``) and the anonymous carts are
+    deleted. Returns the user's cart, or None if there was nothing to merge.
+    """
+    memo = getattr(request, _REQUEST_ATTR, None)
+    if hasattr(request, _REQUEST_ATTR):
+        # Lo memoizado era el carrito anónimo
+        delattr(request, _REQUEST_ATTR)
+
+    quantities = {}
+    store = get_store()
+    stored = store.load(request) if store is not None else None
+    if stored is not None:
+        quantities.update(stored.quantities())
+        setattr(request, _DISCARD_ATTR, True)
+
+    anon_ids = {request.session.pop(_SESSION_CART_ID, None)}
+    if isinstance(memo, Cart) and memo.user_id is None:
+        anon_ids.add(memo.pk)
+    anon_ids.discard(None)
+    anonymous = Cart.objects.filter(pk__in=anon_ids, user__isnull=True)
+    if anon_ids:
+        for pid, quantity in CartItem.objects.filter(cart__in=anonymous).values_list('product_id', 'quantity'):
+            quantities[pid] = quantities.get(pid, 0) + quantity
+
+    if not quantities:
+        if anon_ids:
+            anonymous.delete()
+        return None
+    with transaction.atomic():
+        cart = Cart.objects.filter(user=user).order_by('-id').first()
+        if cart is None:
+            cart = Cart.objects.create(user=user)
+        cart.merge_quantities(quantities)
+        if anon_ids:
+            anonymous.delete()
+    return cart
+
+
+def _merge_on_login(sender, request, user, **kwargs):
+    if request is not None:
+        merge_on_login(request, user)
+
+
+def connect_signals() -> None:
+    from django.contrib.auth.signals import user_logged_in
+
+    user_logged_in.connect(_merge_on_login, dispatch_uid="cart_merge_on_login")
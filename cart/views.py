@@ -1,33 +1,72 @@
 from __future__ import annotations
 
 import json
-from decimal import Decimal
 
-from django.http import JsonResponse, HttpResponseBadRequest
-from django.views.decorators.http import require_POST
+from django.conf import settings
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotModified
+from django.views.decorators.http import require_GET, require_POST
 
 from catalog.models import Product
-from .models import CartItem
-from .utils import get_or_create_cart
+from catalog.templatetags.catalog_extras import product_image_src
+from orders import reservations
+from .utils import get_cart, get_or_create_cart
 
 
-def _cart_payload(cart):
+def _read_since(value):
+    """Client version from ``since``; None (full payload) when missing or invalid."""
+    try:
+        since = int(value)
+    except (TypeError, ValueError):
+        return None
+    return since if since >= 0 else None
+
+
+def _cart_payload(cart, since=None):
+    """Cart state for the side cart.
+
+    With ``since`` (a version the client already has) only the lines changed
+    after it are sent in ``items``, plus the product ids deleted after it in
+    ``removed``; the client applies ``removed`` first and then ``items``.
+    A ``since`` newer than the cart (another cart, or a reset) gets the full
+    payload, flagged with ``full``.
+    """
+    changes = cart.changes_since(since)
+    full = changes is None
+    lines, removed = (cart.lines(), []) if full else changes
     items = []
-    for it in cart.items.select_related('product').all():
+    for it in lines:
         items.append({
             'product_id': it.product_id,
             'name': it.product.name,
             'quantity': it.quantity,
             'unit_price': f"{it.unit_price:.2f}",
             'subtotal': f"{it.subtotal:.2f}",
-            'image_url': it.product.image.url, # <-- nueva línea
+            'image_url': product_image_src(it.product, '80x80'),
         })
     return {
+        'version': cart.version,
+        'full': full,
         'total': f"{cart.total:.2f}",
+        'item_count': cart.item_count,
         'items': items,
+        'removed': removed,
     }
 
 
+@require_GET
+def state(request):
+    """Cart state since ``?since=<version>``; 304 when nothing changed."""
+    since = _read_since(request.GET.get('since'))
+    cart = get_cart(request)
+    if cart is None:
+        return JsonResponse({
+            'version': 0, 'full': True, 'total': '0.00', 'item_count': 0, 'items': [], 'removed': [],
+        })
+    if since == cart.version:
+        return HttpResponseNotModified()
+    return JsonResponse(_cart_payload(cart, since))
+
+
 @require_POST
 def add(request):
     cart = get_or_create_cart(request)
@@ -38,6 +77,8 @@ def add(request):
     except Exception:
         return HttpResponseBadRequest('Invalid payload')
 
+    # Las reservas caducadas de este producto vuelven al stock antes de mirarlo
+    reservations.release_expired(product_ids=[product_id])
     product = Product.objects.filter(id=product_id).first()
     if not product:
         return HttpResponseBadRequest('Invalid product')
@@ -47,20 +88,8 @@ def add(request):
     if product.stock <= 0:
         return HttpResponseBadRequest('Out of stock')
 
-    item, created = CartItem.objects.get_or_create(
-        cart=cart, product=product,
-        defaults={'quantity': quantity, 'unit_price': product.price, 'subtotal': Decimal('0')}
-    )
-    if not created:
-        # Clamp total quantity to available stock
-        new_q = item.quantity + quantity
-        if new_q > product.stock:
-            new_q = product.stock
-        item.quantity = new_q
-    item.unit_price = product.price
-    item.save()
-    cart.recalc_total()
-    return JsonResponse(_cart_payload(cart))
+    cart.add_product(product, quantity)
+    return JsonResponse(_cart_payload(cart, _read_since(data.get('since'))))
 
 
 @require_POST
@@ -76,7 +105,8 @@ def update(request):
     if quantity < 1:
         quantity = 1
 
-    item = cart.items.filter(product_id=product_id).select_related('product').first()
+    reservations.release_expired(product_ids=[product_id])
+    item = cart.get_line(product_id)
     if not item:
         return HttpResponseBadRequest('Item not in cart')
 
@@ -84,11 +114,8 @@ def update(request):
     max_q = item.product.stock
     if quantity > max_q:
         quantity = max_q
-    item.quantity = quantity
-    item.unit_price = item.product.price
-    item.save()
-    cart.recalc_total()
-    return JsonResponse(_cart_payload(cart))
+    cart.set_quantity(item, quantity)
+    return JsonResponse(_cart_payload(cart, _read_since(data.get('since'))))
 
 
 @require_POST
@@ -99,9 +126,37 @@ def remove(request):
         product_id = int(data.get('product_id'))
     except Exception:
         return HttpResponseBadRequest('Invalid payload')
-    cart.items.filter(product_id=product_id).delete()
-    cart.recalc_total()
-    return JsonResponse(_cart_payload(cart))
+    cart.remove_product(product_id)
+    return JsonResponse(_cart_payload(cart, _read_since(data.get('since'))))
+
+
+@require_POST
+def batch(request):
+    """Apply an ordered list of cart operations in one transaction.
+
+    Payload: ``{"ops": [{"op": "add"|"update"|"remove", "product_id": 1,
+    "quantity": 2}, ...], "since": 7}``. Returns the cart payload (a delta
+    when ``since`` is given) plus ``errors`` for the operations that were
+    skipped (unknown product, out of stock...).
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        ops = []
+        for raw in data['ops']:
+            op = raw['op']
+            if op not in ('add', 'update', 'remove'):
+                raise ValueError(op)
+            quantity = int(raw.get('quantity') or 1) if op != 'remove' else 0
+            ops.append((op, int(raw['product_id']), quantity))
+    except Exception:
+        return HttpResponseBadRequest('Invalid payload')
+    if not ops or len(ops) > getattr(settings, 'CART_BATCH_MAX_OPS', 50):
+        return HttpResponseBadRequest('Invalid payload')
+
+    cart = get_or_create_cart(request)
+    reservations.release_expired(product_ids={pid for op, pid, _q in ops if op != 'remove'})
+    errors = cart.apply_batch(ops)
+    return JsonResponse({**_cart_payload(cart, _read_since(data.get('since'))), 'errors': errors})
 from django.shortcuts import render
 
 # Create your views here.
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .facets import get_index
 from .models import Category, Manufacturer, Product
 
 
@@ -28,9 +29,14 @@ class ProductAdmin(admin.ModelAdmin):
 
 	@admin.action(description="Marcar como agotado")
 	def mark_out_of_stock(self, request, queryset):
+		ids = list(queryset.values_list("id", flat=True))
 		queryset.update(status="agotado")
+		# update() no emite señales: refrescamos el índice de facetas a mano
+		get_index().refresh_products(ids)
 
 	@admin.action(description="Marcar como disponible")
 	def mark_available(self, request, queryset):
+		ids = list(queryset.values_list("id", flat=True))
 		queryset.update(status="disponible")
+		get_index().refresh_products(ids)
 
@@ -123,5 +123,10 @@ class CatalogConfig(AppConfig):
     name = "catalog"
 
     def ready(self) -> None:
+        from . import facets, images, search
+
         post_migrate.connect(_seed_catalog_if_empty, sender=self)
+        search.connect_signals()
+        facets.connect_signals()
+        images.get_manifest().build()
         return super().ready()
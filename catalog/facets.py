@@ -0,0 +1,244 @@
+"""Índice de facetas en memoria para el catálogo (uno por proceso).
+
+Cada valor de faceta (categoría, fabricante, estado y tramo de precio) se
+asocia a un bitset —un ``int`` de Python con un bit por id de producto—, de
+modo que filtrar es un AND de enteros y contar resultados es un ``bit_count``.
+Cada categoría guarda además sus claves ``(name, id)`` ya ordenadas, para que
+una página keyset sea un ``bisect`` más un recorrido del tamaño de la página.
+El índice se construye con una sola consulta, se actualiza de forma
+incremental con las señales de ``Product`` y se reconstruye entero cuando
+supera ``CATALOG_FACET_INDEX_TTL`` segundos (cambios hechos por otros
+procesos o con ``QuerySet.update``).
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+# (clave, etiqueta, mínimo incluido, máximo excluido)
+PRICE_BUCKETS = (
+    ("0-5", "Menos de 5 €", Decimal("0"), Decimal("5")),
+    ("5-10", "De 5 a 10 €", Decimal("5"), Decimal("10")),
+    ("10-20", "De 10 a 20 €", Decimal("10"), Decimal("20")),
+    ("20+", "Más de 20 €", Decimal("20"), None),
+)
+
+
+def price_bucket(price) -> str:
+    for key, _label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return key
+    return PRICE_BUCKETS[0][0]
+
+
+def bitset(ids) -> int:
+    bits = 0
+    for pk in ids:
+        bits |= 1 << pk
+    return bits
+
+
+def iter_ids(bits: int):
+    """Ids whose bit is set, ascending."""
+    digits = bin(bits)[:1:-1]
+    pos = digits.find("1")
+    while pos != -1:
+        yield pos
+        pos = digits.find("1", pos + 1)
+
+
+class _FacetData:
+    """One complete generation of the index; ``rebuild`` swaps it in whole."""
+
+    def __init__(self):
+        self.all = 0
+        self.by_category: dict[int, int] = {}
+        self.by_manufacturer: dict[int | None, int] = {}
+        self.by_status: dict[str, int] = {}
+        self.by_price: dict[str, int] = {}
+        # category_id -> [(name, id), ...] en orden
+        self.sorted_by_category: dict[int, list[tuple[str, int]]] = {}
+        # id -> (category_id, manufacturer_id, status, price bucket, name)
+        self.docs: dict[int, tuple] = {}
+
+    def add(self, pk: int, doc: tuple) -> None:
+        bit = 1 << pk
+        category_id, manufacturer_id, status, bucket, name = doc
+        self.all |= bit
+        self.by_category[category_id] = self.by_category.get(category_id, 0) | bit
+        self.by_manufacturer[manufacturer_id] = self.by_manufacturer.get(manufacturer_id, 0) | bit
+        self.by_status[status] = self.by_status.get(status, 0) | bit
+        self.by_price[bucket] = self.by_price.get(bucket, 0) | bit
+        bisect.insort(self.sorted_by_category.setdefault(category_id, []), (name, pk))
+        self.docs[pk] = doc
+
+    def remove(self, pk: int) -> None:
+        doc = self.docs.pop(pk, None)
+        if doc is None:
+            return
+        mask = ~(1 << pk)
+        category_id, manufacturer_id, status, bucket, name = doc
+        keys = self.sorted_by_category[category_id]
+        del keys[bisect.bisect_left(keys, (name, pk))]
+        self.all &= mask
+        self.by_category[category_id] &= mask
+        self.by_manufacturer[manufacturer_id] &= mask
+        self.by_status[status] &= mask
+        self.by_price[bucket] &= mask
+
+
+class FacetIndex:
+    """Facet bitsets plus presorted section keys.
+
+    ``rebuild`` llena un ``_FacetData`` nuevo fuera del lock y lo publica con
+    una sola asignación: una petición servida a mitad de reconstrucción ve
+    el índice anterior completo, nunca uno vacío o a medias.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._data = _FacetData()
+
+    all = property(lambda self: self._data.all)
+    by_category = property(lambda self: self._data.by_category)
+    by_manufacturer = property(lambda self: self._data.by_manufacturer)
+    by_status = property(lambda self: self._data.by_status)
+    by_price = property(lambda self: self._data.by_price)
+    sorted_by_category = property(lambda self: self._data.sorted_by_category)
+    docs = property(lambda self: self._data.docs)
+
+    def is_stale(self) -> bool:
+        ttl = float(getattr(settings, "CATALOG_FACET_INDEX_TTL", 60))
+        return self._built_at is None or time.monotonic() - self._built_at > ttl
+
+    def ensure_fresh(self) -> "FacetIndex":
+        if self.is_stale():
+            self.rebuild()
+        return self
+
+    def invalidate(self) -> None:
+        self._built_at = None
+
+    def rebuild(self) -> None:
+        from .models import Product
+
+        # Ya ordenadas: cada insort en sorted_by_category cae al final
+        rows = Product.objects.values_list(
+            "id", "category_id", "manufacturer_id", "status", "price", "name"
+        ).order_by("name", "id")
+        data = _FacetData()
+        for pk, category_id, manufacturer_id, status, price, name in rows.iterator(chunk_size=2000):
+            data.add(pk, (category_id, manufacturer_id, status, price_bucket(price), name))
+        with self._lock:
+            self._data = data
+            self._built_at = time.monotonic()
+
+    def update_product(self, product) -> None:
+        """Incremental update from a saved instance (no query)."""
+        if self._built_at is None:
+            return
+        doc = (product.category_id, product.manufacturer_id, product.status, price_bucket(product.price), product.name)
+        with self._lock:
+            self._data.remove(product.pk)
+            self._data.add(product.pk, doc)
+
+    def remove_product(self, pk: int) -> None:
+        with self._lock:
+            self._data.remove(pk)
+
+    def refresh_products(self, ids) -> None:
+        """Re-read a few products after bulk UPDATEs that skip signals."""
+        from .models import Product
+
+        if self._built_at is None:
+            return
+        ids = list(ids)
+        found = set()
+        for product in Product.objects.filter(pk__in=ids).only(
+            "id", "category_id", "manufacturer_id", "status", "price", "name"
+        ):
+            found.add(product.pk)
+            self.update_product(product)
+        for pk in set(ids) - found:
+            self.remove_product(pk)
+
+    # Consultas -----------------------------------------------------------
+
+    def categories(self, category_ids) -> int:
+        by_category = self._data.by_category
+        bits = 0
+        for category_id in category_ids:
+            bits |= by_category.get(category_id, 0)
+        return bits
+
+    @staticmethod
+    def counts(bits: int, facet: dict) -> dict:
+        # list(): los escritores pueden añadir claves mientras otro hilo cuenta
+        return {value: count for value, members in list(facet.items()) if (count := (members & bits).bit_count())}
+
+    def sort_key(self, pk: int):
+        doc = self._data.docs.get(pk)
+        return (doc[4] if doc else "", pk)
+
+    def page_after(self, category_id: int, bits: int, after, size: int) -> list[int]:
+        """Up to `size` ids of `category_id` in `bits`, in (name, id) order after key `after`.
+
+        El coste depende de la página (y de cuántos ids de la sección descarten
+        los filtros), no del tamaño de la sección.
+        """
+        page = []
+        with self._lock:
+            keys = self._data.sorted_by_category.get(category_id, [])
+            for i in range(bisect.bisect_right(keys, after) if after else 0, len(keys)):
+                pk = keys[i][1]
+                if bits >> pk & 1:
+                    page.append(pk)
+                    if len(page) == size:
+                        break
+        return page
+
+    def sections(self, bits: int) -> dict[int, list[int]]:
+        """Ids grouped by category, unsorted."""
+        docs = self._data.docs
+        grouped: dict[int, list[int]] = {}
+        for pk in iter_ids(bits):
+            doc = docs.get(pk)
+            if doc is not None:
+                grouped.setdefault(doc[0], []).append(pk)
+        return grouped
+
+
+_index = FacetIndex()
+
+
+def get_index() -> FacetIndex:
+    return _index.ensure_fresh()
+
+
+def invalidate_index() -> None:
+    """Force a full rebuild on the next ``get_index()``."""
+    _index.invalidate()
+
+
+def _on_product_saved(sender, instance, **kwargs):
+    # Tras el COMMIT: una escritura que se deshace no debe quedar en el índice
+    transaction.on_commit(lambda: _index.update_product(instance), using=kwargs.get("using"))
+
+
+def _on_product_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: _index.remove_product(pk), using=kwargs.get("using"))
+
+
+def connect_signals() -> None:
+    from .models import Product
+
+    post_save.connect(_on_product_saved, sender=Product, dispatch_uid="catalog_facets_product_saved")
+    post_delete.connect(_on_product_deleted, sender=Product, dispatch_uid="catalog_facets_product_deleted")
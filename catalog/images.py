@@ -0,0 +1,87 @@
+"""Manifest en memoria de las imágenes de producto de ``Images/``.
+
+Las imágenes se nombran por SKU (``DOG-MOR-001.jpg``). En lugar de probar
+cada extensión con ``os.path.exists`` en cada render, se recorre el
+directorio una vez y se guarda ``sku -> nombre de fichero``; la búsqueda es
+un acceso a diccionario. El manifest se rehace cuando cambia el mtime del
+directorio (alta, baja o renombrado de ficheros), comprobándolo como mucho
+una vez cada ``CATALOG_IMAGE_MANIFEST_CHECK`` segundos, o con el comando
+``refresh_image_manifest``.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Orden de preferencia cuando hay varias imágenes para el mismo SKU
+EXTENSIONS = (".webp", ".jpg", ".jpeg", ".png")
+
+
+def images_dir() -> str:
+    return str(getattr(settings, "CATALOG_IMAGES_DIR", os.path.join(settings.BASE_DIR, "Images")))
+
+
+class ImageManifest:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[str, str] = {}
+        self._dir = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def build(self) -> int:
+        """Scan the directory and replace the manifest; returns the entry count."""
+        directory = images_dir()
+        entries: dict[str, str] = {}
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                names = [entry.name for entry in it if entry.is_file()]
+        except OSError:
+            mtime, names = None, []
+        rank = {ext: pos for pos, ext in enumerate(EXTENSIONS)}
+        for name in names:
+            sku, ext = os.path.splitext(name)
+            if ext not in rank:
+                continue
+            current = entries.get(sku)
+            if current is None or rank[ext] < rank[os.path.splitext(current)[1]]:
+                entries[sku] = name
+        with self._lock:
+            self._entries = entries
+            self._dir = directory
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        return len(entries)
+
+    def _refresh_if_changed(self) -> None:
+        interval = float(getattr(settings, "CATALOG_IMAGE_MANIFEST_CHECK", 2))
+        directory = images_dir()
+        if directory == self._dir and time.monotonic() - self._checked_at < interval:
+            return
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        if directory != self._dir or mtime != self._mtime:
+            self.build()
+        else:
+            self._checked_at = time.monotonic()
+
+    def lookup(self, sku: str) -> str | None:
+        """File name in ``Images/`` for `sku`, or None."""
+        self._refresh_if_changed()
+        return self._entries.get(sku)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_manifest = ImageManifest()
+
+
+def get_manifest() -> ImageManifest:
+    return _manifest
@@ -0,0 +1,65 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from catalog import variants
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = "Genera por adelantado las variantes redimensionadas de las imágenes de producto."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1,
+            help="Procesos en paralelo (por defecto, uno por CPU).",
+        )
+        parser.add_argument(
+            "--sku", dest="skus", action="append",
+            help="Limitar a este SKU; se puede repetir (por defecto, todo el catálogo).",
+        )
+        parser.add_argument(
+            "--format", dest="formats", action="append", choices=sorted(variants.FORMATS),
+            help="Formato a generar; se puede repetir (por defecto, todos).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        formats = options["formats"] or list(variants.FORMATS)
+        cache = variants.get_cache()
+
+        products = Product.objects.all()
+        if options["skus"]:
+            products = products.filter(sku__in=options["skus"])
+
+        jobs = []
+        for sku, image_name in products.values_list("sku", "image").iterator():
+            source = variants.source_path(sku, image_name)
+            if source is None:
+                continue
+            for width, height in variants.allowed_sizes():
+                for fmt in formats:
+                    name = variants.variant_name(sku, width, height, fmt, source)
+                    if name not in cache:
+                        jobs.append((source, cache.path(name), width, height, fmt))
+
+        generated = 0
+        if options["workers"] > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+                results = pool.map(variants.render_to_file, jobs, chunksize=8)
+                for dest, size in results:
+                    cache.add(os.path.basename(dest), size)
+                    generated += 1
+        else:
+            for job in jobs:
+                dest, size = variants.render_to_file(job)
+                cache.add(os.path.basename(dest), size)
+                generated += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generadas {generated} variantes en {elapsed:.1f}s "
+            f"(caché: {cache.total_bytes / 1024 / 1024:.1f} MB)."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice FTS5 de búsqueda de productos."
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            self.stdout.write(self.style.WARNING("FTS5 no disponible: la búsqueda usa el fallback icontains."))
+            return
+        total = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexados {total} productos."))
@@ -0,0 +1,19 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from catalog import images
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el manifest SKU -> imagen de Images/ y avisa a los servidores en marcha."
+
+    def handle(self, *args, **options):
+        directory = images.images_dir()
+        # Los procesos web detectan el cambio de mtime y rehacen su manifest
+        try:
+            os.utime(directory)
+        except OSError:
+            pass
+        total = images.get_manifest().build()
+        self.stdout.write(self.style.SUCCESS(f"Manifest actualizado: {total} SKU con imagen en {directory}."))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    Category = apps.get_model('catalog', 'Category')
+    nodes = list(Category.objects.all())
+    by_parent = {}
+    for node in nodes:
+        by_parent.setdefault(node.parent_id, []).append(node)
+    stack = [(node, '') for node in by_parent.get(None, [])]
+    while stack:
+        node, prefix = stack.pop()
+        node.path = f"{prefix}{node.pk}/"
+        node.depth = node.path.count('/') - 1
+        stack.extend((child, node.path) for child in by_parent.get(node.pk, []))
+    Category.objects.bulk_update(nodes, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(code=build_paths, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# SQL copiado aquí a propósito: la migración no debe cambiar si luego cambia
+# catalog.search (que mantiene el índice en tiempo de ejecución)
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_product_fts "
+    "USING fts5(name, manufacturer, categories, tokenize = 'unicode61 remove_diacritics 2')"
+)
+INSERT_SQL = "INSERT INTO catalog_product_fts (rowid, name, manufacturer, categories) VALUES (%s, %s, %s, %s)"
+DROP_SQL = "DROP TABLE IF EXISTS catalog_product_fts"
+
+
+def create_and_fill_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_SQL)
+    except Exception:
+        # SQLite compilado sin FTS5: la búsqueda usará el fallback
+        return
+    Category = apps.get_model('catalog', 'Category')
+    Product = apps.get_model('catalog', 'Product')
+    names = dict(Category.objects.values_list('id', 'name'))
+    rows = []
+    for p in Product.objects.select_related('category', 'manufacturer'):
+        path_ids = [int(pk) for pk in (p.category.path or f"{p.category_id}/").split('/') if pk]
+        rows.append((
+            p.pk,
+            p.name,
+            p.manufacturer.name if p.manufacturer_id else '',
+            ' '.join(names.get(pk, '') for pk in path_ids),
+        ))
+    schema_editor.connection.cursor().executemany(INSERT_SQL, rows)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_category_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(code=create_and_fill_index, reverse_code=drop_index),
+    ]
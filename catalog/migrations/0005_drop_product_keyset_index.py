@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_product_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_cat_name_id_idx',
+        ),
+    ]
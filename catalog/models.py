@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import CheckConstraint, Q
+from django.db import models, transaction
+from django.db.models import Case, CheckConstraint, F, Q, Value, When
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 
-import secrets
-import string
+from core import codes
+
+SKU_PREFIX = "PF-"
 
 
 class Category(models.Model):
@@ -15,6 +17,9 @@ class Category(models.Model):
 	parent = models.ForeignKey(
 		"self", related_name="children", on_delete=models.CASCADE, blank=True, null=True
 	)
+	# Ruta materializada con los ids desde la raíz, p.ej. "3/17/42/". Se mantiene en save().
+	path = models.CharField(max_length=255, blank=True, default="", db_index=True, editable=False)
+	depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
 	class Meta:
 		verbose_name = "categoría"
@@ -23,6 +28,92 @@ class Category(models.Model):
 	def __str__(self) -> str:
 		return self.name
 
+	def save(self, *args, **kwargs):
+		parent = self.parent if self.parent_id else None
+		if parent is not None and self.path and parent.path.startswith(self.path):
+			raise ValueError("Una categoría no puede colgar de sí misma ni de sus subcategorías.")
+		parent_path = parent.path if parent is not None else ""
+		with transaction.atomic():
+			if self.pk is None:
+				# La ruta incluye el propio id: se completa tras el INSERT
+				super().save(*args, **kwargs)
+				self.path = f"{parent_path}{self.pk}/"
+				self.depth = self.path.count("/") - 1
+				Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+				return
+			old_path = self.path
+			self._move_subtree(f"{parent_path}{self.pk}/")
+			update_fields = kwargs.get("update_fields")
+			if update_fields is not None and self.path != old_path:
+				kwargs["update_fields"] = {*update_fields, "path", "depth"}
+			# Los receptores de post_save ya ven la ruta nueva, también en los descendientes
+			super().save(*args, **kwargs)
+
+	def _move_subtree(self, new_path: str) -> None:
+		"""Set this node's path and re-root its descendants with a single UPDATE."""
+		old_path, old_depth = self.path, self.depth
+		new_depth = new_path.count("/") - 1
+		if old_path and old_path != new_path:
+			Category.objects.filter(self.subtree_q(old_path)).exclude(pk=self.pk).update(
+				path=Concat(Value(new_path), Substr("path", len(old_path) + 1)),
+				depth=F("depth") + (new_depth - old_depth),
+			)
+		self.path, self.depth = new_path, new_depth
+
+	@staticmethod
+	def subtree_q(path: str, field: str = "path") -> Q:
+		"""Filter for everything at or below `path`.
+
+		Expressed as a range (``path <= x < path[:-1] + "0"``) instead of LIKE so
+		it is an indexed range scan on any backend: "0" sorts right after "/".
+		"""
+		return Q(**{f"{field}__gte": path, f"{field}__lt": path[:-1] + "0"})
+
+	def ancestor_ids(self) -> list[int]:
+		return [int(pk) for pk in self.path.split("/") if pk]
+
+	def get_ancestors(self, include_self: bool = False) -> list["Category"]:
+		"""Ancestors from the root down (one query)."""
+		ids = self.ancestor_ids()
+		if not include_self:
+			ids = ids[:-1]
+		if not ids:
+			return []
+		return list(Category.objects.filter(pk__in=ids).order_by("depth"))
+
+	def get_breadcrumbs(self) -> list["Category"]:
+		return self.get_ancestors(include_self=True)
+
+	def get_descendants(self, include_self: bool = False):
+		qs = Category.objects.filter(self.subtree_q(self.path))
+		if not include_self:
+			qs = qs.exclude(pk=self.pk)
+		return qs
+
+	def get_tree_products(self):
+		"""Products in this category or anywhere below it (one query)."""
+		return Product.objects.filter(self.subtree_q(self.path, "category__path"))
+
+	@classmethod
+	def rebuild_paths(cls) -> int:
+		"""Recompute every path/depth from the parent FKs (repair tool)."""
+		nodes = list(cls.objects.only("id", "parent_id", "path", "depth"))
+		by_parent: dict[int | None, list[Category]] = {}
+		for node in nodes:
+			by_parent.setdefault(node.parent_id, []).append(node)
+		changed = []
+		stack = [(node, "") for node in by_parent.get(None, [])]
+		while stack:
+			node, prefix = stack.pop()
+			path = f"{prefix}{node.pk}/"
+			depth = path.count("/") - 1
+			if (node.path, node.depth) != (path, depth):
+				node.path, node.depth = path, depth
+				changed.append(node)
+			stack.extend((child, path) for child in by_parent.get(node.pk, []))
+		cls.objects.bulk_update(changed, ["path", "depth"], batch_size=500)
+		return len(changed)
+
 
 class Manufacturer(models.Model):
 	name = models.CharField(max_length=150, unique=True)
@@ -72,17 +163,72 @@ class Product(models.Model):
 
 	def save(self, *args, **kwargs):
 		self.status = self.Status.SOLD_OUT if self.stock == 0 else self.Status.AVAILABLE
-		if not self.sku:
-			self.sku = self._generate_unique_sku()
-		super().save(*args, **kwargs)
+		if self.sku:
+			return super().save(*args, **kwargs)
+		self.sku = self._generate_unique_sku()
+		codes.save_with_code(
+			self, "sku", self._generate_unique_sku, lambda: super(Product, self).save(*args, **kwargs), kwargs.get("using"),
+		)
+
+	@classmethod
+	def take_stock(cls, quantities: dict) -> bool:
+		"""Decrement stock for ``{product_id: quantity}`` with one conditional UPDATE.
+
+		Rows are only touched while they still have enough stock
+		(``stock >= q``); status follows the new stock. Returns False when some
+		product fell short, so the caller rolls back its transaction.
+		"""
+		quantities = {pid: q for pid, q in quantities.items() if q > 0}
+		if not quantities:
+			return True
+		enough = Q()
+		stock_cases, status_cases = [], []
+		for pid, quantity in quantities.items():
+			enough |= Q(pk=pid, stock__gte=quantity)
+			stock_cases.append(When(pk=pid, then=F("stock") - quantity))
+			status_cases.append(When(pk=pid, stock=quantity, then=Value(cls.Status.SOLD_OUT)))
+		updated = cls.objects.filter(enough).update(
+			stock=Case(*stock_cases, default=F("stock"), output_field=models.PositiveIntegerField()),
+			status=Case(*status_cases, default=Value(cls.Status.AVAILABLE)),
+			updated_at=timezone.now(),
+		)
+		if updated == len(quantities):
+			from .facets import get_index
+
+			# El UPDATE no dispara post_save: refrescar las facetas al confirmar
+			ids = list(quantities)
+			transaction.on_commit(lambda: get_index().refresh_products(ids))
+			return True
+		return False
+
+	@classmethod
+	def return_stock(cls, quantities: dict) -> None:
+		"""Give back ``{product_id: quantity}`` units with one UPDATE (released reservations)."""
+		quantities = {pid: q for pid, q in quantities.items() if q > 0}
+		if not quantities:
+			return
+		cls.objects.filter(pk__in=list(quantities)).update(
+			stock=Case(
+				*[When(pk=pid, then=F("stock") + q) for pid, q in quantities.items()],
+				default=F("stock"), output_field=models.PositiveIntegerField(),
+			),
+			status=Value(cls.Status.AVAILABLE),
+			updated_at=timezone.now(),
+		)
+		from .facets import get_index
+
+		ids = list(quantities)
+		transaction.on_commit(lambda: get_index().refresh_products(ids))
 
 	@classmethod
 	def _generate_unique_sku(cls) -> str:
-		alphabet = string.ascii_uppercase + string.digits
-		while True:
-			candidate = "PF-" + "".join(secrets.choice(alphabet) for _ in range(8))
-			if not cls.objects.filter(sku=candidate).exists():
-				return candidate
+		# Único por construcción (core.codes): sin consultar si ya existe
+		return SKU_PREFIX + codes.new_code()
+
+	@classmethod
+	def reserve_skus(cls, n: int) -> list[str]:
+		"""`n` SKUs at once, for ``bulk_create`` (imports, seeding)."""
+		return [SKU_PREFIX + code for code in codes.reserve(n)]
 
 	def __str__(self) -> str:
 		return f"{self.name} ({self.sku})"
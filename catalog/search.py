@@ -0,0 +1,176 @@
+"""Búsqueda de productos del catálogo.
+
+En SQLite se mantiene un índice FTS5 (``catalog_product_fts``) con una fila por
+producto (rowid = id del producto) y tres columnas: nombre, fabricante y la
+ruta de nombres de su categoría. El tokenizador ``unicode61 remove_diacritics 2``
+pliega acentos ("tuneles" encuentra "Túneles") y los resultados se ordenan por
+BM25. Si FTS5 no está disponible se recurre a ``icontains`` sin ranking.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+FTS_TABLE = "catalog_product_fts"
+# Pesos BM25 por columna: name, manufacturer, categories
+BM25_WEIGHTS = (10.0, 3.0, 2.0)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_available: dict[str, bool] = {}
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics ("Túneles" -> "tuneles")."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def fts_available() -> bool:
+    """True when the FTS5 index table exists on the default database."""
+    if connection.vendor != "sqlite":
+        return False
+    key = str(connection.settings_dict.get("NAME"))
+    if key not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _available[key] = cursor.fetchone() is not None
+    return _available[key]
+
+
+def build_match_query(q: str) -> str | None:
+    """Turn free text into an FTS5 query: every word, prefix-matched, ANDed."""
+    words = _WORD_RE.findall(fold(q))
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def fallback_q(q: str) -> Q:
+    """``icontains`` filter for products; a matching category brings its whole subtree."""
+    from .models import Category
+
+    cond = Q(name__icontains=q) | Q(manufacturer__name__icontains=q)
+    for path in Category.objects.filter(name__icontains=q).values_list("path", flat=True):
+        cond |= Category.subtree_q(path, "category__path")
+    return cond
+
+
+def search_product_ids(q: str, limit: int | None = None) -> list[int] | None:
+    """Ranked product ids matching `q` (best first), or None without FTS5.
+
+    Sin `limit` devuelve todas las coincidencias: el catálogo las usa como
+    filtro para las facetas y los contadores, y un corte dejaría fuera
+    resultados sin avisar.
+    """
+    if not fts_available():
+        return None
+    match = build_match_query(q)
+    if match is None:
+        return []
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}, {weights})"
+    params = [match]
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def document_rows(products, category_names: dict[int, str]) -> list[tuple]:
+    """(rowid, name, manufacturer, categories) for each product.
+
+    `category_names` maps category id -> name for every category on the
+    products' paths, so deep hierarchies are searchable by any ancestor.
+    """
+    rows = []
+    for p in products:
+        path_ids = [int(pk) for pk in (p.category.path or f"{p.category_id}/").split("/") if pk]
+        rows.append((
+            p.pk,
+            p.name,
+            p.manufacturer.name if p.manufacturer_id else "",
+            " ".join(category_names.get(pk, "") for pk in path_ids),
+        ))
+    return rows
+
+
+def index_products(product_ids) -> int:
+    """(Re)index the given products; ids that no longer exist are dropped."""
+    if not fts_available():
+        return 0
+    from .models import Category, Product
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    products = list(Product.objects.filter(pk__in=product_ids).select_related("category", "manufacturer"))
+    ancestor_ids = {int(pk) for p in products for pk in p.category.path.split("/") if pk}
+    names = dict(Category.objects.filter(pk__in=ancestor_ids).values_list("id", "name"))
+    rows = document_rows(products, names)
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, manufacturer, categories) VALUES (%s, %s, %s, %s)", rows
+        )
+    return len(rows)
+
+
+def rebuild_index() -> int:
+    """Drop every indexed document and index the whole catalog again."""
+    if not fts_available():
+        return 0
+    from .models import Product
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    ids = list(Product.objects.values_list("id", flat=True))
+    total = 0
+    for start in range(0, len(ids), 500):
+        total += index_products(ids[start:start + 500])
+    return total
+
+
+def _on_product_saved(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+def _on_product_deleted(sender, instance, **kwargs):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [instance.pk])
+
+
+def _on_category_saved(sender, instance, **kwargs):
+    # Un cambio de nombre o de padre afecta a todo el subárbol
+    if not instance.path:
+        return
+    index_products(instance.get_tree_products().values_list("id", flat=True))
+
+
+def _on_manufacturer_saved(sender, instance, **kwargs):
+    index_products(instance.products.values_list("id", flat=True))
+
+
+def _on_manufacturer_deleting(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.products.values_list("id", flat=True))
+
+
+def _on_manufacturer_deleted(sender, instance, **kwargs):
+    index_products(getattr(instance, "_search_product_ids", []))
+
+
+def connect_signals() -> None:
+    from .models import Category, Manufacturer, Product
+
+    post_save.connect(_on_product_saved, sender=Product, dispatch_uid="catalog_search_product_saved")
+    post_delete.connect(_on_product_deleted, sender=Product, dispatch_uid="catalog_search_product_deleted")
+    post_save.connect(_on_category_saved, sender=Category, dispatch_uid="catalog_search_category_saved")
+    post_save.connect(_on_manufacturer_saved, sender=Manufacturer, dispatch_uid="catalog_search_mfr_saved")
+    pre_delete.connect(_on_manufacturer_deleting, sender=Manufacturer, dispatch_uid="catalog_search_mfr_deleting")
+    post_delete.connect(_on_manufacturer_deleted, sender=Manufacturer, dispatch_uid="catalog_search_mfr_deleted")
@@ -1,7 +1,9 @@
-import os
 from django import template
-from django.conf import settings
 from django.templatetags.static import static
+from django.urls import reverse
+
+from catalog.images import get_manifest
+from catalog.variants import DEFAULT_FORMAT, allowed_sizes, is_valid
 
 register = template.Library()
 
@@ -14,25 +16,60 @@ def get_item(d, key):
         return []
 
 
+def _has_local_image(product, sku: str) -> bool:
+    return get_manifest().lookup(sku) is not None or bool(getattr(product, "image", None))
+
+
+def _variant_url(sku: str, size: str, fmt: str = DEFAULT_FORMAT) -> str | None:
+    try:
+        width, height = (int(v) for v in size.lower().split("x"))
+    except ValueError:
+        return None
+    if not is_valid(sku, width, height, fmt):
+        return None
+    return reverse("image_variant", kwargs={"sku": sku, "width": width, "height": height, "fmt": fmt})
+
+
 @register.simple_tag
-def product_image_src(product):
+def product_image_src(product, size=None):
     """Return URL for product image from Images/ by SKU with fallbacks.
 
-    Looks for files named by SKU with extensions .webp, .jpg, .jpeg, .png in
-    BASE_DIR/Images. If found, serves via static URL. Otherwise falls back to
-    product.image_url or a placeholder with the SKU text.
+    Looks the SKU up in the in-memory manifest of BASE_DIR/Images (see
+    ``catalog.images``; .webp, .jpg, .jpeg, .png in that order). If found,
+    serves via static URL. Otherwise falls back to product.image_url or a
+    placeholder with the SKU text.
+
+    With ``size`` ("400x400", one of CATALOG_IMAGE_SIZES) and a local image
+    (Images/ or an uploaded ``Product.image``), returns the resized variant
+    served by ``/img/<sku>/<size>.webp`` instead of the full-size file.
     """
     sku = getattr(product, "sku", None) or str(product)
 
-    img_dir = os.path.join(settings.BASE_DIR, "Images")
-    for ext in (".webp", ".jpg", ".jpeg", ".png"):
-        candidate = os.path.join(img_dir, sku + ext)
-        try:
-            if os.path.exists(candidate):
-                return static(sku + ext)
-        except Exception:
-            # If any filesystem issue occurs, ignore and continue fallbacks
-            pass
+    if size and _has_local_image(product, sku):
+        url = _variant_url(sku, size)
+        if url:
+            return url
+
+    name = get_manifest().lookup(sku)
+    if name:
+        return static(name)
 
     url = getattr(product, "image_url", "") or f"https://placehold.co/600x400?text={sku}"
     return url
+
+
+@register.simple_tag
+def product_image_srcset(product):
+    """``srcset`` value with every CATALOG_IMAGE_SIZES variant ("url 400w, ...").
+
+    Empty when the product has no local image to resize.
+    """
+    sku = getattr(product, "sku", None) or str(product)
+    if not _has_local_image(product, sku):
+        return ""
+    candidates = []
+    for width, height in allowed_sizes():
+        url = _variant_url(sku, f"{width}x{height}")
+        if url:
+            candidates.append(f"{url} {width}w")
+    return ", ".join(candidates)
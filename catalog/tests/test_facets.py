@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import facets
+from catalog.models import Category, Manufacturer, Product
+
+
+class FacetIndexTests(TestCase):
+    def setUp(self):
+        facets.invalidate_index()
+        self.root = Category.objects.create(name="Reptiles")
+        self.sub = Category.objects.create(name="Terrarios", parent=self.root)
+        self.acme = Manufacturer.objects.create(name="Escamas")
+        self.other = Manufacturer.objects.create(name="Colmillo")
+        self.cheap = self._product("Terrario mini", 4, self.acme)
+        self.mid = self._product("Terrario medio", 15, self.acme, stock=0)
+        self.big = self._product("Terrario grande", 40, self.other)
+
+    def _product(self, name, price, manufacturer, stock=3):
+        return Product.objects.create(
+            name=name,
+            description="",
+            price=price,
+            stock=stock,
+            category=self.sub,
+            manufacturer=manufacturer,
+            image_url=f"https://example.com/{name.replace(' ', '-')}.jpg",
+        )
+
+    def _ids(self, res):
+        return [p.id for p in res.context["products_by_subcat"].get(self.sub.id, [])]
+
+    def test_bitset_round_trip(self):
+        self.assertEqual(list(facets.iter_ids(facets.bitset([9, 2, 130]))), [2, 9, 130])
+        self.assertEqual(list(facets.iter_ids(0)), [])
+
+    def test_sections_stay_presorted_for_keyset_pages(self):
+        index = facets.get_index()
+        everything = index.all
+        self.assertEqual(index.page_after(self.sub.id, everything, None, 10), [self.big.id, self.mid.id, self.cheap.id])
+        # Un cambio de nombre mueve el producto dentro de su sección
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.name = "Terrario aa"
+            self.cheap.save()
+        index = facets.get_index()
+        self.assertEqual(index.page_after(self.sub.id, index.all, None, 2), [self.cheap.id, self.big.id])
+        after = index.sort_key(self.big.id)
+        self.assertEqual(index.page_after(self.sub.id, index.all, after, 2), [self.mid.id])
+        # Los filtros solo descartan ids al recorrer
+        available = index.by_status[Product.Status.AVAILABLE]
+        self.assertEqual(index.page_after(self.sub.id, available, after, 2), [])
+
+    def test_price_buckets(self):
+        self.assertEqual(facets.price_bucket(4), "0-5")
+        self.assertEqual(facets.price_bucket(10), "10-20")
+        self.assertEqual(facets.price_bucket(99), "20+")
+
+    def test_filters_combine_and_counts_ignore_own_facet(self):
+        res = self.client.get(reverse("catalog:home"), {"parent": "Reptiles", "manufacturer": "Escamas", "available": "1"})
+        self.assertEqual(self._ids(res), [self.cheap.id])
+        self.assertEqual(res.context["result_count"], 1)
+        # El contador de cada fabricante no aplica el filtro de fabricante
+        self.assertEqual(res.context["manufacturer_counts"]["Escamas"], 1)
+        self.assertEqual(res.context["manufacturer_counts"]["Colmillo"], 1)
+        # Ni el de disponibilidad su propio filtro
+        self.assertEqual(res.context["available_count"], 1)
+        self.assertEqual(dict((k, c) for k, _l, c in res.context["price_options"])["0-5"], 1)
+
+    def test_price_filter(self):
+        res = self.client.get(reverse("catalog:home"), {"parent": "Reptiles", "price": "20+"})
+        self.assertEqual(self._ids(res), [self.big.id])
+        res = self.client.get(reverse("catalog:home"), {"parent": "Reptiles", "price": "bogus"})
+        self.assertEqual(len(self._ids(res)), 3)
+
+    def test_index_follows_product_changes(self):
+        self.client.get(reverse("catalog:home"))  # construye el índice
+        index = facets.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mid.stock = 5
+            self.mid.save()
+        self.assertTrue(index.by_status[Product.Status.AVAILABLE] >> self.mid.id & 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.big.price = 7
+            self.big.save()
+        self.assertTrue(index.by_price["5-10"] >> self.big.id & 1)
+        self.assertFalse(index.by_price["20+"] >> self.big.id & 1)
+        cheap_id = self.cheap.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.delete()
+        self.assertNotIn(cheap_id, index.docs)
+        res = self.client.get(reverse("catalog:home"), {"parent": "Reptiles", "available": "1"})
+        self.assertEqual(self._ids(res), [self.big.id, self.mid.id])
+
+    def test_rolled_back_writes_do_not_reach_the_index(self):
+        index = facets.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.big.price = 7
+                    self.big.save()
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+        self.assertTrue(index.by_price["20+"] >> self.big.id & 1)
+
+    def test_rebuild_swaps_in_a_complete_index(self):
+        index = facets.get_index()
+        before = index._data
+        index.rebuild()
+        self.assertIsNot(index._data, before)
+        # La generación anterior sigue entera para quien la estuviera leyendo
+        self.assertEqual(before.all, index.all)
+
+    def test_admin_bulk_update_refreshes_index(self):
+        from django.contrib.admin.sites import site
+        from catalog.admin import ProductAdmin
+
+        facets.get_index()
+        ProductAdmin(Product, site).mark_out_of_stock(None, Product.objects.filter(pk=self.cheap.pk))
+        self.assertFalse(facets.get_index().by_status[Product.Status.AVAILABLE] >> self.cheap.id & 1)
+
+    @override_settings(CATALOG_PAGE_SIZE=1)
+    def test_only_page_rows_are_loaded(self):
+        self.client.get(reverse("catalog:home"))
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse("catalog:home"), {"parent": "Reptiles"})
+        product_selects = [
+            q["sql"] for q in ctx.captured_queries
+            if 'FROM "catalog_product"' in q["sql"] and q["sql"].lstrip().startswith("SELECT")
+        ]
+        self.assertEqual(len(product_selects), 1)
+        self.assertEqual(len(self._ids(res)), 1)
+        self.assertIn(self.sub.id, res.context["next_cursor_by_subcat"])
+
+    def test_load_more_honours_facet_filters(self):
+        cursor = None
+        with self.settings(CATALOG_PAGE_SIZE=1):
+            res = self.client.get(reverse("catalog:home"), {"parent": "Reptiles", "manufacturer": "Escamas"})
+            self.assertEqual(self._ids(res), [self.mid.id])
+            cursor = res.context["next_cursor_by_subcat"][self.sub.id]
+            data = self.client.get(
+                reverse("catalog:more"), {"section": self.sub.id, "after": cursor, "manufacturer": "Escamas"}
+            ).json()
+        self.assertEqual([it["id"] for it in data["items"]], [self.cheap.id])
+        self.assertIsNone(data["next"])
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+from django.db import connection
+from django.db.models.signals import post_save
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from catalog import facets
 from catalog.models import Category, Manufacturer, Product
 
 
@@ -96,6 +100,54 @@ class CatalogViewTests(TestCase):
 		self.assertNotContains(res, "Pienso premium")
 
 
+class CatalogQueryCountTests(TestCase):
+	def setUp(self):
+		facets.invalidate_index()
+		self.client = Client()
+		self.mfr = Manufacturer.objects.create(name="Acme")
+		self._seq = 0
+
+	def _grow_catalog(self, n_subcats: int, per_subcat: int):
+		parent = Category.objects.create(name=f"Raíz {self._seq}")
+		for i in range(n_subcats):
+			sub = Category.objects.create(name=f"Sub {self._seq}-{i}", parent=parent)
+			for j in range(per_subcat):
+				Product.objects.create(
+					name=f"Producto {self._seq}-{i}-{j}",
+					description="",
+					price=1,
+					stock=1,
+					category=sub,
+					manufacturer=self.mfr,
+					image_url=f"https://example.com/p-{self._seq}-{i}-{j}.jpg",
+				)
+		self._seq += 1
+
+	def _count_queries(self, url: str) -> int:
+		self.client.get(url)  # warm up session + cart rows
+		with CaptureQueriesContext(connection) as ctx:
+			res = self.client.get(url)
+		self.assertEqual(res.status_code, 200)
+		return len(ctx.captured_queries)
+
+	def test_catalog_home_query_count_is_constant(self):
+		url = reverse("catalog:home")
+		self._grow_catalog(n_subcats=2, per_subcat=1)
+		small = self._count_queries(url)
+		self._grow_catalog(n_subcats=15, per_subcat=3)
+		self._grow_catalog(n_subcats=10, per_subcat=2)
+		large = self._count_queries(url)
+		self.assertEqual(small, large)
+
+	def test_catalog_home_query_count_is_constant_with_filters(self):
+		url = reverse("catalog:home") + "?q=Producto&manufacturer=Acme"
+		self._grow_catalog(n_subcats=1, per_subcat=1)
+		small = self._count_queries(url)
+		self._grow_catalog(n_subcats=20, per_subcat=2)
+		large = self._count_queries(url)
+		self.assertEqual(small, large)
+
+
 class CategorySeedTests(TestCase):
 	fixtures = []
 
@@ -110,3 +162,84 @@ class CategorySeedTests(TestCase):
 		sub_names = set(perro.children.values_list("name", flat=True))
 		expected = {"Mordedores", "Pelotas", "De inteligencia", "Peluches"}
 		self.assertTrue(expected.issubset(sub_names))
+
+
+class CategoryHierarchyTests(TestCase):
+	def setUp(self):
+		facets.invalidate_index()
+		self.root = Category.objects.create(name="Perros")
+		self.mid = Category.objects.create(name="Juguetes H", parent=self.root)
+		self.leaf = Category.objects.create(name="Mordedores XL", parent=self.mid)
+		self.other = Category.objects.create(name="Gatos")
+		self.deep = Product.objects.create(
+			name="Mordedor nudo",
+			description="",
+			price=4,
+			stock=3,
+			category=self.leaf,
+			image_url="https://example.com/nudo.jpg",
+		)
+
+	def test_paths_and_depth_are_maintained_on_create(self):
+		self.leaf.refresh_from_db()
+		self.assertEqual(self.leaf.path, f"{self.root.pk}/{self.mid.pk}/{self.leaf.pk}/")
+		self.assertEqual(self.leaf.depth, 2)
+		self.assertEqual(self.root.depth, 0)
+
+	def test_descendants_breadcrumbs_and_tree_products_take_one_query(self):
+		with self.assertNumQueries(1):
+			names = set(self.root.get_descendants().values_list("name", flat=True))
+		self.assertEqual(names, {"Juguetes H", "Mordedores XL"})
+		with self.assertNumQueries(1):
+			crumbs = [c.name for c in self.leaf.get_breadcrumbs()]
+		self.assertEqual(crumbs, ["Perros", "Juguetes H", "Mordedores XL"])
+		with self.assertNumQueries(1):
+			prods = list(self.root.get_tree_products())
+		self.assertEqual(prods, [self.deep])
+		self.assertFalse(self.other.get_tree_products().exists())
+
+	def test_moving_a_subtree_rewrites_descendant_paths(self):
+		self.mid.parent = self.other
+		self.mid.save()
+		self.leaf.refresh_from_db()
+		self.assertEqual(self.leaf.path, f"{self.other.pk}/{self.mid.pk}/{self.leaf.pk}/")
+		self.assertEqual(list(self.other.get_tree_products()), [self.deep])
+		self.assertFalse(self.root.get_tree_products().exists())
+
+	def test_move_with_update_fields_persists_the_path_before_post_save(self):
+		seen = {}
+
+		def on_save(sender, instance, **kwargs):
+			seen[instance.pk] = Category.objects.get(pk=self.leaf.pk).path
+
+		post_save.connect(on_save, sender=Category)
+		try:
+			self.mid.parent = self.other
+			self.mid.save(update_fields=["parent"])
+		finally:
+			post_save.disconnect(on_save, sender=Category)
+		expected = f"{self.other.pk}/{self.mid.pk}/{self.leaf.pk}/"
+		self.assertEqual(seen, {self.mid.pk: expected})
+		self.mid.refresh_from_db()
+		self.assertEqual((self.mid.path, self.mid.depth), (f"{self.other.pk}/{self.mid.pk}/", 1))
+
+	def test_cycles_are_rejected(self):
+		self.root.parent = self.leaf
+		with self.assertRaises(ValueError):
+			self.root.save()
+
+	def test_rebuild_paths_repairs_stale_rows(self):
+		Category.objects.filter(pk=self.leaf.pk).update(path="", depth=0)
+		self.assertEqual(Category.rebuild_paths(), 1)
+		self.leaf.refresh_from_db()
+		self.assertEqual(self.leaf.depth, 2)
+
+	def test_catalog_parent_filter_includes_deep_products(self):
+		res = self.client.get(reverse("catalog:home") + "?parent=Perros")
+		self.assertContains(res, "Mordedor nudo")
+		self.assertEqual([c.name for c in res.context["breadcrumbs"]], ["Perros"])
+		res = self.client.get(reverse("catalog:home") + "?parent=Perros&sub=Mordedores XL")
+		self.assertContains(res, "Mordedor nudo")
+		self.assertEqual([c.name for c in res.context["breadcrumbs"]], ["Perros", "Juguetes H", "Mordedores XL"])
+		res = self.client.get(reverse("catalog:home") + "?parent=Gatos&sub=Mordedores XL")
+		self.assertNotContains(res, "Mordedor nudo")
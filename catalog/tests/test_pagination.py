@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import facets
+from catalog.models import Category, Manufacturer, Product
+
+
+@override_settings(CATALOG_PAGE_SIZE=2)
+class CatalogKeysetPaginationTests(TestCase):
+    def setUp(self):
+        facets.invalidate_index()
+        self.root = Category.objects.create(name="Aves")
+        self.sub = Category.objects.create(name="Columpios", parent=self.root)
+        self.mfr = Manufacturer.objects.create(name="Plumas")
+        # Dos productos con el mismo nombre para ejercitar el desempate por id
+        names = ["Columpio A", "Columpio B", "Columpio B", "Columpio C", "Columpio D"]
+        self.products = [
+            Product.objects.create(
+                name=name,
+                description="",
+                price=3,
+                stock=2,
+                category=self.sub,
+                manufacturer=self.mfr,
+                image_url=f"https://example.com/columpio-{i}.jpg",
+            )
+            for i, name in enumerate(names)
+        ]
+
+    def _more(self, after, **params):
+        return self.client.get(reverse("catalog:more"), {"section": self.sub.id, "after": after, **params})
+
+    def test_first_page_and_load_more_walk_the_whole_section(self):
+        res = self.client.get(reverse("catalog:home") + "?parent=Aves")
+        first = res.context["products_by_subcat"][self.sub.id]
+        self.assertEqual(first, self.products[:2])
+        cursor = res.context["next_cursor_by_subcat"][self.sub.id]
+        self.assertContains(res, 'class="btn-more"')
+
+        seen = [p.id for p in first]
+        while cursor:
+            data = self._more(cursor).json()
+            seen.extend(it["id"] for it in data["items"])
+            cursor = data["next"]
+        self.assertEqual(seen, [p.id for p in self.products])
+
+    def test_load_more_cost_does_not_depend_on_depth(self):
+        res = self.client.get(reverse("catalog:home") + "?parent=Aves")
+        cursor = res.context["next_cursor_by_subcat"][self.sub.id]
+        with CaptureQueriesContext(connection) as shallow:
+            data = self._more(cursor).json()
+        with CaptureQueriesContext(connection) as deep:
+            self._more(data["next"]).json()
+        self.assertEqual(len(shallow.captured_queries), len(deep.captured_queries))
+
+    def test_load_more_in_search_mode_keeps_ranking(self):
+        res = self.client.get(reverse("catalog:home") + "?q=columpio")
+        first = res.context["products_by_subcat"][self.sub.id]
+        self.assertEqual(len(first), 2)
+        seen = [p.id for p in first]
+        cursor = res.context["next_cursor_by_subcat"][self.sub.id]
+        while cursor:
+            data = self._more(cursor, q="columpio").json()
+            seen.extend(it["id"] for it in data["items"])
+            cursor = data["next"]
+        self.assertEqual(sorted(seen), sorted(p.id for p in self.products))
+
+    def test_no_cursor_when_section_fits_in_one_page(self):
+        res = self.client.get(reverse("catalog:home") + "?parent=Aves&q=columpio+d")
+        self.assertEqual(res.context["next_cursor_by_subcat"], {})
+
+    def test_invalid_parameters_return_400(self):
+        self.assertEqual(self._more("not-a-cursor").status_code, 400)
+        res = self.client.get(reverse("catalog:more"), {"section": "x", "after": ""})
+        self.assertEqual(res.status_code, 400)
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog import facets, search
+from catalog.models import Category, Manufacturer, Product
+
+
+class ProductSearchIndexTests(TestCase):
+    def setUp(self):
+        facets.invalidate_index()
+        self.root = Category.objects.create(name="Felinos")
+        self.sub = Category.objects.create(name="Escondites", parent=self.root)
+        self.mfr = Manufacturer.objects.create(name="Zarpa")
+        self.tunnel = self._product("Túnel arcoíris", self.sub)
+        self.bed = self._product("Cama escondite", self.sub, manufacturer=None)
+
+    def _product(self, name, category, manufacturer="default"):
+        return Product.objects.create(
+            name=name,
+            description="",
+            price=5,
+            stock=4,
+            category=category,
+            manufacturer=self.mfr if manufacturer == "default" else manufacturer,
+            image_url=f"https://example.com/{name.replace(' ', '-')}.jpg",
+        )
+
+    def test_broad_queries_are_not_truncated(self):
+        extra = [self._product(f"Escondite {i}", self.sub) for i in range(5)]
+        self.assertEqual(len(search.search_product_ids("escondite", limit=2)), 2)
+        with self.settings(CATALOG_PAGE_SIZE=2):
+            res = self.client.get(reverse("catalog:home"), {"q": "escondite"})
+        # "escondite" también casa con la categoría Escondites: todos entran
+        self.assertEqual(res.context["result_count"], len(extra) + 2)
+        self.assertEqual(res.context["manufacturer_counts"]["Zarpa"], len(extra) + 1)
+
+    def test_fts_is_available_in_tests(self):
+        self.assertTrue(search.fts_available())
+
+    def test_accents_are_folded(self):
+        self.assertEqual(search.search_product_ids("tunel arcoiris"), [self.tunnel.id])
+        self.assertEqual(search.search_product_ids("TÚNEL ARCOÍRIS"), [self.tunnel.id])
+        self.assertIn(self.tunnel.id, search.search_product_ids("túnel"))
+
+    def test_name_matches_rank_above_category_matches(self):
+        ids = search.search_product_ids("escondite")
+        self.assertEqual(ids[0], self.bed.id)
+        self.assertIn(self.tunnel.id, ids)
+
+    def test_index_follows_manufacturer_category_and_product_changes(self):
+        self.mfr.name = "Bigotes"
+        self.mfr.save()
+        self.assertEqual(search.search_product_ids("bigotes"), [self.tunnel.id])
+        self.root.name = "Michis"
+        self.root.save()
+        self.assertEqual(set(search.search_product_ids("michis")), {self.tunnel.id, self.bed.id})
+        self.mfr.delete()
+        self.assertEqual(search.search_product_ids("bigotes"), [])
+        self.tunnel.delete()
+        self.assertEqual(search.search_product_ids("arcoiris"), [])
+
+    def test_moving_a_category_reindexes_its_products(self):
+        other = Category.objects.create(name="Roedores")
+        self.sub.parent = other
+        self.sub.save()
+        self.assertEqual(set(search.search_product_ids("roedores")), {self.tunnel.id, self.bed.id})
+        self.assertEqual(search.search_product_ids("felinos"), [])
+
+    def test_catalog_search_is_ranked_and_folds_accents(self):
+        res = self.client.get(reverse("catalog:home") + "?q=tunel")
+        self.assertContains(res, "Túnel arcoíris")
+        res = self.client.get(reverse("catalog:home") + "?q=escondite")
+        prods = res.context["products_by_subcat"][self.sub.id]
+        self.assertEqual(prods[0], self.bed)
+
+    def test_catalog_search_falls_back_without_fts(self):
+        with patch("catalog.search.fts_available", return_value=False):
+            self.assertIsNone(search.search_product_ids("tunel"))
+            res = self.client.get(reverse("catalog:home") + "?q=arcoíris")
+        self.assertContains(res, "Túnel arcoíris")
+
+    def test_fallback_matches_any_ancestor_category(self):
+        deep = Category.objects.create(name="Cuevas", parent=self.sub)
+        cave = self._product("Refugio", deep)
+        matched = set(Product.objects.filter(search.fallback_q("felinos")).values_list("id", flat=True))
+        self.assertEqual(matched, {self.tunnel.id, self.bed.id, cave.id})
+        self.assertFalse(Product.objects.filter(search.fallback_q("gatos")).exists())
+
+    def test_rebuild_command_reindexes_everything(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn(str(Product.objects.count()), out.getvalue())
+        self.assertEqual(search.search_product_ids("tunel arcoiris"), [self.tunnel.id])
@@ -1,7 +1,17 @@
 from __future__ import annotations
 
-from django.test import TestCase
-from catalog.templatetags.catalog_extras import get_item
+import os
+import tempfile
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+
+from catalog import images
+from catalog.templatetags.catalog_extras import get_item, product_image_src
 
 
 class TemplateTagsTests(TestCase):
@@ -10,3 +20,44 @@ class TemplateTagsTests(TestCase):
         self.assertEqual(get_item(d, "a"), [1, 2])
         # Non-mapping should not raise
         self.assertEqual(get_item(None, "a"), [])
+
+
+class ProductImageManifestTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self._touch("DOG-001.png")
+        self._touch("DOG-001.jpg")
+        self._touch("notes.txt")
+        override = override_settings(CATALOG_IMAGES_DIR=self.tmp.name, CATALOG_IMAGE_MANIFEST_CHECK=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _touch(self, name):
+        with open(os.path.join(self.tmp.name, name), "wb"):
+            pass
+
+    def test_lookup_prefers_extension_order(self):
+        self.assertEqual(images.get_manifest().lookup("DOG-001"), "DOG-001.jpg")
+        self.assertIsNone(images.get_manifest().lookup("notes"))
+
+    def test_tag_uses_manifest_without_probing_files(self):
+        product = SimpleNamespace(sku="DOG-001", image_url="https://example.com/x.jpg")
+        images.get_manifest().lookup("DOG-001")
+        with patch("os.path.exists") as exists:
+            self.assertEqual(product_image_src(product), static("DOG-001.jpg"))
+        exists.assert_not_called()
+        missing = SimpleNamespace(sku="CAT-999", image_url="")
+        self.assertEqual(product_image_src(missing), "https://placehold.co/600x400?text=CAT-999")
+
+    def test_manifest_follows_directory_changes(self):
+        self.assertIsNone(images.get_manifest().lookup("CAT-002"))
+        self._touch("CAT-002.webp")
+        # Forzamos un mtime distinto por si el sistema de ficheros tiene poca resolución
+        os.utime(self.tmp.name, ns=(0, 1))
+        self.assertEqual(images.get_manifest().lookup("CAT-002"), "CAT-002.webp")
+
+    def test_refresh_command(self):
+        out = StringIO()
+        call_command("refresh_image_manifest", stdout=out)
+        self.assertIn("1 SKU", out.getvalue())
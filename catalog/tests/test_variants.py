@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import io
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from catalog import variants
+from catalog.models import Category, Product
+from catalog.templatetags.catalog_extras import product_image_src, product_image_srcset
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.images = os.path.join(tmp.name, "Images")
+        self.cache = os.path.join(tmp.name, "variants")
+        os.makedirs(self.images)
+        Image.new("RGB", (1200, 600), (200, 120, 40)).save(os.path.join(self.images, "PEZ-001.jpg"))
+        override = override_settings(
+            CATALOG_IMAGES_DIR=self.images,
+            CATALOG_IMAGE_CACHE_DIR=self.cache,
+            CATALOG_IMAGE_MANIFEST_CHECK=0,
+            CATALOG_IMAGE_SIZES=((80, 80), (400, 400)),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        cat = Category.objects.create(name="Acuarios")
+        self.product = Product.objects.create(
+            sku="PEZ-001", name="Pecera", description="", price=9, stock=1,
+            category=cat, image_url="https://example.com/pecera.jpg",
+        )
+
+    def _url(self, size="400x400", fmt="webp"):
+        width, height = size.split("x")
+        return reverse("image_variant", kwargs={"sku": "PEZ-001", "width": width, "height": height, "fmt": fmt})
+
+    def _image(self, res):
+        return Image.open(io.BytesIO(b"".join(res.streaming_content)))
+
+    def test_variant_is_resized_and_cached(self):
+        res = self.client.get(self._url())
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["Content-Type"], "image/webp")
+        img = self._image(res)
+        self.assertEqual((img.format, img.size), ("WEBP", (400, 200)))
+
+        with patch("catalog.variants.render") as render:
+            res = self.client.get(self._url())
+            self.assertEqual(res.status_code, 200)
+        render.assert_not_called()
+
+        res = self.client.get(self._url("80x80", "jpg"))
+        self.assertEqual(self._image(res).format, "JPEG")
+
+    def test_unknown_sizes_and_products_are_404(self):
+        self.assertEqual(self.client.get(self._url("123x45")).status_code, 404)
+        self.assertEqual(self.client.get(self._url(fmt="gif")).status_code, 404)
+        url = reverse("image_variant", kwargs={"sku": "NOPE-1", "width": 80, "height": 80, "fmt": "webp"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_source_gone_between_eviction_and_retry_is_404(self):
+        # Primera llamada: ruta ya expulsada; la segunda ya no encuentra el original
+        with patch("catalog.variants.get_variant", side_effect=[os.path.join(self.cache, "gone.webp"), None]):
+            res = self.client.get(self._url())
+        self.assertEqual(res.status_code, 404)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = variants.get_cache()
+        with override_settings(CATALOG_IMAGE_CACHE_MAX_BYTES=10):
+            cache.put("a.webp", b"12345")
+            cache.put("b.webp", b"12345")
+            self.assertIsNotNone(cache.get("a.webp"))  # "a" pasa a ser la más reciente
+            cache.put("c.webp", b"12345")
+        self.assertIn("a.webp", cache)
+        self.assertNotIn("b.webp", cache)
+        self.assertFalse(os.path.exists(os.path.join(self.cache, "b.webp")))
+        self.assertEqual(cache.total_bytes, 10)
+
+    def test_tags_emit_variant_urls(self):
+        self.assertEqual(product_image_src(self.product, "80x80"), self._url("80x80"))
+        self.assertEqual(
+            product_image_srcset(self.product),
+            f"{self._url('80x80')} 80w, {self._url('400x400')} 400w",
+        )
+        # Sin imagen local no hay nada que redimensionar
+        remote = Product(sku="PEZ-404", image_url="https://example.com/x.jpg")
+        self.assertEqual(product_image_src(remote, "80x80"), "https://example.com/x.jpg")
+        self.assertEqual(product_image_srcset(remote), "")
+
+    def test_generate_command_fills_the_cache(self):
+        out = StringIO()
+        call_command("generate_image_variants", "--workers", "2", "--sku", "PEZ-001", stdout=out)
+        self.assertIn("Generadas 4 variantes", out.getvalue())
+        with patch("catalog.variants.render") as render:
+            self.assertEqual(self.client.get(self._url("80x80", "jpg")).status_code, 200)
+        render.assert_not_called()
+        out = StringIO()
+        call_command("generate_image_variants", "--sku", "PEZ-001", stdout=out)
+        self.assertIn("Generadas 0 variantes", out.getvalue())
@@ -5,4 +5,5 @@ app_name = "catalog"
 
 urlpatterns = [
     path("", views.catalog_home, name="home"),
+    path("more/", views.catalog_more, name="more"),
 ]
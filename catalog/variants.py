@@ -0,0 +1,207 @@
+"""Variantes redimensionadas de las imágenes de producto.
+
+``/img/<sku>/<w>x<h>.<fmt>`` sirve la imagen del producto encajada en una
+caja de ``w x h`` (sin deformar) en WebP o JPEG. La variante se genera con
+Pillow la primera vez y se guarda en ``CATALOG_IMAGE_CACHE_DIR``; la caché
+tiene un tamaño máximo (``CATALOG_IMAGE_CACHE_MAX_BYTES``) y expulsa las
+variantes usadas hace más tiempo (LRU). La recencia se guarda en el mtime
+de cada fichero, así que sobrevive a reinicios y se comparte entre procesos.
+
+Solo se aceptan los tamaños de ``CATALOG_IMAGE_SIZES`` para que nadie pueda
+llenar la caché pidiendo tamaños arbitrarios.
+"""
+from __future__ import annotations
+
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .images import get_manifest, images_dir
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+DEFAULT_FORMAT = "webp"
+DEFAULT_SIZES = ((80, 80), (160, 160), (400, 400), (800, 800))
+QUALITY = 82
+
+_SKU_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def allowed_sizes() -> tuple:
+    return tuple(tuple(size) for size in getattr(settings, "CATALOG_IMAGE_SIZES", DEFAULT_SIZES))
+
+
+def cache_dir() -> str:
+    return str(getattr(settings, "CATALOG_IMAGE_CACHE_DIR", os.path.join(settings.MEDIA_ROOT, "variants")))
+
+
+def is_valid(sku: str, width: int, height: int, fmt: str) -> bool:
+    return bool(_SKU_RE.match(sku or "")) and (width, height) in allowed_sizes() and fmt in FORMATS
+
+
+def source_path(sku: str, image_name: str | None = None) -> str | None:
+    """Original image for `sku`: ``Images/`` first, then the uploaded ``Product.image``."""
+    name = get_manifest().lookup(sku)
+    if name:
+        return os.path.join(images_dir(), name)
+    if image_name:
+        path = os.path.join(settings.MEDIA_ROOT, image_name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def variant_name(sku: str, width: int, height: int, fmt: str, source: str) -> str:
+    # El mtime del original forma parte del nombre: si cambia la imagen, cambia la variante
+    stamp = os.stat(source).st_mtime_ns
+    return f"{sku}-{width}x{height}-{stamp:x}.{fmt}"
+
+
+def render(source: str, width: int, height: int, fmt: str) -> bytes:
+    from PIL import Image, ImageOps
+
+    pil_format = FORMATS[fmt][0]
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if pil_format == "JPEG" or img.mode not in ("RGB", "RGBA"):
+            has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha and pil_format == "WEBP" else "RGB")
+        img.thumbnail((width, height), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        if pil_format == "WEBP":
+            img.save(out, pil_format, quality=QUALITY, method=4)
+        else:
+            img.save(out, pil_format, quality=QUALITY, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def render_to_file(job: tuple) -> tuple[str, int]:
+    """Process-pool entry point: ``(source, dest, w, h, fmt)`` -> (dest, bytes).
+
+    Solo usa Pillow y rutas absolutas, así que funciona también con el método
+    de arranque ``spawn`` sin configurar Django en el hijo.
+    """
+    source, dest, width, height, fmt = job
+    data = render(source, width, height, fmt)
+    _atomic_write(dest, data)
+    return dest, len(data)
+
+
+def _atomic_write(dest: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, dest)
+
+
+class VariantCache:
+    """Disk cache of rendered variants with a byte budget and LRU eviction."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dir = None
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+
+    def max_bytes(self) -> int:
+        return int(getattr(settings, "CATALOG_IMAGE_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+    def _load(self) -> None:
+        directory = cache_dir()
+        if directory == self._dir:
+            return
+        files = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        except OSError:
+            pass
+        files.sort()
+        self._entries = OrderedDict((name, size) for _mtime, name, size in files)
+        self._bytes = sum(self._entries.values())
+        self._dir = directory
+
+    def path(self, name: str) -> str:
+        return os.path.join(cache_dir(), name)
+
+    def get(self, name: str) -> str | None:
+        with self._lock:
+            self._load()
+            path = self.path(name)
+            if name not in self._entries:
+                # Puede haberla generado otro proceso
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    return None
+                self._entries[name] = size
+                self._bytes += size
+            self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._bytes -= self._entries.pop(name, 0)
+            return None
+        return path
+
+    def add(self, name: str, size: int) -> None:
+        with self._lock:
+            self._load()
+            self._bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._evict()
+
+    def put(self, name: str, data: bytes) -> str:
+        path = self.path(name)
+        _atomic_write(path, data)
+        self.add(name, len(data))
+        return path
+
+    def _evict(self) -> None:
+        budget = self.max_bytes()
+        while self._bytes > budget and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            self._load()
+            return name in self._entries
+
+
+_cache = VariantCache()
+
+
+def get_cache() -> VariantCache:
+    return _cache
+
+
+def get_variant(sku: str, width: int, height: int, fmt: str, image_name: str | None = None) -> str | None:
+    """Path of the cached variant, rendering it on a miss; None if there is no source."""
+    source = source_path(sku, image_name)
+    if source is None:
+        return None
+    name = variant_name(sku, width, height, fmt, source)
+    path = _cache.get(name)
+    if path is None:
+        path = _cache.put(name, render(source, width, height, fmt))
+    return path
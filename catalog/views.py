@@ -1,9 +1,112 @@
-from django.db import models
-from django.db.models import Q
-from django.db.models import Count
+import base64
+import json
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_GET
 
+from . import facets, search, variants
 from .models import Category, Product, Manufacturer
+from .templatetags.catalog_extras import product_image_src, product_image_srcset
+
+
+def _page_size() -> int:
+    return max(1, int(getattr(settings, 'CATALOG_PAGE_SIZE', 24)))
+
+
+def _encode_cursor(name: str, pk: int, pos: int | None = None) -> str:
+    """Opaque keyset cursor pointing right after (name, pk) in (name, id) order.
+
+    Con búsqueda lleva además la posición de `pk` en el ranking.
+    """
+    raw = json.dumps([name, pk] if pos is None else [name, pk, pos]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_cursor(token: str):
+    try:
+        name, pk, *rest = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return str(name), int(pk), int(rest[0]) if rest else None
+    except Exception:
+        return None
+
+
+def _read_filters(request) -> dict:
+    price = request.GET.get('price', '').strip()
+    return {
+        'q': request.GET.get('q', '').strip(),
+        'manufacturer': request.GET.get('manufacturer', '').strip(),
+        'available': request.GET.get('available') == '1',
+        'price': price if price in {key for key, *_rest in facets.PRICE_BUCKETS} else '',
+    }
+
+
+def _select(index, filters: dict, base: int, manufacturer_id=None, with_counts=False):
+    """Apply the catalog filters to `base` with bitwise ANDs.
+
+    Returns ``(bits, ranked_ids, counts)``. Each facet is counted with every
+    filter applied except its own, so the counts tell how many results each
+    option would give.
+    """
+    ranked_ids = None
+    if filters['q']:
+        ranked_ids = search.search_product_ids(filters['q'])
+        if ranked_ids is None:
+            matched = Product.objects.filter(search.fallback_q(filters['q'])).values_list('id', flat=True)
+            base &= facets.bitset(matched)
+        else:
+            base &= facets.bitset(ranked_ids)
+
+    masks = {}
+    if filters['manufacturer']:
+        masks['manufacturer'] = index.by_manufacturer.get(manufacturer_id, 0) if manufacturer_id else 0
+    if filters['available']:
+        masks['status'] = index.by_status.get(Product.Status.AVAILABLE, 0)
+    if filters['price']:
+        masks['price'] = index.by_price.get(filters['price'], 0)
+
+    def combined(skip=None):
+        bits = base
+        for facet, mask in masks.items():
+            if facet != skip:
+                bits &= mask
+        return bits
+
+    counts = None
+    if with_counts:
+        counts = {
+            'manufacturer': index.counts(combined('manufacturer'), index.by_manufacturer),
+            'status': index.counts(combined('status'), index.by_status),
+            'price': index.counts(combined('price'), index.by_price),
+        }
+    return combined(), ranked_ids, counts
+
+
+def _ranked_after(ranked_ids, bits, after_id, after_pos, size):
+    """Up to `size` (position, id) pairs of `ranked_ids` within `bits`, after `after_id`."""
+    if after_pos is None or not 0 <= after_pos < len(ranked_ids) or ranked_ids[after_pos] != after_id:
+        # El ranking cambió desde la página anterior: se busca el id
+        if after_id not in ranked_ids:
+            return []
+        after_pos = ranked_ids.index(after_id)
+    page = []
+    for pos in range(after_pos + 1, len(ranked_ids)):
+        pk = ranked_ids[pos]
+        if bits >> pk & 1:
+            page.append((pos, pk))
+            if len(page) == size:
+                break
+    return page
+
+
+def _fetch_page(index, page_ids):
+    """Load only the rows that end up on the page, in `page_ids` order."""
+    rows = Product.objects.select_related('category', 'manufacturer').in_bulk(page_ids)
+    if len(rows) != len(page_ids):
+        # Algún id del índice ya no existe (borrado desde otro proceso)
+        index.invalidate()
+    return [rows[pk] for pk in page_ids if pk in rows]
 
 
 def catalog_home(request):
@@ -12,49 +115,186 @@ def catalog_home(request):
     Filtros por query string:
       - parent: nombre de la categoría padre (p.ej. "Perros")
       - sub: nombre de la subcategoría (p.ej. "Juguetes")
+      - q: texto libre; con FTS5 los resultados salen ordenados por relevancia
+      - manufacturer: nombre exacto del fabricante
+      - available=1: solo productos disponibles
+      - price: tramo de precio (``facets.PRICE_BUCKETS``)
+
+    Los filtros y los contadores de cada faceta se resuelven en memoria con el
+    índice de ``facets`` (AND de bitsets); de la base de datos solo se leen
+    las categorías, los fabricantes y las filas que caen en la primera página
+    de cada sección (CATALOG_PAGE_SIZE). El resto se pide a ``catalog_more``
+    con el cursor de la sección.
     """
     parent_name = request.GET.get('parent')
     sub_name = request.GET.get('sub')
-    q = request.GET.get('q', '').strip()
-    mfr = request.GET.get('manufacturer', '').strip()
+    filters = _read_filters(request)
+    size = _page_size()
+
+    categories = list(Category.objects.order_by('name'))
+    by_id = {c.id: c for c in categories}
+    by_name = {c.name: c for c in categories}
+    manufacturers = list(Manufacturer.objects.order_by('name').values_list('id', 'name'))
 
-    parents_qs = Category.objects.filter(parent__isnull=True).order_by('name')
+    # Ámbito del filtro: la categoría más profunda seleccionada (parent y/o sub)
+    scope = None
+    unknown_filter = False
     if parent_name:
-        parents_qs = parents_qs.filter(name=parent_name)
-    parents = list(parents_qs)
-
-    subcats_by_parent = {}
-    products_by_subcat = {}
-    for parent in parents:
-        subcats_qs = Category.objects.filter(parent=parent).order_by('name')
-        if sub_name:
-            subcats_qs = subcats_qs.filter(name=sub_name)
-        subcats = []
-        for sc in subcats_qs:
-            prod_qs = Product.objects.filter(category=sc)
-            if q:
-                prod_qs = prod_qs.filter(
-                    Q(name__icontains=q)
-                    | Q(manufacturer__name__icontains=q)
-                    | Q(category__name__icontains=q)
-                    | Q(category__parent__name__icontains=q)
-                )
-            if mfr:
-                prod_qs = prod_qs.filter(manufacturer__name=mfr)
-            prods = list(prod_qs.order_by('name'))
-            if prods:
-                subcats.append(sc)
-                products_by_subcat[sc.id] = prods
-        subcats_by_parent[parent.id] = subcats
+        scope = by_name.get(parent_name)
+        unknown_filter = scope is None
+    if sub_name and not unknown_filter:
+        sub = by_name.get(sub_name)
+        if sub is None or (scope is not None and (sub.pk == scope.pk or not sub.path.startswith(scope.path))):
+            unknown_filter = True
+        else:
+            scope = sub
 
+    if scope is not None:
+        breadcrumbs = [by_id[pk] for pk in scope.ancestor_ids() if pk in by_id]
+        parents = breadcrumbs[:1]
+    else:
+        breadcrumbs = []
+        parents = [] if unknown_filter else [c for c in categories if c.parent_id is None]
+
+    index = facets.get_index()
+    if scope is not None:
+        base = index.categories(c.id for c in categories if c.path.startswith(scope.path))
+    else:
+        base = index.all if parents else 0
+    manufacturer_id = {name: pk for pk, name in manufacturers}.get(filters['manufacturer'])
+    bits, ranked_ids, counts = _select(index, filters, base, manufacturer_id, with_counts=True)
+    rank = {pk: pos for pos, pk in enumerate(ranked_ids)} if ranked_ids is not None else None
+
+    # Cada sección cuelga de la raíz de su ruta, sea cual sea la profundidad
+    subcats_by_parent = {parent.id: [] for parent in parents}
+    section_ids, next_by_cat = {}, {}
+    for cat_id, ids in index.sections(bits).items():
+        cat = by_id.get(cat_id)
+        root_id = cat.ancestor_ids()[0] if cat is not None and cat.path else None
+        if root_id not in subcats_by_parent:
+            continue
+        subcats_by_parent[root_id].append(cat)
+        if rank is None:
+            first = index.page_after(cat_id, bits, None, size + 1)
+        else:
+            first = sorted(ids, key=rank.__getitem__)[:size + 1]
+        section_ids[cat_id] = first[:size]
+        if len(first) > size:
+            last = first[size - 1]
+            next_by_cat[cat_id] = _encode_cursor(index.sort_key(last)[0], last, rank[last] if rank is not None else None)
+
+    page = _fetch_page(index, [pk for ids in section_ids.values() for pk in ids])
+    products_by_subcat = {cat_id: [] for cat_id in section_ids}
+    for p in page:
+        products_by_subcat[p.category_id].append(p)
+    for subcats in subcats_by_parent.values():
+        # Secciones vacías (filas que desaparecieron entre índice y consulta) fuera
+        subcats[:] = [c for c in subcats if products_by_subcat[c.id]]
+        if rank is not None:
+            # Con búsqueda, las secciones con mejores resultados van primero
+            subcats.sort(key=lambda c: rank[products_by_subcat[c.id][0].id])
+        else:
+            subcats.sort(key=lambda c: (c.depth == 0, c.name))
+
+    mfr_counts = counts['manufacturer']
     ctx = {
         'categories': parents,
         'subcats_by_parent': subcats_by_parent,
-        'products_by_subcat': products_by_subcat,
+        'products_by_subcat': {cat_id: prods for cat_id, prods in products_by_subcat.items() if prods},
+        'next_cursor_by_subcat': {cat_id: cursor for cat_id, cursor in next_by_cat.items() if products_by_subcat[cat_id]},
+        'breadcrumbs': breadcrumbs,
         'active_parent': parent_name or '',
         'active_sub': sub_name or '',
-        'active_q': q,
-        'active_manufacturer': mfr,
-        'manufacturers': list(Manufacturer.objects.order_by('name').values_list('name', flat=True)),
+        'active_q': filters['q'],
+        'active_manufacturer': filters['manufacturer'],
+        'active_available': filters['available'],
+        'active_price': filters['price'],
+        'manufacturers': [name for _pk, name in manufacturers],
+        'manufacturer_counts': {name: mfr_counts.get(pk, 0) for pk, name in manufacturers},
+        'available_count': counts['status'].get(Product.Status.AVAILABLE, 0),
+        'price_options': [(key, label, counts['price'].get(key, 0)) for key, label, *_bounds in facets.PRICE_BUCKETS],
+        'result_count': bits.bit_count(),
     }
     return render(request, 'catalog/list.html', ctx)
+
+
+@require_GET
+def catalog_more(request):
+    """Siguiente página (JSON) de una sección del catálogo.
+
+    Paginación keyset: ``after`` es el cursor devuelto por la página anterior.
+    Los ids salen del índice de facetas, ya ordenados por sección (o del
+    ranking de la búsqueda, desde la posición del cursor), y solo se leen de
+    la base de datos las filas de la página pedida.
+    """
+    try:
+        category_id = int(request.GET.get('section', ''))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid section')
+    cursor = _decode_cursor(request.GET.get('after', ''))
+    if cursor is None:
+        return HttpResponseBadRequest('Invalid cursor')
+    after_name, after_id, after_pos = cursor
+    filters = _read_filters(request)
+    size = _page_size()
+
+    index = facets.get_index()
+    manufacturer_id = None
+    if filters['manufacturer']:
+        manufacturer_id = Manufacturer.objects.filter(name=filters['manufacturer']).values_list('id', flat=True).first()
+    bits, ranked_ids, _counts = _select(index, filters, index.by_category.get(category_id, 0), manufacturer_id)
+    if ranked_ids is None:
+        page_ids = index.page_after(category_id, bits, (after_name, after_id), size + 1)
+        positions = None
+    else:
+        ranked = _ranked_after(ranked_ids, bits, after_id, after_pos, size + 1)
+        page_ids = [pk for _pos, pk in ranked]
+        positions = {pk: pos for pos, pk in ranked}
+
+    has_more = len(page_ids) > size
+    page_ids = page_ids[:size]
+    page = _fetch_page(index, page_ids)
+    last = page_ids[-1] if page_ids else None
+    return JsonResponse({
+        'items': [
+            {
+                'id': p.id,
+                'name': p.name,
+                'price': f"{p.price:.2f}",
+                'stock': p.stock,
+                'image_url': product_image_src(p, '400x400'),
+                'image_srcset': product_image_srcset(p),
+            }
+            for p in page
+        ],
+        'next': _encode_cursor(index.sort_key(last)[0], last, positions[last] if positions else None) if has_more else None,
+    })
+
+
+@require_GET
+def image_variant(request, sku, width, height, fmt):
+    """Imagen del producto redimensionada (``/img/<sku>/<w>x<h>.<fmt>``).
+
+    La variante se genera una vez y se sirve desde la caché en disco de
+    ``variants``; solo se aceptan los tamaños de CATALOG_IMAGE_SIZES.
+    """
+    if not variants.is_valid(sku, width, height, fmt):
+        raise Http404('Unknown image variant')
+    image_name = None
+    if variants.get_manifest().lookup(sku) is None:
+        image_name = Product.objects.filter(sku=sku).values_list('image', flat=True).first()
+    path = variants.get_variant(sku, width, height, fmt, image_name)
+    if path is None:
+        raise Http404('No image for this product')
+    try:
+        fh = open(path, 'rb')
+    except FileNotFoundError:
+        # Expulsada de la caché por otra petición entre medias: se regenera
+        path = variants.get_variant(sku, width, height, fmt, image_name)
+        if path is None:
+            raise Http404('No image for this product')
+        fh = open(path, 'rb')
+    response = FileResponse(fh, content_type=variants.FORMATS[fmt][1])
+    # La URL no cambia si se sustituye la imagen original: caché larga pero no inmutable
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
@@ -1,2 +1,11 @@
 from django.contrib import admin
 
+from .models import EmailOutbox
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+	list_display = ("subject", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+	list_filter = ("status",)
+	search_fields = ("key", "subject", "to")
+	readonly_fields = ("created_at", "sent_at", "last_error")
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = "Envía por lotes los correos pendientes de la cola (EmailOutbox) con una sola conexión SMTP."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=outbox.batch_size(),
+            help="Correos reclamados y enviados por lote (por defecto, EMAIL_OUTBOX_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="No terminar: seguir vaciando la cola cada --interval segundos.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=getattr(settings, "EMAIL_OUTBOX_INTERVAL", 5),
+            help="Segundos entre pasadas con --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = outbox.deliver(size=max(1, options["batch_size"]))
+            if stats["batches"] or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Enviados {stats['sent']} correos en {stats['batches']} lotes "
+                    f"({stats['retried']} para reintentar, {stats['failed']} fallidos) "
+                    f"en {stats['seconds']:.2f}s ({stats['per_second']:.1f}/s)."
+                ))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
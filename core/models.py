@@ -1,4 +1,63 @@
 from django.db import models
+from django.utils import timezone
 
 # Domain models moved to dedicated apps: catalog, cart, orders.
 
+
+class EmailOutbox(models.Model):
+	"""Correo pendiente de envío.
+
+	Se escribe en la misma transacción que el cambio que lo provoca (p. ej. el
+	pedido) y lo envía el comando ``send_outbox`` por lotes, así la petición
+	nunca espera al servidor SMTP.
+	"""
+
+	class Status(models.TextChoices):
+		HELD = "retenido", "Retenido"
+		PENDING = "pendiente", "Pendiente"
+		SENT = "enviado", "Enviado"
+		FAILED = "fallido", "Fallido"
+
+	# Identifica el correo (p. ej. "order-confirmation:42") para no duplicarlo
+	key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+	subject = models.CharField(max_length=255)
+	body = models.TextField()
+	from_email = models.CharField(max_length=254, blank=True)
+	to = models.JSONField(default=list)
+	status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	next_attempt_at = models.DateTimeField(default=timezone.now)
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	sent_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+		]
+
+	def __str__(self):
+		return f"{self.subject} → {', '.join(self.to)} ({self.get_status_display()})"
+
+	@classmethod
+	def enqueue(cls, subject, body, to, key=None, held=False):
+		"""Queue a message; ``held`` rows wait for ``release(key)`` before sending."""
+		return cls.objects.create(
+			key=key,
+			subject=subject,
+			body=body,
+			to=list(to),
+			status=cls.Status.HELD if held else cls.Status.PENDING,
+		)
+
+	@classmethod
+	def release(cls, key):
+		"""Let a held message go out."""
+		return cls.objects.filter(key=key, status=cls.Status.HELD).update(
+			status=cls.Status.PENDING, next_attempt_at=timezone.now(),
+		)
+
+	@classmethod
+	def discard(cls, key):
+		"""Drop a message that has not been sent yet."""
+		return cls.objects.filter(key=key, status__in=[cls.Status.HELD, cls.Status.PENDING]).delete()[0]
@@ -0,0 +1,143 @@
+"""Envío de la cola de correo (``EmailOutbox``).
+
+``deliver`` reclama los mensajes vencidos por lotes de
+``EMAIL_OUTBOX_BATCH_SIZE`` y los manda todos por una única conexión SMTP
+(``get_connection()`` abierta una vez), en lugar de un handshake por correo.
+Un fallo no detiene el lote: ese mensaje se reintenta con espera exponencial
+(``EMAIL_OUTBOX_BACKOFF`` segundos, doblando en cada intento) hasta
+``EMAIL_OUTBOX_MAX_ATTEMPTS`` y después queda como fallido. Lo usa el
+comando ``send_outbox``.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Mientras un worker envía un lote, otro no lo vuelve a coger; si el worker
+# muere, los mensajes reaparecen pasado este tiempo
+_LEASE = timedelta(minutes=5)
+_MAX_BACKOFF = 6 * 60 * 60
+
+
+def batch_size() -> int:
+    return max(1, int(getattr(settings, "EMAIL_OUTBOX_BATCH_SIZE", 100)))
+
+
+def max_attempts() -> int:
+    return max(1, int(getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)))
+
+
+def backoff(attempts: int) -> timedelta:
+    """Wait before retry number `attempts` + 1."""
+    base = float(getattr(settings, "EMAIL_OUTBOX_BACKOFF", 60))
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), _MAX_BACKOFF))
+
+
+def _claim(size: int) -> list:
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "pk")[:size]
+        )
+        if rows:
+            EmailOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=now + _LEASE)
+    return rows
+
+
+def _open(connection):
+    # Si el servidor no responde, cada envío del lote fallará y se reintentará
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.warning("No se pudo abrir la conexión de correo: %s", exc)
+
+
+def _send(connection, rows) -> dict:
+    """Send `rows` over the open `connection`; ``{pk: error or None}``."""
+    results = {}
+    for row in rows:
+        message = EmailMessage(
+            row.subject, row.body, row.from_email or settings.DEFAULT_FROM_EMAIL, row.to, connection=connection,
+        )
+        try:
+            connection.send_messages([message])
+        except Exception as exc:
+            logger.warning("No se pudo enviar el correo %s: %s", row.pk, exc)
+            results[row.pk] = str(exc) or exc.__class__.__name__
+            # La conexión puede haber quedado rota: se abre otra para el resto
+            connection.close()
+            _open(connection)
+        else:
+            results[row.pk] = None
+    return results
+
+
+def _record(rows, results) -> tuple[int, int, int]:
+    now = timezone.now()
+    sent = [row.pk for row in rows if results[row.pk] is None]
+    failed = [row for row in rows if results[row.pk] is not None]
+    retried = gave_up = 0
+    with transaction.atomic():
+        if sent:
+            EmailOutbox.objects.filter(pk__in=sent).update(
+                status=EmailOutbox.Status.SENT, sent_at=now, last_error="",
+            )
+        for row in failed:
+            row.attempts += 1
+            row.last_error = results[row.pk]
+            if row.attempts >= max_attempts():
+                row.status = EmailOutbox.Status.FAILED
+                gave_up += 1
+            else:
+                row.next_attempt_at = now + backoff(row.attempts)
+                retried += 1
+        if failed:
+            EmailOutbox.objects.bulk_update(failed, ["attempts", "last_error", "status", "next_attempt_at"])
+    return len(sent), retried, gave_up
+
+
+def deliver(size: int | None = None, limit: int | None = None, connection=None) -> dict:
+    """Send due messages in batches over one SMTP connection.
+
+    ``limit`` caps the messages handled in this call. Returns
+    ``{"sent", "retried", "failed", "batches", "seconds", "per_second"}``.
+    """
+    size = size or batch_size()
+    stats = {"sent": 0, "retried": 0, "failed": 0, "batches": 0}
+    started = time.monotonic()
+    connection = connection or get_connection(fail_silently=False)
+    handled = 0
+    opened = False
+    try:
+        while limit is None or handled < limit:
+            rows = _claim(size if limit is None else min(size, limit - handled))
+            if not rows:
+                break
+            if not opened:
+                # Se abre solo si hay algo que enviar y una sola vez para todos los lotes
+                _open(connection)
+                opened = True
+            sent, retried, failed = _record(rows, _send(connection, rows))
+            stats["sent"] += sent
+            stats["retried"] += retried
+            stats["failed"] += failed
+            stats["batches"] += 1
+            handled += len(rows)
+    finally:
+        if opened:
+            connection.close()
+    stats["seconds"] = time.monotonic() - started
+    stats["per_second"] = stats["sent"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
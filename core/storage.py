@@ -0,0 +1,36 @@
+"""Storage de estáticos con nombres con hash de contenido.
+
+``collectstatic`` copia ``Images/`` (fotos de producto, ``Banner.png`` y
+``Logo.png``) a STATIC_ROOT como ``DOG-MOR-001.3f2a9c1e07b4.jpg`` y escribe
+``staticfiles.json``; ``{% static %}`` y ``product_image_src`` resuelven los
+nombres a través de ese manifest. Como la URL cambia cuando cambia el
+contenido, esos ficheros se pueden cachear para siempre (``immutable``).
+"""
+from __future__ import annotations
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class HashedStaticStorage(ManifestStaticFilesStorage):
+    # Un fichero que aún no está en el manifest (p.ej. subido después del
+    # último collectstatic) se sirve con su nombre original en lugar de romper
+    # la página entera.
+    manifest_strict = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hashed_names = None
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            return name
+
+    def is_hashed(self, path: str) -> bool:
+        """True when `path` is a content-hashed name listed in the manifest."""
+        if self._hashed_names is None:
+            self._hashed_names = frozenset(
+                hashed for name, hashed in self.hashed_files.items() if hashed != name
+            )
+        return path in self._hashed_names
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+from unittest import mock
+
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Category, Product
+from core import codes
+from orders.models import Order
+
+
+class CodeGeneratorTests(SimpleTestCase):
+    def test_bulk_reservation_is_unique_even_within_one_millisecond(self):
+        gen = codes.CodeGenerator(node=7, clock=lambda: 1_800_000_000.0)
+        batch = gen.reserve(1000) + gen.reserve(1000)
+        self.assertEqual(len(set(batch)), 2000)
+        self.assertTrue(all(len(c) == codes.LENGTH and codes.is_valid(c) for c in batch))
+
+    def test_consecutive_codes_do_not_reveal_their_neighbours(self):
+        gen = codes.CodeGenerator(node=7, clock=lambda: 1_800_000_000.0)
+        first, second = gen.reserve(2)
+        # Contadores consecutivos: sin la clave no comparten ni el prefijo
+        self.assertNotEqual(first[:6], second[:6])
+        with self.settings(SECRET_KEY="otra-clave"):
+            other = codes.CodeGenerator(node=7, clock=lambda: 1_800_000_000.0).reserve(2)
+        self.assertNotEqual(other, [first, second])
+
+    def test_permutation_round_trips(self):
+        for value in (0, 1, (1 << 60) - 1, 123_456_789_012_345):
+            permuted = codes._permute(value)
+            self.assertLess(permuted, 1 << 60)
+            self.assertEqual(codes._unpermute(permuted), value)
+
+    def test_nodes_and_clock_going_back_do_not_collide(self):
+        now = [1_800_000_000.0]
+        a = codes.CodeGenerator(node=1, clock=lambda: now[0])
+        b = codes.CodeGenerator(node=2, clock=lambda: now[0])
+        first = a.reserve(300) + b.reserve(300)
+        now[0] -= 5
+        second = a.reserve(300) + b.reserve(300)
+        self.assertEqual(len(set(first + second)), 1200)
+
+    def test_check_digit_catches_typos(self):
+        code = codes.new_code()
+        for i in range(len(code)):
+            for ch in codes.ALPHABET:
+                if ch != code[i]:
+                    self.assertFalse(codes.is_valid(code[:i] + ch + code[i + 1:]))
+        swaps = [code[:i] + code[i + 1] + code[i] + code[i + 2:] for i in range(len(code) - 1) if code[i] != code[i + 1]]
+        self.assertGreaterEqual(sum(not codes.is_valid(s) for s in swaps), len(swaps) - 1)
+        self.assertTrue(codes.is_valid(code.lower().replace("1", "l").replace("0", "o")))
+
+    def test_issue_time_can_be_read_back(self):
+        gen = codes.CodeGenerator(node=3, clock=lambda: 1_800_000_000.25)
+        self.assertEqual(codes.issued_at(gen.new()), 1_800_000_000.25)
+        self.assertIsNone(codes.issued_at("NOT-A-CODE"))
+
+
+class ModelCodesTests(TestCase):
+    def test_saving_does_not_probe_for_collisions(self):
+        cat = Category.objects.create(name="Códigos")
+        with CaptureQueriesContext(connection) as ctx:
+            product = Product.objects.create(
+                name="Pelota", description="", price=Decimal("3.00"), stock=1,
+                category=cat, image_url="https://example.com/pelota.jpg",
+            )
+            order = Order.objects.create(
+                contact_email="c@example.com", total=Decimal("3.00"), ship_name="C", ship_street="C",
+                ship_number="1", ship_city="C", ship_postal_code="1", ship_country="ES",
+                payment_method=Order.PaymentMethod.CARD,
+            )
+        probes = [q["sql"] for q in ctx.captured_queries if '"sku" =' in q["sql"] or '"tracking_code" =' in q["sql"]]
+        self.assertEqual(probes, [])
+        self.assertTrue(product.sku.startswith("PF-") and codes.is_valid(product.sku[3:]))
+        self.assertTrue(order.tracking_code.startswith("PT-") and codes.is_valid(order.tracking_code[3:]))
+
+    def test_reserved_codes_fill_a_bulk_create(self):
+        codes_ = Order.reserve_tracking_codes(50)
+        Order.objects.bulk_create([
+            Order(
+                tracking_code=code, contact_email="bulk@example.com", total=Decimal("1.00"), ship_name="B",
+                ship_street="B", ship_number="1", ship_city="B", ship_postal_code="1", ship_country="ES",
+                payment_method=Order.PaymentMethod.TRANSFER,
+            )
+            for code in codes_
+        ])
+        self.assertEqual(Order.objects.values("tracking_code").distinct().count(), 50)
+        self.assertEqual(len(set(Product.reserve_skus(50))), 50)
+
+    def test_a_clashing_code_is_replaced_instead_of_failing_the_save(self):
+        cat = Category.objects.create(name="Choques")
+        first = Product.objects.create(
+            name="Uno", description="", price=Decimal("1.00"), stock=1, category=cat, image_url="https://example.com/1.jpg",
+        )
+        taken = Order.objects.create(
+            contact_email="a@example.com", total=Decimal("1.00"), ship_name="A", ship_street="A",
+            ship_number="1", ship_city="A", ship_postal_code="1", ship_country="ES",
+            payment_method=Order.PaymentMethod.CARD,
+        ).tracking_code
+        # Otro worker con el mismo nodo emitió el mismo código en el mismo milisegundo
+        with mock.patch.object(Order, "_generate_tracking_code", side_effect=[taken, "PT-" + codes.new_code()]):
+            order = Order.objects.create(
+                contact_email="b@example.com", total=Decimal("1.00"), ship_name="B", ship_street="B",
+                ship_number="1", ship_city="B", ship_postal_code="1", ship_country="ES",
+                payment_method=Order.PaymentMethod.CARD,
+            )
+        with mock.patch.object(Product, "_generate_unique_sku", side_effect=[first.sku, "PF-" + codes.new_code()]):
+            second = Product.objects.create(
+                name="Dos", description="", price=Decimal("1.00"), stock=1, category=cat, image_url="https://example.com/2.jpg",
+            )
+        self.assertNotEqual(order.tracking_code, taken)
+        self.assertEqual(order.status_events.count(), 1)
+        self.assertNotEqual(second.sku, first.sku)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        cat = Category.objects.create(name="Errores")
+        product = Product(name="Mal", description="", price=Decimal("1.00"), stock=1, category=cat, image_url="https://example.com/m.jpg")
+        product.stock = -1
+        with mock.patch.object(Product, "_generate_unique_sku", wraps=Product._generate_unique_sku) as make:
+            with self.assertRaises(IntegrityError):
+                product.save()
+        self.assertEqual(make.call_count, 1)
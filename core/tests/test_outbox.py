@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import outbox
+from core.models import EmailOutbox
+
+
+class RecordingBackend(EmailBackend):
+    """locmem backend that counts connections and rejects some recipients."""
+
+    opened = 0
+    rejected = set()
+
+    def open(self):
+        RecordingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.rejected:
+                raise ConnectionError("550 mailbox unavailable")
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="core.tests.test_outbox.RecordingBackend",
+    EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_BACKOFF=60,
+)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        RecordingBackend.opened = 0
+        RecordingBackend.rejected = set()
+
+    def _queue(self, n, **kwargs):
+        return [
+            EmailOutbox.enqueue(f"Asunto {i}", "Hola", [f"c{i}@example.com"], **kwargs)
+            for i in range(n)
+        ]
+
+    def test_drains_in_batches_over_one_connection(self):
+        self._queue(5)
+        stats = outbox.deliver(size=2)
+        self.assertEqual((stats["sent"], stats["batches"], stats["failed"]), (5, 3, 0))
+        self.assertEqual(RecordingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(EmailOutbox.objects.exclude(status=EmailOutbox.Status.SENT).exists())
+        # Nada pendiente: ni siquiera se abre la conexión
+        self.assertEqual(outbox.deliver()["batches"], 0)
+        self.assertEqual(RecordingBackend.opened, 1)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        bad, good = self._queue(2)
+        RecordingBackend.rejected = {"c0@example.com"}
+        stats = outbox.deliver()
+        self.assertEqual((stats["sent"], stats["retried"]), (1, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (EmailOutbox.Status.PENDING, 1))
+        self.assertIn("550", bad.last_error)
+        self.assertGreater(bad.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # Todavía no toca reintentar
+        self.assertEqual(outbox.deliver()["batches"], 0)
+        EmailOutbox.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.deliver()["failed"], 1)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (EmailOutbox.Status.FAILED, 2))
+
+    def test_held_messages_wait_for_release(self):
+        self._queue(1, key="order-confirmation:1", held=True)
+        self.assertEqual(outbox.deliver()["sent"], 0)
+        EmailOutbox.release("order-confirmation:1")
+        self.assertEqual(outbox.deliver()["sent"], 1)
+        self.assertEqual(EmailOutbox.discard("order-confirmation:1"), 0)
+
+    def test_command_reports_throughput(self):
+        self._queue(3)
+        out = StringIO()
+        call_command("send_outbox", "--batch-size", "2", stdout=out)
+        self.assertIn("Enviados 3 correos en 2 lotes (0 para reintentar, 0 fallidos)", out.getvalue())
@@ -0,0 +1,59 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+
+from catalog.templatetags.catalog_extras import product_image_src
+from core.views import static_asset
+
+
+class HashedStaticAssetsTests(TestCase):
+	def setUp(self):
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		override = override_settings(
+			STATIC_ROOT=tmp.name,
+			STORAGES={
+				"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+				"staticfiles": {"BACKEND": "core.storage.HashedStaticStorage"},
+			},
+		)
+		override.enable()
+		self.addCleanup(override.disable)
+		call_command("collectstatic", interactive=False, verbosity=0, ignore_patterns=["admin"])
+		self.root = tmp.name
+
+	def _get(self, url):
+		path = url.split("/static/", 1)[1]
+		return static_asset(RequestFactory().get(url), path)
+
+	def test_logo_and_banner_get_content_hashed_names(self):
+		for name in ("Logo.png", "Banner.png"):
+			url = static(name)
+			self.assertRegex(url, r"/static/%s\.[0-9a-f]{12}\.png$" % name[:-4])
+			self.assertTrue(os.path.exists(os.path.join(self.root, url.split("/static/", 1)[1])))
+
+	def test_product_images_resolve_through_the_manifest(self):
+		url = product_image_src(SimpleNamespace(sku="CAT-TUN-001", image_url=""))
+		self.assertRegex(url, r"/static/CAT-TUN-001\.[0-9a-f]{12}\.jpg$")
+
+	def test_hashed_assets_are_immutable(self):
+		url = static("Logo.png")
+		with self.settings(DEBUG=True):
+			res = self._get(url)
+			self.assertEqual(res.status_code, 200)
+			self.assertEqual(res["Cache-Control"], "public, max-age=31536000, immutable")
+			res = self._get("/static/Logo.png")
+			self.assertEqual(res["Cache-Control"], "public, max-age=3600")
+
+	def test_django_does_not_serve_static_files_outside_debug(self):
+		with self.assertRaises(Http404):
+			self._get(static("Logo.png"))
+
+	def test_unknown_files_fall_back_to_plain_names(self):
+		self.assertTrue(staticfiles_storage.url("nope.png").endswith("/static/nope.png"))
@@ -1,6 +1,9 @@
 from django.contrib import messages
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.views.static import serve
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.conf import settings
+from django.http import Http404
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.shortcuts import redirect, render
 from django.views.decorators.http import require_http_methods
@@ -12,14 +15,36 @@ def home(request):
 	"""Home con productos destacados y subcategorías navegables."""
 	qs = Product.objects.order_by("-created_at").all()[:6]
 	products = list(qs)
-	parents = Category.objects.filter(parent__isnull=True).order_by('name')
-	subcats_by_parent = {}
-	for p in parents:
-		subs = Category.objects.filter(parent=p).order_by('name')
-		subcats_by_parent[p.name] = list(subs.values_list('name', flat=True))
+	# Raíces y primer nivel en una sola consulta sobre la jerarquía materializada
+	top = list(Category.objects.filter(depth__lte=1).order_by('name').values_list('id', 'name', 'parent_id'))
+	names = {pk: name for pk, name, parent_id in top if parent_id is None}
+	subcats_by_parent = {name: [] for name in names.values()}
+	for pk, name, parent_id in top:
+		if parent_id in names:
+			subcats_by_parent[names[parent_id]].append(name)
 	return render(request, "home.html", {"products": products, "subcats_by_parent": subcats_by_parent})
 
 
+@require_http_methods(["GET", "HEAD"])
+def static_asset(request, path):
+	"""Sirve STATIC_ROOT cuando los estáticos llevan hash de contenido (solo DEBUG).
+
+	Los nombres con hash (``Logo.<hash>.png``) no cambian nunca de contenido,
+	así que se marcan ``immutable`` con caducidad de un año: las visitas
+	repetidas no vuelven a pedir las imágenes. El resto se revalida cada hora.
+	En producción el servidor web debe mandar esas mismas cabeceras.
+	"""
+	if not settings.DEBUG:
+		raise Http404
+	response = serve(request, path, document_root=settings.STATIC_ROOT)
+	is_hashed = getattr(staticfiles_storage, "is_hashed", None)
+	if is_hashed is not None and is_hashed(path):
+		response["Cache-Control"] = "public, max-age=31536000, immutable"
+	else:
+		response["Cache-Control"] = "public, max-age=3600"
+	return response
+
+
 @require_http_methods(["GET", "POST"])
 def login_view(request):
 	"""Login using email + password, with `next` redirect support."""
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Order, OrderItem
+from .models import Order, OrderItem, OrderStatusEvent, StockReservation
 
 
 class OrderItemInline(admin.TabularInline):
@@ -8,10 +8,28 @@ class OrderItemInline(admin.TabularInline):
 	extra = 0
 
 
+class OrderStatusEventInline(admin.TabularInline):
+	model = OrderStatusEvent
+	extra = 0
+	fields = ("created_at", "from_status", "status")
+	readonly_fields = fields
+	ordering = ("created_at", "id")
+	can_delete = False
+
+	def has_add_permission(self, request, obj=None):
+		return False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
 	list_display = ("id", "tracking_code", "user", "contact_email", "status", "total", "created_at")
 	search_fields = ("tracking_code", "contact_email", "user__email")
 	list_filter = ("status", "payment_method")
-	inlines = [OrderItemInline]
+	inlines = [OrderItemInline, OrderStatusEventInline]
+
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+	list_display = ("id", "key", "product", "quantity", "expires_at")
+	search_fields = ("key", "product__sku")
+	list_select_related = ("product",)
@@ -59,5 +59,8 @@ class OrdersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "orders"
     def ready(self) -> None:
+        from . import tracking
+
         post_migrate.connect(_seed_orders_if_empty, sender=self)
+        tracking.connect_signals()
         return super().ready()
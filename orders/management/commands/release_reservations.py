@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from orders import reservations
+
+
+class Command(BaseCommand):
+    help = "Devuelve al stock las reservas de checkout caducadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="No terminar: seguir liberando reservas caducadas cada --interval segundos.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=getattr(settings, "CHECKOUT_RESERVATION_SWEEP_INTERVAL", 30),
+            help="Segundos entre pasadas con --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            released = reservations.release_expired()
+            if released or not options["loop"]:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Liberadas {released} reservas caducadas en {time.monotonic() - started:.2f}s."
+                ))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
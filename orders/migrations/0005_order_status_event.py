@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_events(apps, schema_editor):
+    # Sin historial previo: un evento por pedido con su estado actual,
+    # fechado en su última modificación (la mejor estimación disponible)
+    Order = apps.get_model('orders', 'Order')
+    OrderStatusEvent = apps.get_model('orders', 'OrderStatusEvent')
+    Order.objects.update(status_changed_at=models.F('updated_at'))
+    rows = Order.objects.values_list('pk', 'status', 'updated_at').iterator(chunk_size=2000)
+    batch = []
+    for pk, status, updated_at in rows:
+        batch.append(OrderStatusEvent(order_id=pk, status=status, created_at=updated_at))
+        if len(batch) >= 2000:
+            OrderStatusEvent.objects.bulk_create(batch)
+            batch = []
+    OrderStatusEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('recibido', 'Recibido'), ('procesando', 'Procesando'), ('enviado', 'Enviado'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=12)),
+                ('status', models.CharField(choices=[('recibido', 'Recibido'), ('procesando', 'Procesando'), ('enviado', 'Enviado'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=12)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='orders.order')),
+            ],
+            options={
+                'verbose_name': 'cambio de estado',
+                'verbose_name_plural': 'cambios de estado',
+                'indexes': [models.Index(fields=['order', 'created_at'], name='order_status_timeline_idx'), models.Index(fields=['status', 'created_at'], name='order_status_entered_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
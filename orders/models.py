@@ -2,12 +2,13 @@ from __future__ import annotations
 
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 from catalog.models import Product
-from django.utils import timezone
-import secrets
-import string
+from core import codes
+
+TRACKING_PREFIX = "PT-"
 
 
 class Order(models.Model):
@@ -31,6 +32,8 @@ class Order(models.Model):
 	status = models.CharField(
 		max_length=12, choices=Status.choices, default=Status.RECEIVED, db_index=True
 	)
+	# Copia del último OrderStatusEvent: el estado actual sin leer el historial
+	status_changed_at = models.DateTimeField(default=timezone.now, editable=False)
 
 	# Shipping address
 	ship_name = models.CharField(max_length=150)
@@ -48,23 +51,76 @@ class Order(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	class Meta:
+		indexes = [
+			# "Mis pedidos": WHERE user_id = ? ORDER BY created_at DESC, id DESC (keyset)
+			models.Index(fields=["user", "-created_at", "-id"], name="order_user_created_idx"),
+		]
+
 	def __str__(self) -> str:
 		return f"Pedido {self.tracking_code} ({self.get_status_display()})"
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._saved_status = instance.__dict__.get("status")
+		return instance
+
+	def refresh_from_db(self, *args, **kwargs):
+		super().refresh_from_db(*args, **kwargs)
+		if "status" in self.__dict__:
+			self._saved_status = self.status
+
 	def save(self, *args, **kwargs):
-		if not self.tracking_code:
+		"""Save and append an OrderStatusEvent when the status changed.
+
+		Solo pasa por aquí ``save()``: ``QuerySet.update(status=...)`` y
+		``bulk_create`` no dejan rastro en el historial.
+		"""
+		new_code = not self.tracking_code
+		if new_code:
 			self.tracking_code = self._generate_tracking_code()
-		super().save(*args, **kwargs)
+		update_fields = kwargs.get("update_fields")
+		if "status" not in self.__dict__ or (update_fields is not None and "status" not in update_fields):
+			return self._save_row(new_code, *args, **kwargs)
+		with transaction.atomic(using=kwargs.get("using")):
+			previous = None if self._state.adding else self._previous_status()
+			changed = previous != self.status
+			if changed:
+				self.status_changed_at = timezone.now()
+				if update_fields is not None:
+					kwargs["update_fields"] = {*update_fields, "status_changed_at"}
+			self._save_row(new_code, *args, **kwargs)
+			if changed:
+				OrderStatusEvent.objects.using(self._state.db).create(
+					order=self, from_status=previous or "", status=self.status, created_at=self.status_changed_at,
+				)
+		self._saved_status = self.status
+
+	def _save_row(self, new_code, *args, **kwargs):
+		if not new_code:
+			return super().save(*args, **kwargs)
+		return codes.save_with_code(
+			self, "tracking_code", self._generate_tracking_code,
+			lambda: super(Order, self).save(*args, **kwargs), kwargs.get("using"),
+		)
+
+	def _previous_status(self):
+		saved = getattr(self, "_saved_status", None)
+		if saved is not None:
+			return saved
+		# Instancia cargada sin la columna status (.only/.defer): se pregunta
+		return Order.objects.using(self._state.db).filter(pk=self.pk).values_list("status", flat=True).first()
 
 	@staticmethod
 	def _generate_tracking_code() -> str:
-		alphabet = string.ascii_uppercase + string.digits
-		prefix = timezone.now().strftime("PT-%Y%m-")
-		for _ in range(5):
-			code = prefix + "".join(secrets.choice(alphabet) for _ in range(8))
-			if not Order.objects.filter(tracking_code=code).exists():
-				return code
-		return prefix + secrets.token_hex(6).upper()
+		# Único por construcción (core.codes): sin consultar si ya existe
+		return TRACKING_PREFIX + codes.new_code()
+
+	@classmethod
+	def reserve_tracking_codes(cls, n: int) -> list[str]:
+		"""`n` tracking codes at once, for ``bulk_create`` (imports, seeding)."""
+		return [TRACKING_PREFIX + code for code in codes.reserve(n)]
 
 
 class OrderItem(models.Model):
@@ -86,3 +142,64 @@ class OrderItem(models.Model):
 	def __str__(self) -> str:
 		return f"{self.quantity} x {self.product_name}"
 
+
+class OrderStatusEventQuerySet(models.QuerySet):
+	def timeline(self, order):
+		"""Events of `order`, oldest first (índice order_status_timeline_idx)."""
+		return self.filter(order=order).order_by("created_at", "id")
+
+	def entered(self, status, since, until):
+		"""Events where an order entered `status` in [since, until) (order_status_entered_idx)."""
+		return self.filter(status=status, created_at__gte=since, created_at__lt=until)
+
+
+class OrderStatusEvent(models.Model):
+	"""Historial de estados de un pedido, solo de inserción.
+
+	``Order.save()`` escribe una fila cada vez que cambia ``Order.status``
+	(también al crearlo, con ``from_status`` vacío) en la misma transacción.
+	"""
+
+	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_events")
+	from_status = models.CharField(max_length=12, choices=Order.Status.choices, blank=True)
+	status = models.CharField(max_length=12, choices=Order.Status.choices)
+	created_at = models.DateTimeField(default=timezone.now)
+
+	objects = OrderStatusEventQuerySet.as_manager()
+
+	class Meta:
+		verbose_name = "cambio de estado"
+		verbose_name_plural = "cambios de estado"
+		indexes = [
+			models.Index(fields=["order", "created_at"], name="order_status_timeline_idx"),
+			models.Index(fields=["status", "created_at"], name="order_status_entered_idx"),
+		]
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding:
+			raise ValueError("El historial de estados no se modifica: añade un evento nuevo.")
+		super().save(*args, **kwargs)
+
+	def __str__(self) -> str:
+		return f"{self.order_id}: {self.from_status or '-'} → {self.status}"
+
+
+class StockReservation(models.Model):
+	"""Unidades apartadas entre el pago y la confirmación.
+
+	Al reservar se descuentan de ``Product.stock``, así que el stock que ven
+	catálogo y carrito ya excluye las reservas vivas. Ver orders.reservations.
+	"""
+
+	key = models.CharField(max_length=64, db_index=True)
+	product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+	quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+	expires_at = models.DateTimeField(db_index=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		verbose_name = "reserva de stock"
+		verbose_name_plural = "reservas de stock"
+
+	def __str__(self) -> str:
+		return f"{self.quantity} x {self.product_id} ({self.key})"
@@ -0,0 +1,308 @@
+"""Pasarela de pago detrás de una interfaz pequeña.
+
+Las vistas de checkout piden la pasarela a ``get_gateway()`` y trabajan con
+diccionarios de intent (``id``, ``status``, ``amount``, ``client_secret``,
+``metadata``); nunca llaman al SDK de Stripe directamente.
+
+- ``StripeGateway`` tiene su propio ``StripeClient`` (no toca ``stripe.api_key``
+  global) con un cliente HTTP que reutiliza conexiones, timeouts estrictos,
+  reintentos con la misma clave de idempotencia y un cortacircuitos que
+  falla rápido mientras Stripe no responde, en lugar de dejar los workers
+  esperando.
+- ``FakeGateway`` guarda los intents en memoria, para tests y pruebas de
+  carga sin red.
+
+``PAYMENT_GATEWAY`` elige la implementación: "stripe", "fake" o una ruta
+importable a otra clase.
+"""
+from __future__ import annotations
+
+import abc
+import itertools
+import threading
+import time
+import uuid
+
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PaymentError(Exception):
+    """The gateway refused the operation or could not be reached."""
+
+
+class GatewayUnavailable(PaymentError):
+    """The circuit breaker is open: the call was not even attempted."""
+
+
+class PaymentGateway(abc.ABC):
+    """Interface used by the checkout views. Intents are plain dicts.
+
+    Una pasarela incompleta (también la de ``PAYMENT_GATEWAY``) falla al
+    instanciarla, no a mitad de un checkout.
+    """
+
+    enabled = True
+
+    @abc.abstractmethod
+    def create_intent(self, amount: int, metadata: dict, currency: str = "eur") -> dict:
+        """New manual-capture intent for `amount` cents."""
+
+    @abc.abstractmethod
+    def modify_intent(self, intent_id: str, amount: int, metadata: dict) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def retrieve_intent(self, intent_id: str) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def capture(self, intent_id: str) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def cancel(self, intent_id: str) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def refund(self, intent_id: str) -> dict:
+        pass
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures.
+
+    Mientras está abierto cada llamada falla al instante con
+    ``GatewayUnavailable``. Pasados `reset_after` segundos deja pasar una
+    sola llamada de prueba: si sale bien se cierra y si no vuelve a abrirse.
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or self._clock() - self._opened_at < self.reset_after:
+            return "open"
+        return "half-open"
+
+    def before(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._probing or self._clock() - self._opened_at < self.reset_after:
+                raise GatewayUnavailable("La pasarela de pago no está disponible")
+            self._probing = True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = self._clock()
+
+
+def _is_transient(exc: stripe.StripeError) -> bool:
+    """Errors worth retrying: network, rate limits and Stripe-side 5xx."""
+    if isinstance(exc, (stripe.APIConnectionError, stripe.RateLimitError)):
+        return True
+    return (exc.http_status or 0) >= 500
+
+
+def _new_key() -> str:
+    return uuid.uuid4().hex
+
+
+class StripeGateway(PaymentGateway):
+    """Stripe over one pooled client configured from settings."""
+
+    def __init__(self):
+        self.api_key = settings.STRIPE_SECRET_KEY
+        self.enabled = bool(self.api_key)
+        self.retries = int(getattr(settings, "STRIPE_MAX_RETRIES", 2))
+        self.backoff = float(getattr(settings, "STRIPE_RETRY_BACKOFF", 0.25))
+        self.breaker = CircuitBreaker(
+            int(getattr(settings, "STRIPE_BREAKER_THRESHOLD", 5)),
+            float(getattr(settings, "STRIPE_BREAKER_RESET", 30)),
+        )
+        timeout = (
+            float(getattr(settings, "STRIPE_CONNECT_TIMEOUT", 3)),
+            float(getattr(settings, "STRIPE_TIMEOUT", 10)),
+        )
+        api_base = getattr(settings, "STRIPE_API_BASE", "")
+        # RequestsClient guarda una requests.Session por hilo: cada worker
+        # reutiliza sus conexiones keep-alive en lugar de abrir una por llamada.
+        # Los reintentos son nuestros (max_network_retries=0) para controlar
+        # la clave de idempotencia y contar los fallos en el cortacircuitos.
+        self.client = stripe.StripeClient(
+            self.api_key or "sk_unset",
+            http_client=stripe.RequestsClient(timeout=timeout),
+            base_addresses={"api": api_base} if api_base else {},
+            max_network_retries=0,
+        )
+
+    def _call(self, method, *args, idempotency_key=None, **params) -> dict:
+        """Run `method` with retries; every attempt reuses `idempotency_key`."""
+        options = {"idempotency_key": idempotency_key} if idempotency_key else {}
+        self.breaker.before()
+        for attempt in range(self.retries + 1):
+            try:
+                result = method(*args, params=params, options=options)
+            except stripe.StripeError as exc:
+                if not _is_transient(exc):
+                    # Stripe respondió (tarjeta rechazada, estado inválido...): no es una caída
+                    self.breaker.success()
+                    raise PaymentError(exc.user_message or str(exc)) from exc
+                if attempt == self.retries:
+                    self.breaker.failure()
+                    raise PaymentError(str(exc)) from exc
+                time.sleep(self.backoff * 2 ** attempt)
+            except Exception:
+                self.breaker.failure()
+                raise
+            else:
+                self.breaker.success()
+                return dict(result)
+
+    def create_intent(self, amount, metadata, currency="eur"):
+        return self._call(
+            self.client.payment_intents.create,
+            idempotency_key=_new_key(),
+            amount=amount,
+            currency=currency,
+            capture_method="manual",
+            automatic_payment_methods={"enabled": True},
+            metadata=metadata,
+        )
+
+    def modify_intent(self, intent_id, amount, metadata):
+        return self._call(
+            self.client.payment_intents.update, intent_id,
+            idempotency_key=_new_key(), amount=amount, metadata=metadata,
+        )
+
+    def retrieve_intent(self, intent_id):
+        return self._call(self.client.payment_intents.retrieve, intent_id)
+
+    def capture(self, intent_id):
+        return self._call(self.client.payment_intents.capture, intent_id, idempotency_key=f"capture-{intent_id}")
+
+    def cancel(self, intent_id):
+        return self._call(self.client.payment_intents.cancel, intent_id, idempotency_key=f"cancel-{intent_id}")
+
+    def refund(self, intent_id):
+        return self._call(self.client.refunds.create, idempotency_key=f"refund-{intent_id}", payment_intent=intent_id)
+
+
+class FakeGateway(PaymentGateway):
+    """In-memory gateway for tests and load runs without network access.
+
+    Los intents nacen ya autorizados (``requires_capture``), como si el
+    cliente hubiera confirmado la tarjeta en el navegador. ``fail`` hace
+    fallar las llamadas a un método, p. ej. ``{"capture": PaymentError()}``;
+    ``calls`` registra ``(método, intent_id)``.
+    """
+
+    initial_status = "requires_capture"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.intents = {}
+            self.calls = []
+            self.fail = {}
+            self._ids = itertools.count(1)
+
+    def add(self, intent_id: str, amount: int, status: str | None = None, metadata: dict | None = None) -> dict:
+        with self._lock:
+            intent = self.intents[intent_id] = {
+                "id": intent_id,
+                "status": status or self.initial_status,
+                "amount": amount,
+                "client_secret": f"{intent_id}_secret_fake",
+                "metadata": dict(metadata or {}),
+            }
+            return dict(intent)
+
+    def _op(self, method, intent_id, allowed, new_status=None, **changes) -> dict:
+        with self._lock:
+            self.calls.append((method, intent_id))
+            if method in self.fail:
+                raise self.fail[method]
+            intent = self.intents.get(intent_id)
+            if intent is None:
+                raise PaymentError(f"No such payment_intent: {intent_id}")
+            if intent["status"] not in allowed:
+                raise PaymentError(f"Cannot {method} a PaymentIntent with status {intent['status']}")
+            intent.update(changes)
+            if new_status:
+                intent["status"] = new_status
+            return dict(intent)
+
+    def create_intent(self, amount, metadata, currency="eur"):
+        with self._lock:
+            intent_id = f"pi_fake_{next(self._ids)}"
+            self.calls.append(("create", intent_id))
+            if "create" in self.fail:
+                raise self.fail["create"]
+        return self.add(intent_id, amount, metadata=metadata)
+
+    def modify_intent(self, intent_id, amount, metadata):
+        return self._op(
+            "modify", intent_id, ("requires_payment_method", "requires_confirmation", "requires_action", "requires_capture"),
+            amount=amount, metadata=dict(metadata),
+        )
+
+    def retrieve_intent(self, intent_id):
+        return self._op("retrieve", intent_id, (
+            "requires_payment_method", "requires_confirmation", "requires_action",
+            "processing", "requires_capture", "succeeded", "canceled",
+        ))
+
+    def capture(self, intent_id):
+        return self._op("capture", intent_id, ("requires_capture",), "succeeded")
+
+    def cancel(self, intent_id):
+        return self._op(
+            "cancel", intent_id,
+            ("requires_payment_method", "requires_confirmation", "requires_action", "requires_capture"), "canceled",
+        )
+
+    def refund(self, intent_id):
+        intent = self._op("refund", intent_id, ("succeeded",), refunded=True)
+        return {"id": f"re_{intent_id}", "payment_intent": intent_id, "amount": intent["amount"], "status": "succeeded"}
+
+
+GATEWAYS = {
+    "stripe": StripeGateway,
+    "fake": FakeGateway,
+}
+
+_gateways: dict = {}
+
+
+def get_gateway() -> PaymentGateway:
+    """Shared gateway instance for the configured ``PAYMENT_GATEWAY``."""
+    name = getattr(settings, "PAYMENT_GATEWAY", "stripe") or "stripe"
+    key = (name, settings.STRIPE_SECRET_KEY, getattr(settings, "STRIPE_API_BASE", ""))
+    if key not in _gateways:
+        _gateways[key] = (GATEWAYS.get(name) or import_string(name))()
+    return _gateways[key]
@@ -0,0 +1,149 @@
+"""Reservas de stock con caducidad entre ``checkout_payment`` y ``checkout_confirm``.
+
+``reserve`` descuenta las unidades del stock con el mismo UPDATE condicional
+que la confirmación (``Product.take_stock``) y guarda una fila por producto
+con ``expires_at``. La confirmación solo tiene que convertir la reserva
+(borrar sus filas vivas); no vuelve a pelear por el stock.
+
+Mientras una reserva caducada no se devuelva, su producto sigue pareciendo
+agotado. Se devuelven con ``release_expired``:
+
+- en bloque, con ``release_reservations --loop`` corriendo como proceso
+  aparte (cada ``CHECKOUT_RESERVATION_SWEEP_INTERVAL`` segundos) y un lote
+  en cada nueva reserva;
+- las de los productos afectados justo antes de mirar su stock al añadir o
+  cambiar líneas del carrito (``release_expired(product_ids=...)``).
+"""
+from __future__ import annotations
+
+import secrets
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.models import Product
+from .models import StockReservation
+
+SESSION_KEY = "reservation_key"
+
+
+def ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "CHECKOUT_RESERVATION_TTL", 15 * 60)))
+
+
+def new_key() -> str:
+    return secrets.token_hex(16)
+
+
+def live(key: str | None, now=None) -> dict:
+    """``{product_id: quantity}`` still held under `key`."""
+    if not key:
+        return {}
+    rows = StockReservation.objects.filter(key=key, expires_at__gt=now or timezone.now())
+    held = defaultdict(int)
+    for pid, quantity in rows.values_list("product_id", "quantity"):
+        held[pid] += quantity
+    return dict(held)
+
+
+def _give_back(rows) -> int:
+    """Delete reservation rows ``(id, product_id, quantity)`` and return their units."""
+    if not rows:
+        return 0
+    back = defaultdict(int)
+    for _pk, pid, quantity in rows:
+        back[pid] += quantity
+    deleted, _ = StockReservation.objects.filter(pk__in=[pk for pk, _pid, _q in rows]).delete()
+    Product.return_stock(back)
+    return deleted
+
+
+def release(key: str | None) -> int:
+    """Give back everything reserved under `key` (live or expired)."""
+    if not key:
+        return 0
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update().filter(key=key).values_list("pk", "product_id", "quantity")
+        )
+        return _give_back(rows)
+
+
+def reserve(key: str, quantities: dict) -> bool:
+    """Hold `quantities` under `key` for ``ttl()``, replacing a previous hold.
+
+    Returns False, without holding anything, when some product does not
+    have enough stock.
+    """
+    release_expired(limit=_batch_size())
+    with transaction.atomic():
+        release(key)
+        if not Product.take_stock(quantities):
+            transaction.set_rollback(True)
+            return False
+        expires = timezone.now() + ttl()
+        StockReservation.objects.bulk_create([
+            StockReservation(key=key, product_id=pid, quantity=q, expires_at=expires)
+            for pid, q in quantities.items() if q > 0
+        ])
+    return True
+
+
+class _Incomplete(Exception):
+    pass
+
+
+def convert(key: str | None, quantities: dict) -> bool:
+    """Turn the live hold of `key` into a sale of exactly `quantities`.
+
+    The units already left the stock, so converting is just deleting the
+    rows. False when the hold expired (or differs), and the caller has to
+    take the stock again. Call it inside the order transaction.
+    """
+    if not key:
+        return False
+    now = timezone.now()
+    wanted = {pid: q for pid, q in quantities.items() if q > 0}
+    rows = list(StockReservation.objects.filter(key=key, expires_at__gt=now).values_list("pk", "product_id", "quantity"))
+    if {pid: q for _pk, pid, q in rows} != wanted or len(rows) != len(wanted):
+        return False
+    try:
+        with transaction.atomic():
+            deleted, _ = StockReservation.objects.filter(pk__in=[pk for pk, _pid, _q in rows]).delete()
+            if deleted != len(rows):
+                # El barrendero se llevó alguna fila entre medias: no hay reserva entera
+                raise _Incomplete
+    except _Incomplete:
+        return False
+    return True
+
+
+def _batch_size() -> int:
+    return int(getattr(settings, "CHECKOUT_RESERVATION_BATCH_SIZE", 200))
+
+
+def release_expired(limit: int | None = None, product_ids=None) -> int:
+    """Give back expired holds in batches.
+
+    ``limit`` caps the rows per call; ``product_ids`` restricts the sweep to
+    those products (before checking their stock).
+    """
+    size = _batch_size()
+    expired = StockReservation.objects.filter(expires_at__lte=timezone.now())
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=list(product_ids))
+    released = 0
+    while limit is None or released < limit:
+        with transaction.atomic():
+            rows = list(
+                expired.select_for_update(skip_locked=True)
+                .order_by("expires_at")
+                .values_list("pk", "product_id", "quantity")[:size]
+            )
+            released += _give_back(rows)
+        if len(rows) < size:
+            break
+    return released
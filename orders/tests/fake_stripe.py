@@ -0,0 +1,108 @@
+"""Servidor HTTP local con lo mínimo de la API de PaymentIntents de Stripe.
+
+Sirve para probar ``StripeGateway`` de verdad (cliente HTTP, reintentos,
+idempotencia) sin salir a la red: basta con apuntar ``STRIPE_API_BASE`` a
+``FakeStripe.url``.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeStripe(ThreadingHTTPServer):
+    """In-memory PaymentIntents behind a real socket.
+
+    ``hold_capture`` deja colgada la captura de ese intent hasta que se
+    llame a ``release``, para simular una llamada lenta a Stripe;
+    ``fail_capture`` la rechaza como haría una tarjeta denegada y ``errors``
+    (``{"capture": [500, 500]}``) responde esos códigos antes de atender.
+    ``log`` guarda ``(método, ruta, Idempotency-Key)`` de cada petición.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, intents=None, hold_capture=None, fail_capture=()):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.intents = intents if intents is not None else {}
+        self.hold_capture = hold_capture
+        self.fail_capture = set(fail_capture)
+        self.errors = {}
+        self.log = []
+        self.capturing = threading.Event()
+        self.release = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self, testcase):
+        """Serve in a thread until `testcase` finishes."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        testcase.addCleanup(self.server_close)
+        testcase.addCleanup(self.shutdown)
+        testcase.addCleanup(self.release.set)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, intent_id, error=None, status=200):
+        intent = self.server.intents.get(intent_id)
+        if intent is None and not error:
+            error, status = "No such payment_intent", 404
+        body = json.dumps(
+            {"error": {"type": "invalid_request_error", "message": error}} if error
+            else {"id": intent_id, "object": "payment_intent", **intent}
+        ).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _scripted_error(self, action):
+        self.server.log.append((self.command, self.path.split("?")[0], self.headers.get("Idempotency-Key")))
+        pending = self.server.errors.get(action)
+        return pending.pop(0) if pending else None
+
+    def do_GET(self):
+        intent_id = self.path.split("?")[0].rsplit("/", 1)[-1]
+        status = self._scripted_error("retrieve")
+        if status:
+            return self._reply(intent_id, "Stripe error", status)
+        self._reply(intent_id)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode())
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2:
+            intent_id = f"pi_{len(self.server.intents) + 1}"
+            action = "create"
+        else:
+            intent_id = parts[2]
+            action = parts[3] if len(parts) == 4 else "modify"
+        status = self._scripted_error(action)
+        if status:
+            return self._reply(intent_id, "Stripe error", status)
+        if action == "capture" and intent_id == self.server.hold_capture:
+            self.server.capturing.set()
+            self.server.release.wait(10)
+        if action == "capture" and intent_id in self.server.fail_capture:
+            return self._reply(intent_id, "Your card was declined.", 402)
+        if action == "create":
+            self.server.intents[intent_id] = {
+                "status": "requires_payment_method", "client_secret": f"{intent_id}_secret",
+            }
+        intent = self.server.intents.get(intent_id)
+        if intent is not None:
+            if "amount" in form:
+                intent["amount"] = int(form["amount"][0])
+            if action in ("capture", "cancel"):
+                intent["status"] = {"capture": "succeeded", "cancel": "canceled"}[action]
+        self._reply(intent_id)
@@ -1,20 +1,23 @@
 from __future__ import annotations
 
 from decimal import Decimal
-from unittest.mock import patch
 
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from catalog.models import Category, Product
 from cart.utils import get_or_create_cart
+from orders import payments
 from orders.models import Order
 
 
-@override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+@override_settings(CART_ANONYMOUS_STORAGE="db")
+@override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
 class CheckoutFlowTests(TestCase):
 	def setUp(self):
 		self.client = Client()
+		self.gateway = payments.get_gateway()
+		self.gateway.reset()
 		self.parent = Category.objects.create(name="Perros")
 		self.sub = Category.objects.create(name="Accesorios", parent=self.parent)
 		self.p1 = Product.objects.create(
@@ -30,7 +33,7 @@ class CheckoutFlowTests(TestCase):
 		)
 
 	def _create_cart_with_item(self):
-		_ = self.client.get("/")
+		self.client.session.save()  # visitar la portada ya no crea sesión
 		req = self.client.request().wsgi_request
 		cart = get_or_create_cart(req)
 		cart.items.create(product=self.p1, quantity=2, unit_price=self.p1.price, subtotal=Decimal("30.00"))
@@ -38,10 +41,8 @@ class CheckoutFlowTests(TestCase):
 		self.client.session.save()
 		return cart
 
-	@patch("orders.views.stripe.PaymentIntent.create")
-	def test_payment_step_creates_intent_and_renders_elements(self, mock_create):
+	def test_payment_step_creates_intent_and_renders_elements(self):
 		cart = self._create_cart_with_item()
-		mock_create.return_value = type("PI", (), {"id": "pi_123", "client_secret": "cs_123"})
 		url = reverse("orders:checkout_payment")
 		payload = {
 			"email": "test@example.com",
@@ -56,15 +57,13 @@ class CheckoutFlowTests(TestCase):
 		res = self.client.post(url, data=payload)
 		self.assertEqual(res.status_code, 200)
 		self.assertIn("stripe_client_secret", res.context)
-		self.assertEqual(res.context["stripe_client_secret"], "cs_123")
-		mock_create.assert_called_once()
+		pi_id = self.client.session["payment_intent_id"]
+		self.assertEqual(res.context["stripe_client_secret"], self.gateway.intents[pi_id]["client_secret"])
+		self.assertEqual(self.gateway.intents[pi_id]["amount"], 3000)
+		self.assertEqual([c for c in self.gateway.calls if c[0] == "create"], [("create", pi_id)])
 
-	@patch("orders.views.stripe.PaymentIntent.capture")
-	@patch("orders.views.stripe.PaymentIntent.retrieve")
-	@patch("orders.views.stripe.PaymentIntent.create")
-	def test_confirm_captures_and_creates_order(self, mock_create, mock_retrieve, mock_capture):
+	def test_confirm_captures_and_creates_order(self):
 		cart = self._create_cart_with_item()
-		mock_create.return_value = type("PI", (), {"id": "pi_456", "client_secret": "cs_456"})
 		pay_url = reverse("orders:checkout_payment")
 		payload = {
 			"email": "buyer@example.com",
@@ -82,11 +81,6 @@ class CheckoutFlowTests(TestCase):
 		pi_id = session.get("payment_intent_id")
 		self.assertIsNotNone(pi_id)
 
-		mock_retrieve.return_value = {
-			"id": pi_id,
-			"status": "requires_capture",
-			"amount": int(cart.total * 100),
-		}
 		confirm_url = reverse("orders:checkout_confirm")
 		res2 = self.client.get(confirm_url)
 		self.assertEqual(res2.status_code, 200)
@@ -95,4 +89,65 @@ class CheckoutFlowTests(TestCase):
 		self.assertEqual(order.total, cart.total)
 		self.p1.refresh_from_db()
 		self.assertEqual(self.p1.stock, 3)
-		mock_capture.assert_called()
+		self.assertEqual(self.gateway.intents[pi_id]["status"], "succeeded")
+
+	def test_resubmitting_the_form_reuses_the_intent(self):
+		cart = self._create_cart_with_item()
+		pay_url = reverse("orders:checkout_payment")
+		payload = {
+			"email": "typo@example.com", "ship_name": "Typo", "ship_street": "Calle 1", "ship_number": "10",
+			"ship_city": "Madrid", "ship_postal_code": "28001", "ship_country": "ES",
+		}
+		first = self.client.post(pay_url, data=payload)
+		pi_id = self.client.session["payment_intent_id"]
+		# Como en Stripe, hasta que el cliente confirme la tarjeta el intent admite cambios
+		self.gateway.intents[pi_id]["status"] = "requires_payment_method"
+		res = self.client.post(pay_url, data=dict(payload, ship_street="Calle 2"))
+		self.assertEqual(res.context["stripe_client_secret"], first.context["stripe_client_secret"])
+		self.assertEqual(self.gateway.calls, [("create", pi_id), ("retrieve", pi_id)])
+
+		# Cambia el importe: se modifica el mismo intent
+		cart.items.update(quantity=3, subtotal=Decimal("45.00"))
+		cart.recalc_total()
+		res = self.client.post(pay_url, data=payload)
+		self.assertEqual(self.client.session["payment_intent_id"], pi_id)
+		self.assertEqual(self.gateway.calls[2:], [("retrieve", pi_id), ("modify", pi_id)])
+		self.assertEqual(self.gateway.intents[pi_id]["amount"], 4500)
+
+		# Si ya no admite cambios se anula y se crea otro
+		self.gateway.fail["modify"] = payments.PaymentError("payment_intent_unexpected_state")
+		cart.items.update(quantity=1, subtotal=Decimal("15.00"))
+		cart.recalc_total()
+		res = self.client.post(pay_url, data=payload)
+		new_id = self.client.session["payment_intent_id"]
+		self.assertNotEqual(new_id, pi_id)
+		self.assertEqual(res.context["stripe_client_secret"], self.gateway.intents[new_id]["client_secret"])
+		self.assertEqual(self.gateway.intents[pi_id]["status"], "canceled")
+
+		del self.gateway.calls[:]
+		self.assertEqual(self.client.get(reverse("orders:checkout_confirm")).status_code, 200)
+		self.assertEqual(self.gateway.calls, [("retrieve", new_id), ("capture", new_id)])
+		self.assertNotIn("payment_intent", self.client.session)
+
+	def test_resubmitting_after_the_intent_left_the_editable_states_creates_another(self):
+		self._create_cart_with_item()
+		pay_url = reverse("orders:checkout_payment")
+		payload = {
+			"email": "r@example.com", "ship_name": "R", "ship_street": "Calle 1", "ship_number": "1",
+			"ship_city": "Madrid", "ship_postal_code": "28001", "ship_country": "ES",
+		}
+		self.client.post(pay_url, data=payload)
+		authorized = self.client.session["payment_intent_id"]
+		# Mismo importe y metadata, pero la tarjeta ya se autorizó: se anula y se crea otro
+		res = self.client.post(pay_url, data=payload)
+		second = self.client.session["payment_intent_id"]
+		self.assertNotEqual(second, authorized)
+		self.assertEqual(self.gateway.intents[authorized]["status"], "canceled")
+		self.assertEqual(res.context["stripe_client_secret"], self.gateway.intents[second]["client_secret"])
+
+		# Cancelado por su cuenta (p. ej. caducó): otro nuevo, sin más llamadas
+		self.gateway.intents[second]["status"] = "canceled"
+		del self.gateway.calls[:]
+		self.client.post(pay_url, data=payload)
+		third = self.client.session["payment_intent_id"]
+		self.assertEqual(self.gateway.calls, [("retrieve", second), ("create", third)])
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart.models import Cart
+from catalog.models import Category, Product
+from core.models import EmailOutbox
+from orders.models import Order
+
+
+@override_settings(STRIPE_SECRET_KEY="", STRIPE_PUBLISHABLE_KEY="")
+class ConfirmBulkWritesTests(TestCase):
+    def setUp(self):
+        self.cat = Category.objects.create(name="Confirmación")
+        self.products = [
+            Product.objects.create(
+                name=f"Juguete {i}", description="", price=Decimal("4.00"), stock=3,
+                category=self.cat, image_url=f"https://example.com/juguete-{i}.jpg",
+            )
+            for i in range(3)
+        ]
+
+    def _checkout(self, products, quantity=1):
+        for p in products:
+            self.client.post(
+                reverse("cart:add"), data=json.dumps({"product_id": p.id, "quantity": quantity}),
+                content_type="application/json",
+            )
+        s = self.client.session
+        s["checkout_email"] = "bulk@example.com"
+        s["checkout_ship"] = {"name": "Bulk"}
+        s.save()
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse("orders:checkout_confirm"))
+        return res, len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_items(self):
+        res, one = self._checkout(self.products[:1])
+        self.assertEqual(res.status_code, 200)
+        self.client.cookies.clear()
+        res, three = self._checkout(self.products)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(one, three)
+
+        order = Order.objects.latest("id")
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(order.total, Decimal("12.00"))
+        self.assertEqual(
+            list(Product.objects.filter(category=self.cat).order_by("id").values_list("stock", flat=True)),
+            [1, 2, 2],
+        )
+
+    def test_last_units_mark_the_product_sold_out(self):
+        res, _ = self._checkout(self.products[:1], quantity=3)
+        self.assertEqual(res.status_code, 200)
+        p = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((p.stock, p.status), (0, Product.Status.SOLD_OUT))
+
+    def test_failed_decrement_rolls_back_the_order(self):
+        with patch("catalog.models.Product.take_stock", return_value=False):
+            res, _ = self._checkout(self.products[:2])
+        self.assertRedirects(res, reverse("orders:checkout_start"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(EmailOutbox.objects.exists())
+        self.assertEqual(Cart.objects.get().item_count, 2)
+
+
+class TakeStockTests(TestCase):
+    def setUp(self):
+        cat = Category.objects.create(name="Stock")
+        self.a = Product.objects.create(
+            name="A", description="", price=1, stock=2, category=cat, image_url="https://example.com/a.jpg",
+        )
+        self.b = Product.objects.create(
+            name="B", description="", price=1, stock=5, category=cat, image_url="https://example.com/b.jpg",
+        )
+
+    def test_conditional_update_reports_shortfall(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(Product.take_stock({self.a.pk: 2, self.b.pk: 1}))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.stock, self.a.status, self.b.stock), (0, Product.Status.SOLD_OUT, 4))
+
+        with transaction.atomic():
+            self.assertFalse(Product.take_stock({self.a.pk: 1, self.b.pk: 1}))
+            transaction.set_rollback(True)
+        self.b.refresh_from_db()
+        self.assertEqual(self.b.stock, 4)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import threading
+from decimal import Decimal
+
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Category, Product
+from core.models import EmailOutbox
+from orders.models import Order
+from orders.tests.fake_stripe import FakeStripe
+
+
+@override_settings(PAYMENT_GATEWAY="stripe", STRIPE_SECRET_KEY="sk_test_fake", STRIPE_PUBLISHABLE_KEY="pk_test_fake")
+class ConfirmAgainstFakeStripeTests(TransactionTestCase):
+    def setUp(self):
+        cat = Category.objects.create(name="Carrera")
+        self.product = Product.objects.create(
+            name="Último rascador", description="", price=Decimal("25.00"), stock=1,
+            category=cat, image_url="https://example.com/rascador.jpg",
+        )
+        self.server = FakeStripe(
+            {
+                "pi_a": {"status": "requires_capture", "amount": 2500},
+                "pi_b": {"status": "requires_capture", "amount": 2500},
+            },
+            hold_capture="pi_a",
+        )
+        self.server.start(self)
+        self.enterContext(override_settings(STRIPE_API_BASE=self.server.url))
+
+    def _buyer(self, intent_id):
+        client = Client()
+        client.post(
+            reverse("cart:add"), data=json.dumps({"product_id": self.product.pk, "quantity": 1}),
+            content_type="application/json",
+        )
+        session = client.session
+        session["checkout_email"] = f"{intent_id}@example.com"
+        session["checkout_ship"] = {"name": intent_id}
+        session["checkout_payment_method"] = Order.PaymentMethod.CARD
+        session["payment_intent_id"] = intent_id
+        session.save()
+        return client
+
+    def test_two_buyers_for_the_last_unit(self):
+        first, second = self._buyer("pi_a"), self._buyer("pi_b")
+        results = {}
+
+        def confirm():
+            try:
+                results["a"] = first.get(reverse("orders:checkout_confirm"))
+            finally:
+                connections.close_all()
+
+        worker = threading.Thread(target=confirm)
+        worker.start()
+        self.assertTrue(self.server.capturing.wait(10))
+
+        # Con la captura de A todavía en vuelo la base de datos no está bloqueada:
+        # B confirma, se encuentra sin stock y su autorización se anula.
+        res = second.get(reverse("orders:checkout_confirm"))
+        self.assertRedirects(res, reverse("orders:checkout_start"), fetch_redirect_response=False)
+        self.assertEqual(self.server.intents["pi_b"]["status"], "canceled")
+
+        self.server.release.set()
+        worker.join(10)
+        self.assertEqual(results["a"].status_code, 200)
+        self.assertEqual(self.server.intents["pi_a"]["status"], "succeeded")
+        order = Order.objects.get()
+        self.assertEqual((order.contact_email, order.status), ("pi_a@example.com", Order.Status.RECEIVED))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.status), (0, Product.Status.SOLD_OUT))
+        # El correo se retuvo durante la captura y sale una vez cobrado
+        self.assertEqual(EmailOutbox.objects.get().status, EmailOutbox.Status.PENDING)
+
+    def test_failed_capture_cancels_the_order_and_returns_the_stock(self):
+        self.server.hold_capture = None
+        self.server.fail_capture.add("pi_a")
+        buyer = self._buyer("pi_a")
+
+        res = buyer.get(reverse("orders:checkout_confirm"))
+        self.assertRedirects(res, reverse("orders:checkout_payment"), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.get().status, Order.Status.CANCELED)
+        # La autorización se anula: el dinero no queda retenido hasta que caduque
+        self.assertEqual(self.server.intents["pi_a"]["status"], "canceled")
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.status), (1, Product.Status.AVAILABLE))
+        self.assertFalse(EmailOutbox.objects.exists())
+        # El carrito sigue intacto para reintentar el pago
+        self.assertEqual(buyer.get(reverse("cart:state")).json()["item_count"], 1)
@@ -1,12 +1,13 @@
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from catalog.models import Category, Product
 from cart.utils import get_or_create_cart
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 class CheckoutStartIntegrationTest(TestCase):
     def setUp(self):
         self.parent = Category.objects.create(name="Perros")
@@ -24,7 +25,7 @@ class CheckoutStartIntegrationTest(TestCase):
         )
 
     def test_checkout_start_renders_when_cart_has_items(self):
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.product, quantity=1, unit_price=self.product.price, subtotal=self.product.price)
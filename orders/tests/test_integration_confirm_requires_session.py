@@ -9,6 +9,7 @@ from catalog.models import Category, Product
 from cart.utils import get_or_create_cart
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 @override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
 class ConfirmRequiresSessionIntegrationTest(TestCase):
     def setUp(self):
@@ -26,7 +27,7 @@ class ConfirmRequiresSessionIntegrationTest(TestCase):
         )
 
     def _cart_with_item(self):
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.p, quantity=1, unit_price=self.p.price, subtotal=self.p.price)
@@ -10,6 +10,7 @@ from cart.utils import get_or_create_cart
 from orders.models import Order
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 @override_settings(STRIPE_SECRET_KEY="", STRIPE_PUBLISHABLE_KEY="")
 class PostOrderStateIntegrationTest(TestCase):
     def setUp(self):
@@ -27,7 +28,7 @@ class PostOrderStateIntegrationTest(TestCase):
         )
 
     def _cart_with_qty(self, qty: int):
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.p, quantity=qty, unit_price=self.p.price, subtotal=self.p.price * qty)
@@ -48,7 +49,7 @@ class PostOrderStateIntegrationTest(TestCase):
         order = Order.objects.first()
         self.assertEqual(order.total, cart.total)
 
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req2 = self.client.request().wsgi_request
         cart2 = get_or_create_cart(req2)
         self.assertFalse(cart2.items.exists())
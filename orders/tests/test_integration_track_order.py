@@ -25,20 +25,22 @@ class TrackOrderIntegrationTest(TestCase):
         )
 
     def test_track_order_found_shows_order_details(self):
-        order = Order.objects.create(
-            user=None,
-            contact_email="buyer@example.com",
-            total=Decimal("19.99"),
-            status=Order.Status.RECEIVED,
-            ship_name="Buyer",
-            ship_street="Calle 1",
-            ship_number="1",
-            ship_floor="",
-            ship_city="Madrid",
-            ship_postal_code="28001",
-            ship_country="ES",
-            payment_method=Order.PaymentMethod.CARD,
-        )
+        # El pedido entra en el índice de seguimiento al confirmarse la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                user=None,
+                contact_email="buyer@example.com",
+                total=Decimal("19.99"),
+                status=Order.Status.RECEIVED,
+                ship_name="Buyer",
+                ship_street="Calle 1",
+                ship_number="1",
+                ship_floor="",
+                ship_city="Madrid",
+                ship_postal_code="28001",
+                ship_country="ES",
+                payment_method=Order.PaymentMethod.CARD,
+            )
         OrderItem.objects.create(
             order=order,
             product=self.prod,
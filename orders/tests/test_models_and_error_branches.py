@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 from decimal import Decimal
-from unittest.mock import patch
 
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from catalog.models import Category, Product
+from orders import payments
 from orders.models import Order, OrderItem
 from orders.apps import _seed_orders_if_empty
 from django.test import override_settings
@@ -74,6 +74,7 @@ class OrdersAppsSeedTests(TestCase):
         self.assertTrue(Order.objects.exists())
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 class OrdersViewsErrorBranchesTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -92,7 +93,7 @@ class OrdersViewsErrorBranchesTests(TestCase):
 
     def _add_cart(self, qty=1):
         from cart.utils import get_or_create_cart
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.p, quantity=qty, unit_price=self.p.price, subtotal=self.p.price * qty)
@@ -116,16 +117,14 @@ class OrdersViewsErrorBranchesTests(TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertContains(res, "Claves de Stripe no configuradas")
 
-    @override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
-    @patch("orders.views.stripe.PaymentIntent.retrieve")
-    def test_checkout_confirm_missing_pi_in_session_redirects(self, mock_retrieve):
+    @override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+    def test_checkout_confirm_missing_pi_in_session_redirects(self):
         self._add_cart(1)
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 302)
 
-    @override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
-    @patch("orders.views.stripe.PaymentIntent.retrieve")
-    def test_checkout_confirm_amount_mismatch_redirects(self, mock_retrieve):
+    @override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+    def test_checkout_confirm_amount_mismatch_redirects(self):
         cart = self._add_cart(1)
         # prepare session values
         session = self.client.session
@@ -133,19 +132,18 @@ class OrdersViewsErrorBranchesTests(TestCase):
         session["checkout_ship"] = {"name": "A"}
         session["payment_intent_id"] = "pi_x"
         session.save()
-        mock_retrieve.return_value = {"id": "pi_x", "status": "requires_capture", "amount": int(cart.total * 100) + 100}
+        payments.get_gateway().add("pi_x", int(cart.total * 100) + 100)
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 302)
 
-    @override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
-    @patch("orders.views.stripe.PaymentIntent.retrieve")
-    def test_checkout_confirm_status_not_ready_redirects(self, mock_retrieve):
+    @override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+    def test_checkout_confirm_status_not_ready_redirects(self):
         cart = self._add_cart(1)
         session = self.client.session
         session["checkout_email"] = "a@b.com"
         session["checkout_ship"] = {"name": "A"}
         session["payment_intent_id"] = "pi_y"
         session.save()
-        mock_retrieve.return_value = {"id": "pi_y", "status": "processing", "amount": int(cart.total * 100)}
+        payments.get_gateway().add("pi_y", int(cart.total * 100), status="processing")
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 302)
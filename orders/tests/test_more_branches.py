@@ -8,6 +8,7 @@ from django.urls import reverse
 from catalog.models import Category, Product
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 class OrdersMoreBranchesTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -37,7 +38,7 @@ class OrdersMoreBranchesTests(TestCase):
         self.client.login(email="x@y.com", password="p")
         # ensure cart has items
         from cart.utils import get_or_create_cart
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.p, quantity=1, unit_price=self.p.price, subtotal=self.p.price)
@@ -52,7 +53,7 @@ class OrdersMoreBranchesTests(TestCase):
         # add 2 units then reduce stock to 1 to force adjustment
         from cart.utils import get_or_create_cart
 
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.p, quantity=2, unit_price=self.p.price, subtotal=self.p.price * 2)
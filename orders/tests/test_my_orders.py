@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.models import Category, Product
+from orders.models import Order, OrderItem
+
+
+@override_settings(ORDERS_PAGE_SIZE=3)
+class MyOrdersTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email="cliente@example.com", password="x")
+        self.other = User.objects.create_user(email="otro@example.com", password="x")
+        cat = Category.objects.create(name="Historial")
+        self.product = Product.objects.create(
+            name="Pelota", description="", price=Decimal("3.00"), stock=50,
+            category=cat, image_url="https://example.com/pelota.jpg",
+        )
+        self.client.force_login(self.user)
+
+    def _order(self, user, created_at, items=1):
+        order = Order.objects.create(
+            user=user, contact_email=user.email, total=Decimal("3.00") * items, ship_name="C",
+            ship_street="Calle", ship_number="1", ship_city="León", ship_postal_code="24001",
+            ship_country="ES", payment_method=Order.PaymentMethod.CARD,
+        )
+        # created_at es auto_now_add: se fija después para controlar el orden
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=self.product, product_name=f"Pelota {i}", quantity=1,
+                unit_price=Decimal("3.00"), subtotal=Decimal("3.00"),
+            )
+            for i in range(items)
+        ])
+        return order
+
+    def _pages(self):
+        url, pages = reverse("orders:my_orders"), []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            pages.append([o.pk for o in res.context["orders"]])
+            cursor = res.context["next_cursor"]
+            url = f"{reverse('orders:my_orders')}?after={cursor}" if cursor else None
+        return pages
+
+    def test_pages_walk_the_history_newest_first_without_gaps(self):
+        now = timezone.now()
+        # Dos pedidos con el mismo created_at: el id deshace el empate
+        same = now - timedelta(days=2)
+        expected = [
+            self._order(self.user, now - timedelta(days=d) if d != 2 else same).pk
+            for d in (5, 1, 2, 4, 3, 0)
+        ] + [self._order(self.user, same).pk]
+        self._order(self.other, now)
+        ordered = sorted(
+            Order.objects.filter(pk__in=expected).values_list("created_at", "pk"), reverse=True,
+        )
+
+        pages = self._pages()
+
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), [pk for _, pk in ordered])
+
+    def test_items_are_rendered_from_the_prefetch(self):
+        self._order(self.user, timezone.now(), items=2)
+        res = self.client.get(reverse("orders:my_orders"))
+        self.assertContains(res, "1 x Pelota 0")
+        self.assertContains(res, "1 x Pelota 1")
+        self.assertIsNone(res.context["next_cursor"])
+
+    def test_query_count_does_not_grow_with_orders_or_items(self):
+        now = timezone.now()
+        for d in range(4):
+            self._order(self.user, now - timedelta(days=d), items=1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse("orders:my_orders"))
+        for d in range(4, 40):
+            self._order(self.user, now - timedelta(days=d), items=5)
+        with CaptureQueriesContext(connection) as big:
+            res = self.client.get(reverse("orders:my_orders"))
+            self.client.get(f"{reverse('orders:my_orders')}?after={res.context['next_cursor']}")
+        self.assertEqual(len(big), 2 * len(small))
+        order_selects = [q["sql"] for q in big if 'FROM "orders_order"' in q["sql"]]
+        self.assertTrue(all('"orders_order"."ship_street"' not in sql for sql in order_selects))
+
+    def test_invalid_cursor_is_rejected(self):
+        res = self.client.get(reverse("orders:my_orders"), {"after": "no-es-un-cursor"})
+        self.assertEqual(res.status_code, 400)
+
+    def test_anonymous_users_are_sent_to_login(self):
+        self.client.logout()
+        res = self.client.get(reverse("orders:my_orders"))
+        self.assertEqual(res.status_code, 302)
+        self.assertTrue(res["Location"].startswith("/login/"))
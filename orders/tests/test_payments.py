@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase, override_settings
+
+from orders import payments
+from orders.tests.fake_stripe import FakeStripe
+
+
+@override_settings(
+    PAYMENT_GATEWAY="stripe", STRIPE_SECRET_KEY="sk_test_fake", STRIPE_MAX_RETRIES=2, STRIPE_RETRY_BACKOFF=0,
+    STRIPE_BREAKER_THRESHOLD=2, STRIPE_BREAKER_RESET=60,
+)
+class StripeGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeStripe({"pi_1": {"status": "requires_capture", "amount": 1200}})
+        self.server.start(self)
+        self.enterContext(override_settings(STRIPE_API_BASE=self.server.url))
+        self.gateway = payments.get_gateway()
+
+    def test_gateway_is_shared_and_does_not_touch_the_global_key(self):
+        import stripe
+
+        self.assertIs(payments.get_gateway(), self.gateway)
+        intent = self.gateway.create_intent(1500, {"cart_id": "7"})
+        self.assertEqual((intent["amount"], intent["status"]), (1500, "requires_payment_method"))
+        self.assertEqual(self.gateway.modify_intent(intent["id"], 1800, {})["amount"], 1800)
+        self.assertIsNone(stripe.api_key)
+
+    def test_transient_errors_are_retried_with_the_same_idempotency_key(self):
+        self.server.errors["capture"] = [500, 503]
+        self.assertEqual(self.gateway.capture("pi_1")["status"], "succeeded")
+        keys = [key for method, path, key in self.server.log if path.endswith("/capture")]
+        self.assertEqual(keys, ["capture-pi_1"] * 3)
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+    def test_breaker_opens_after_repeated_outages_and_fails_fast(self):
+        self.server.errors["retrieve"] = [500] * 6
+        for _ in range(2):
+            with self.assertRaises(payments.PaymentError):
+                self.gateway.retrieve_intent("pi_1")
+        self.assertEqual(self.gateway.breaker.state, "open")
+        sent = len(self.server.log)
+        with self.assertRaises(payments.GatewayUnavailable):
+            self.gateway.retrieve_intent("pi_1")
+        self.assertEqual(len(self.server.log), sent)
+
+    def test_business_errors_are_not_retried_nor_counted(self):
+        self.server.fail_capture.add("pi_1")
+        for _ in range(3):
+            with self.assertRaises(payments.PaymentError):
+                self.gateway.capture("pi_1")
+        self.assertEqual(len(self.server.log), 3)
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_half_open_lets_one_probe_through(self):
+        now = [0.0]
+        breaker = payments.CircuitBreaker(threshold=1, reset_after=10, clock=lambda: now[0])
+        breaker.before()
+        breaker.failure()
+        with self.assertRaises(payments.GatewayUnavailable):
+            breaker.before()
+
+        now[0] = 10
+        self.assertEqual(breaker.state, "half-open")
+        breaker.before()
+        with self.assertRaises(payments.GatewayUnavailable):
+            breaker.before()
+        breaker.failure()
+        self.assertEqual(breaker.state, "open")
+
+        now[0] = 20
+        breaker.before()
+        breaker.success()
+        self.assertEqual(breaker.state, "closed")
+        breaker.before()
+
+
+@override_settings(PAYMENT_GATEWAY="fake")
+class FakeGatewayTests(SimpleTestCase):
+    def test_intents_follow_the_stripe_lifecycle(self):
+        gateway = payments.get_gateway()
+        gateway.reset()
+        intent = gateway.create_intent(900, {"reservation": "k"})
+        self.assertEqual(gateway.retrieve_intent(intent["id"])["status"], "requires_capture")
+        self.assertEqual(gateway.capture(intent["id"])["status"], "succeeded")
+        with self.assertRaises(payments.PaymentError):
+            gateway.cancel(intent["id"])
+        self.assertEqual(gateway.refund(intent["id"])["amount"], 900)
+        with self.assertRaises(payments.PaymentError):
+            gateway.retrieve_intent("pi_missing")
+
+
+class HalfGateway(payments.PaymentGateway):
+    def create_intent(self, amount, metadata, currency="eur"):
+        return {}
+
+
+class GatewayLoadingTests(SimpleTestCase):
+    @override_settings(PAYMENT_GATEWAY="orders.tests.test_payments.HalfGateway")
+    def test_incomplete_gateway_fails_when_loaded(self):
+        with self.assertRaises(TypeError):
+            payments.get_gateway()
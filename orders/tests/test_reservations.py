@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.models import Category, Product
+from orders import payments, reservations
+from orders.models import Order, StockReservation
+
+
+class StockReservationTests(TestCase):
+	def setUp(self):
+		cat = Category.objects.create(name="Reservas")
+		self.a = Product.objects.create(
+			name="Transportín", description="", price=Decimal("30.00"), stock=3,
+			category=cat, image_url="https://example.com/transportin.jpg",
+		)
+		self.b = Product.objects.create(
+			name="Manta", description="", price=Decimal("9.00"), stock=1,
+			category=cat, image_url="https://example.com/manta.jpg",
+		)
+
+	def _stock(self):
+		return tuple(Product.objects.filter(pk__in=[self.a.pk, self.b.pk]).order_by("pk").values_list("stock", flat=True))
+
+	def _expire(self, key):
+		StockReservation.objects.filter(key=key).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+	def test_reserve_holds_stock_and_replaces_previous_hold(self):
+		self.assertTrue(reservations.reserve("k1", {self.a.pk: 2, self.b.pk: 1}))
+		self.assertEqual(self._stock(), (1, 0))
+		self.assertEqual(Product.objects.get(pk=self.b.pk).status, Product.Status.SOLD_OUT)
+		# Otro comprador no puede llevarse lo reservado
+		self.assertFalse(reservations.reserve("k2", {self.b.pk: 1}))
+		self.assertFalse(StockReservation.objects.filter(key="k2").exists())
+
+		self.assertTrue(reservations.reserve("k1", {self.a.pk: 1}))
+		self.assertEqual(self._stock(), (2, 1))
+		self.assertEqual(reservations.live("k1"), {self.a.pk: 1})
+
+	def test_convert_only_a_live_matching_hold(self):
+		reservations.reserve("k1", {self.a.pk: 2})
+		self.assertFalse(reservations.convert("k1", {self.a.pk: 3}))
+		self.assertTrue(reservations.convert("k1", {self.a.pk: 2}))
+		self.assertEqual(self._stock(), (1, 1))
+		self.assertFalse(StockReservation.objects.exists())
+
+		reservations.reserve("k2", {self.a.pk: 1})
+		self._expire("k2")
+		self.assertFalse(reservations.convert("k2", {self.a.pk: 1}))
+
+	def test_sweeper_releases_expired_holds_in_bulk(self):
+		reservations.reserve("old", {self.a.pk: 2, self.b.pk: 1})
+		reservations.reserve("new", {self.a.pk: 1})
+		self._expire("old")
+		out = StringIO()
+		with override_settings(CHECKOUT_RESERVATION_BATCH_SIZE=1):
+			call_command("release_reservations", stdout=out)
+		self.assertIn("Liberadas 2 reservas caducadas", out.getvalue())
+		self.assertEqual(self._stock(), (2, 1))
+		self.assertEqual(list(StockReservation.objects.values_list("key", flat=True)), ["new"])
+
+	def test_expired_hold_does_not_block_adding_to_cart(self):
+		reservations.reserve("old", {self.b.pk: 1})
+		reservations.reserve("other", {self.a.pk: 1})
+		self._expire("old")
+		self._expire("other")
+		res = self.client.post(
+			reverse("cart:add"), data=json.dumps({"product_id": self.b.pk, "quantity": 1}),
+			content_type="application/json",
+		)
+		self.assertEqual(res.status_code, 200)
+		self.assertEqual(res.json()["item_count"], 1)
+		# Solo se devuelven las reservas del producto que se mira
+		self.assertEqual(list(StockReservation.objects.values_list("key", flat=True)), ["other"])
+		self.assertEqual(self._stock(), (2, 1))
+
+	def test_sweeper_loop_keeps_running(self):
+		reservations.reserve("old", {self.a.pk: 1})
+		self._expire("old")
+		out = StringIO()
+		with patch("orders.management.commands.release_reservations.time.sleep", side_effect=[None, KeyboardInterrupt]) as sleep:
+			with self.assertRaises(KeyboardInterrupt):
+				call_command("release_reservations", "--loop", "--interval", "7", stdout=out)
+		sleep.assert_called_with(7.0)
+		# Las pasadas sin nada que liberar no escriben
+		self.assertEqual(out.getvalue().count("Liberadas"), 1)
+		self.assertEqual(self._stock(), (3, 1))
+
+	@override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+	def test_checkout_reserves_at_payment_and_converts_at_confirm(self):
+		gateway = payments.get_gateway()
+		gateway.reset()
+		self.client.post(
+			reverse("cart:add"), data=json.dumps({"product_id": self.a.pk, "quantity": 3}),
+			content_type="application/json",
+		)
+		res = self.client.post(reverse("orders:checkout_payment"), data={
+			"email": "r@example.com", "ship_name": "R", "ship_street": "C", "ship_number": "1",
+			"ship_city": "M", "ship_postal_code": "1", "ship_country": "ES",
+		})
+		self.assertEqual(res.status_code, 200)
+		self.assertEqual(self._stock(), (0, 1))
+		key = self.client.session[reservations.SESSION_KEY]
+		intent = gateway.intents[self.client.session["payment_intent_id"]]
+		self.assertEqual((intent["amount"], intent["metadata"]["reservation"]), (9000, key))
+
+		with patch("catalog.models.Product.take_stock") as take_stock:
+			res = self.client.get(reverse("orders:checkout_confirm"))
+		self.assertEqual(res.status_code, 200)
+		take_stock.assert_not_called()
+		self.assertEqual(Order.objects.get().total, Decimal("90.00"))
+		self.assertEqual(self._stock(), (0, 1))
+		self.assertFalse(StockReservation.objects.exists())
+		self.assertNotIn(reservations.SESSION_KEY, self.client.session)
+
+	def test_failed_take_keeps_previous_stock(self):
+		with transaction.atomic():
+			self.assertFalse(reservations.reserve("k", {self.a.pk: 1, self.b.pk: 2}))
+		self.assertEqual(self._stock(), (3, 1))
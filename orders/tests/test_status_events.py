@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders import tracking
+from orders.models import Order, OrderStatusEvent
+
+
+class OrderStatusEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tracking._index.invalidate()
+        self.order = self._order()
+
+    def _order(self, **kwargs):
+        return Order.objects.create(
+            contact_email="e@example.com", total=Decimal("9.00"), ship_name="E", ship_street="Calle",
+            ship_number="1", ship_city="Soria", ship_postal_code="42001", ship_country="ES",
+            payment_method=Order.PaymentMethod.TRANSFER, **kwargs,
+        )
+
+    def _timeline(self, order):
+        return list(OrderStatusEvent.objects.timeline(order).values_list("from_status", "status"))
+
+    def test_creation_and_each_change_append_one_event(self):
+        self.order.status = Order.Status.PROCESSING
+        self.order.save(update_fields=["status", "updated_at"])
+        self.order.status = Order.Status.PROCESSING
+        self.order.save()
+        self.order.total = Decimal("10.00")
+        self.order.save(update_fields=["total"])
+        self.order.status = Order.Status.SHIPPED
+        self.order.save()
+
+        self.assertEqual(self._timeline(self.order), [
+            ("", Order.Status.RECEIVED),
+            (Order.Status.RECEIVED, Order.Status.PROCESSING),
+            (Order.Status.PROCESSING, Order.Status.SHIPPED),
+        ])
+        latest = OrderStatusEvent.objects.timeline(self.order).last()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status_changed_at, latest.created_at)
+
+    def test_changes_from_fresh_or_partial_instances_compare_with_the_stored_status(self):
+        loaded = Order.objects.get(pk=self.order.pk)
+        loaded.status = Order.Status.CANCELED
+        loaded.save()
+        partial = Order.objects.only("id", "tracking_code").get(pk=self.order.pk)
+        partial.status = Order.Status.CANCELED
+        partial.save(update_fields=["status"])
+
+        self.assertEqual(self._timeline(self.order), [
+            ("", Order.Status.RECEIVED),
+            (Order.Status.RECEIVED, Order.Status.CANCELED),
+        ])
+
+    def test_events_are_append_only(self):
+        event = OrderStatusEvent.objects.get()
+        event.status = Order.Status.DELIVERED
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_timeline_and_entered_queries_use_their_indexes(self):
+        self.order.status = Order.Status.SHIPPED
+        self.order.save()
+        other = self._order(status=Order.Status.SHIPPED)
+        now = timezone.now()
+
+        with CaptureQueriesContext(connection) as ctx:
+            entered = set(
+                OrderStatusEvent.objects.entered(Order.Status.SHIPPED, now - timedelta(hours=1), now + timedelta(hours=1))
+                .values_list("order_id", flat=True)
+            )
+            self.assertEqual(len(self._timeline(self.order)), 2)
+        self.assertEqual(entered, {self.order.pk, other.pk})
+        self.assertEqual(len(ctx), 2)
+
+        for qs, index in (
+            (OrderStatusEvent.objects.entered(Order.Status.SHIPPED, now, now), "order_status_entered_idx"),
+            (OrderStatusEvent.objects.timeline(self.order), "order_status_timeline_idx"),
+        ):
+            sql, params = qs.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                self.assertIn(index, " ".join(str(row) for row in cursor.fetchall()))
+
+    def test_tracking_page_shows_the_timeline(self):
+        self.order.status = Order.Status.SHIPPED
+        self.order.save()
+        res = self.client.post(reverse("orders:track_order"), data={"code": self.order.tracking_code})
+        self.assertContains(res, "Historial")
+        timeline = res.context["order"]["timeline"]
+        self.assertEqual([e["status_display"] for e in timeline], ["Recibido", "Enviado"])
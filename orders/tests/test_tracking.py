@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Category, Product
+from core import codes
+from orders import tracking
+from orders.models import Order, OrderItem
+
+
+class TrackingLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tracking._index.invalidate()
+        cat = Category.objects.create(name="Seguimiento")
+        self.product = Product.objects.create(
+            name="Comedero", description="", price=Decimal("7.50"), stock=5,
+            category=cat, image_url="https://example.com/comedero.jpg",
+        )
+        self.order = self._order()
+
+    def _order(self, **kwargs):
+        order = Order.objects.create(
+            contact_email="t@example.com", total=Decimal("15.00"), ship_name="T", ship_street="Calle",
+            ship_number="1", ship_city="Bilbao", ship_postal_code="48001", ship_country="ES",
+            payment_method=Order.PaymentMethod.CARD, **kwargs,
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, product_name="Comedero", quantity=2,
+            unit_price=Decimal("7.50"), subtotal=Decimal("15.00"),
+        )
+        return order
+
+    def _track(self, code):
+        return self.client.post(reverse("orders:track_order"), data={"code": code})
+
+    def test_summary_is_cached_until_the_status_changes(self):
+        tracking.get_index()
+        # Pedido, líneas e historial
+        with self.assertNumQueries(3):
+            self.assertEqual(tracking.lookup(self.order.tracking_code)["items"][0]["quantity"], 2)
+        with self.assertNumQueries(0):
+            res = self._track(self.order.tracking_code.lower())
+        self.assertContains(res, "2 x Comedero")
+        self.assertContains(res, "Recibido")
+
+        self.order.status = Order.Status.SHIPPED
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+        self.assertContains(self._track(self.order.tracking_code), "Enviado")
+
+    def test_look_alike_characters_are_folded(self):
+        code = self.order.tracking_code
+        typed = "pt-" + code[3:7] + " " + code[7:].replace("1", "l").replace("0", "O").lower()
+        self.assertEqual(tracking.lookup(typed)["tracking_code"], code)
+        self.assertEqual(tracking.normalize(" pt-demo-001 "), "PT-DEMO-001")
+
+    def test_unknown_codes_never_reach_the_database(self):
+        tracking.get_index()
+        legacy = "PT-202511-ABC12345"
+        forged = "PT-" + codes.new_code()[:-1] + "0"
+        if codes.is_valid(forged[3:]):
+            forged = forged[:-1] + "1"
+        with self.assertNumQueries(0):
+            self.assertIsNone(tracking.lookup(legacy))
+            self.assertIsNone(tracking.lookup(forged))
+            self.assertIsNone(tracking.lookup("PT-" + codes.CodeGenerator(clock=lambda: 1_750_000_000).new()))
+            # Recién emitido y con el dígito de control bien: tampoco
+            self.assertIsNone(tracking.lookup("PT-" + codes.new_code()))
+        self.assertContains(self._track(legacy), "No se ha encontrado")
+
+    def test_orders_from_other_processes_are_found(self):
+        tracking.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            other = self._order()
+        # Este proceso cargó el filtro antes de que otro creara el pedido
+        tracking._index._bloom = tracking.BloomFilter(1024)
+        tracking._index._bloom.add(self.order.tracking_code)
+        self.assertEqual(tracking.lookup(other.tracking_code)["tracking_code"], other.tracking_code)
+
+        # bulk_create no emite post_save: solo aparece al reconstruir el filtro
+        code, = Order.reserve_tracking_codes(1)
+        Order.objects.bulk_create([Order(
+            tracking_code=code, contact_email="o@example.com", total=Decimal("1.00"), ship_name="O",
+            ship_street="C", ship_number="1", ship_city="C", ship_postal_code="1", ship_country="ES",
+            payment_method=Order.PaymentMethod.TRANSFER,
+        )])
+        self.assertIsNone(tracking.lookup(code))
+        tracking._index.invalidate()
+        self.assertIsNotNone(tracking.lookup(code))
+
+    def test_the_filter_is_built_once_and_shared(self):
+        tracking.get_index()
+        with self.assertNumQueries(0):
+            fresh = tracking.TrackingIndex().ensure_fresh()
+        self.assertTrue(fresh.might_exist(self.order.tracking_code))
+
+    def test_misses_past_the_filter_are_remembered(self):
+        tracking.get_index()
+        gone = self.order.tracking_code
+        Order.objects.filter(pk=self.order.pk).update(tracking_code="PT-" + codes.new_code())
+        with self.assertNumQueries(1):
+            self.assertIsNone(tracking.lookup(gone))
+        with self.assertNumQueries(0):
+            self.assertIsNone(tracking.lookup(gone))
+
+    def test_cache_changes_wait_for_the_commit(self):
+        tracking.get_index()
+        code = self.order.tracking_code
+        tracking.lookup(code)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.order.status = Order.Status.SHIPPED
+            self.order.save()
+            other = self._order()
+        # Hasta el COMMIT se sigue viendo lo confirmado
+        self.assertEqual(tracking.lookup(code)["status"], Order.Status.RECEIVED)
+        self.assertIsNone(cache.get(tracking._known_key(other.tracking_code)))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(tracking.lookup(code)["status"], Order.Status.SHIPPED)
+        self.assertIsNotNone(cache.get(tracking._known_key(other.tracking_code)))
+
+    def test_shared_filter_is_split_under_the_item_limit(self):
+        with patch.object(tracking, "_CHUNK_BYTES", 64):
+            built = tracking.TrackingIndex()
+            built.rebuild()
+            header = cache.get(tracking._BLOOM_KEY)
+            self.assertGreater(header["chunks"], 1)
+            with self.assertNumQueries(0):
+                loaded = tracking.TrackingIndex().ensure_fresh()
+            self.assertEqual(loaded._bloom.bits, built._bloom.bits)
+            # Un trozo desalojado obliga a reconstruir, no a usar un filtro con huecos
+            cache.delete(f"{tracking._BLOOM_KEY}:{header['build']}:1")
+            with self.assertNumQueries(2):
+                tracking.TrackingIndex().ensure_fresh()
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = tracking.BloomFilter(2000, error_rate=0.01)
+        members = [f"PT-{i:06d}" for i in range(2000)]
+        for code in members:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in members))
+        false_positives = sum(f"XX-{i:06d}" in bloom for i in range(5000))
+        self.assertLess(false_positives, 150)
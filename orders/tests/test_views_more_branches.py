@@ -3,14 +3,19 @@ from __future__ import annotations
 from decimal import Decimal
 from unittest.mock import patch
 
+from django.core import mail
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from catalog.models import Category, Product
 from cart.utils import get_or_create_cart
+from core import outbox
+from core.models import EmailOutbox
+from orders import payments
 from orders.models import Order
 
 
+@override_settings(CART_ANONYMOUS_STORAGE="db")
 class OrdersViewsMoreBranchesTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -28,7 +33,7 @@ class OrdersViewsMoreBranchesTests(TestCase):
         )
 
     def _cart_with_qty(self, qty: int):
-        _ = self.client.get("/")
+        self.client.session.save()  # visitar la portada ya no crea sesión
         req = self.client.request().wsgi_request
         cart = get_or_create_cart(req)
         cart.items.create(product=self.p, quantity=qty, unit_price=self.p.price, subtotal=self.p.price * qty)
@@ -36,33 +41,58 @@ class OrdersViewsMoreBranchesTests(TestCase):
         self.client.session.save()
         return cart
 
-    @override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
-    @patch("orders.views.stripe.PaymentIntent.retrieve")
-    def test_confirm_retrieve_exception_redirects(self, mock_retrieve):
+    @override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+    def test_confirm_retrieve_exception_redirects(self):
         self._cart_with_qty(1)
         s = self.client.session
         s["checkout_email"] = "a@b.com"
         s["checkout_ship"] = {"name": "A"}
         s["payment_intent_id"] = "pi_fail"
         s.save()
-        mock_retrieve.side_effect = Exception("boom")
+        gateway = payments.get_gateway()
+        gateway.reset()
+        gateway.add("pi_fail", 2500)
+        gateway.fail["retrieve"] = payments.PaymentError("boom")
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 302)
 
-    @override_settings(STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
-    @patch("orders.views.stripe.PaymentIntent.capture")
-    @patch("orders.views.stripe.PaymentIntent.retrieve")
-    def test_confirm_capture_exception_redirects(self, mock_retrieve, mock_capture):
+    @override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+    def test_confirm_capture_exception_redirects(self):
         cart = self._cart_with_qty(1)
         s = self.client.session
         s["checkout_email"] = "a@b.com"
         s["checkout_ship"] = {"name": "A"}
         s["payment_intent_id"] = "pi_x"
         s.save()
-        mock_retrieve.return_value = {"id": "pi_x", "status": "requires_capture", "amount": int(cart.total * 100)}
-        mock_capture.side_effect = Exception("fail cap")
+        gateway = payments.get_gateway()
+        gateway.reset()
+        gateway.add("pi_x", int(cart.total * 100))
+        gateway.fail["capture"] = payments.PaymentError("fail cap")
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 302)
+        # Pedido cancelado y autorización anulada; el reintento crea otro intent
+        self.assertEqual(Order.objects.get().status, Order.Status.CANCELED)
+        self.assertEqual(gateway.intents["pi_x"]["status"], "canceled")
+        self.assertNotIn("payment_intent_id", self.client.session)
+
+    @override_settings(PAYMENT_GATEWAY="fake", STRIPE_SECRET_KEY="sk_test_dummy", STRIPE_PUBLISHABLE_KEY="pk_test_dummy")
+    def test_capture_and_void_failing_is_logged_for_reconciliation(self):
+        cart = self._cart_with_qty(1)
+        s = self.client.session
+        s["checkout_email"] = "a@b.com"
+        s["checkout_ship"] = {"name": "A"}
+        s["payment_intent_id"] = "pi_z"
+        s.save()
+        gateway = payments.get_gateway()
+        gateway.reset()
+        gateway.add("pi_z", int(cart.total * 100))
+        gateway.fail["capture"] = payments.PaymentError("fail cap")
+        gateway.fail["cancel"] = payments.PaymentError("down")
+        with self.assertLogs("orders.views", "ERROR") as logs:
+            res = self.client.get(reverse("orders:checkout_confirm"))
+        self.assertEqual(res.status_code, 302)
+        self.assertIn("pi_z", logs.output[0])
+        self.assertIn("pendiente de conciliar", logs.output[0])
 
     @override_settings(STRIPE_SECRET_KEY="", STRIPE_PUBLISHABLE_KEY="")
     def test_confirm_adjusts_but_not_empty_redirects(self):
@@ -80,8 +110,7 @@ class OrdersViewsMoreBranchesTests(TestCase):
         # redirected to start due to adjustment message
 
     @override_settings(STRIPE_SECRET_KEY="", STRIPE_PUBLISHABLE_KEY="")
-    @patch("orders.views.send_mail")
-    def test_confirm_without_stripe_creates_order_and_sends_mail(self, mock_send_mail):
+    def test_confirm_without_stripe_creates_order_and_queues_mail(self):
         cart = self._cart_with_qty(2)
         s = self.client.session
         s["checkout_email"] = "ok@example.com"
@@ -90,20 +119,26 @@ class OrdersViewsMoreBranchesTests(TestCase):
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 200)
         self.assertEqual(Order.objects.count(), 1)
-        mock_send_mail.assert_called()
+        self.assertEqual(mail.outbox, [])
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.to, queued.status), (["ok@example.com"], EmailOutbox.Status.PENDING))
+
+        self.assertEqual(outbox.deliver()["sent"], 1)
+        self.assertEqual(mail.outbox[0].to, ["ok@example.com"])
+        self.assertIn(Order.objects.get().tracking_code, mail.outbox[0].body)
 
     @override_settings(STRIPE_SECRET_KEY="", STRIPE_PUBLISHABLE_KEY="")
-    @patch("orders.views.send_mail")
-    def test_confirm_mail_failure_is_ignored(self, mock_send_mail):
+    @patch("django.core.mail.get_connection", side_effect=Exception("smtp down"))
+    def test_confirm_mail_failure_is_ignored(self, mock_connection):
         cart = self._cart_with_qty(1)
         s = self.client.session
         s["checkout_email"] = "ok@example.com"
         s["checkout_ship"] = {"name": "OK"}
         s.save()
-        mock_send_mail.side_effect = Exception("smtp down")
         res = self.client.get(reverse("orders:checkout_confirm"))
         self.assertEqual(res.status_code, 200)
         self.assertEqual(Order.objects.count(), 1)
+        mock_connection.assert_not_called()
 
     def test_track_order_not_found_shows_page(self):
         res = self.client.get(reverse("orders:track_order"))
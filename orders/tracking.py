@@ -0,0 +1,282 @@
+"""Consulta pública de pedidos por código de seguimiento.
+
+Dos capas delante de la base de datos:
+
+- Un filtro de Bloom con todos los códigos existentes. Lo construye con una
+  sola consulta el primer proceso que lo necesita y lo deja en la caché
+  compartida, troceado en claves de ``_CHUNK_BYTES`` (Memcached no guarda
+  valores de más de 1 MB); los demás lo cargan de ahí y lo reconstruyen cada
+  ``ORDER_TRACKING_BLOOM_TTL`` segundos. Cada pedido nuevo (``post_save``,
+  al confirmarse la transacción) deja además una marca en la caché que vive
+  más que cualquier copia del filtro, para que lo encuentren también los
+  procesos con una copia anterior. Un código que no está en el filtro ni tiene marca no existe, así
+  que los códigos inventados no llegan a la base de datos (ni aunque lleven
+  el dígito de control bien: se puede calcular).
+- Una caché de lectura (``django.core.cache``) código → resumen del pedido
+  ya preparado para la plantilla, durante ``ORDER_TRACKING_CACHE_TTL``
+  segundos. Cualquier ``save()`` del pedido (p. ej. un cambio de estado) la
+  invalida. Los falsos positivos del filtro que no encuentran nada se
+  recuerdan ``ORDER_TRACKING_MISS_TTL`` segundos: repetir el mismo código no
+  vuelve a consultar.
+
+Con varios procesos la caché de Django tiene que ser compartida (Redis,
+Memcached...), igual que para invalidar los resúmenes.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from core import codes
+
+_CACHE_PREFIX = "orders:track:"
+_BLOOM_KEY = _CACHE_PREFIX + "bloom"
+_KNOWN_PREFIX = _CACHE_PREFIX + "known:"
+# Trozo máximo del filtro por clave de caché, con margen bajo el 1 MB de Memcached
+_CHUNK_BYTES = 512 * 1024
+# Resumen en caché de un código que no existe
+_MISSING = "missing"
+# Un pedido cuyo INSERT se confirmó hasta este margen después de empezar a
+# construir el filtro sigue necesitando su marca
+_BUILD_MARGIN = 60
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on blake2b)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def header(self) -> dict:
+        """Everything but the bits, to rebuild the filter with ``from_parts``."""
+        return {"capacity": self.capacity, "size": self.size, "hashes": self.hashes, "count": self.count}
+
+    @classmethod
+    def from_parts(cls, header: dict, bits) -> "BloomFilter":
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.size = header["capacity"], header["size"]
+        bloom.hashes, bloom.count = header["hashes"], header["count"]
+        bloom.bits = bytearray(bits)
+        if len(bloom.bits) != (bloom.size + 7) // 8:
+            raise ValueError("Bloom filter bits do not match its header")
+        return bloom
+
+
+def _bloom_ttl() -> float:
+    return float(getattr(settings, "ORDER_TRACKING_BLOOM_TTL", 600))
+
+
+def _known_key(code: str) -> str:
+    return _KNOWN_PREFIX + hashlib.sha1(code.encode()).hexdigest()
+
+
+def _chunk_keys(build: str, chunks: int) -> list[str]:
+    return [f"{_BLOOM_KEY}:{build}:{i}" for i in range(chunks)]
+
+
+def _store_shared(started: float, bloom: BloomFilter, ttl: int) -> None:
+    """Publish `bloom` in the cache: the bits in chunks, then the header."""
+    build = f"{started:.6f}"
+    parts = [bytes(bloom.bits[i:i + _CHUNK_BYTES]) for i in range(0, len(bloom.bits), _CHUNK_BYTES)]
+    cache.set_many(dict(zip(_chunk_keys(build, len(parts)), parts)), ttl)
+    # La cabecera va la última: quien la lea ya encuentra todos los trozos
+    cache.set(_BLOOM_KEY, {**bloom.header(), "started": started, "build": build, "chunks": len(parts)}, ttl)
+
+
+def _load_shared(ttl: float):
+    """``(started, bloom)`` from the cache, or None if missing, stale or incomplete."""
+    header = cache.get(_BLOOM_KEY)
+    if header is None or time.time() - header["started"] > ttl:
+        return None
+    keys = _chunk_keys(header["build"], header["chunks"])
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        # Algún trozo desalojado: mejor reconstruir que usar un filtro con huecos
+        return None
+    return header["started"], BloomFilter.from_parts(header, b"".join(found[k] for k in keys))
+
+
+class TrackingIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._bloom = BloomFilter(1)
+
+    def is_stale(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at > _bloom_ttl()
+
+    def ensure_fresh(self) -> "TrackingIndex":
+        if self.is_stale():
+            self.rebuild()
+        return self
+
+    def invalidate(self) -> None:
+        self._built_at = None
+        cache.delete(_BLOOM_KEY)
+
+    def rebuild(self) -> None:
+        """Load the shared filter, or build it with one query if there is none."""
+        from .models import Order
+
+        ttl = _bloom_ttl()
+        shared = _load_shared(ttl)
+        if shared is not None:
+            bloom = shared[1]
+        else:
+            started = time.time()
+            rows = Order.objects.values_list("tracking_code", flat=True)
+            bloom = BloomFilter(
+                rows.count() * 2 + 1024,
+                float(getattr(settings, "ORDER_TRACKING_BLOOM_ERROR_RATE", 0.001)),
+            )
+            for code in rows.iterator(chunk_size=2000):
+                bloom.add(code)
+            _store_shared(started, bloom, int(ttl))
+        with self._lock:
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+
+    def add(self, code: str) -> None:
+        # Un proceso puede quedarse con una copia del filtro hasta dos TTL
+        # (la cargó justo antes de caducar): la marca tiene que durar más
+        cache.set(_known_key(code), True, int(2 * _bloom_ttl() + _BUILD_MARGIN))
+        with self._lock:
+            self._bloom.add(code)
+            if self._bloom.count > self._bloom.capacity:
+                # Lleno: la tasa de falsos positivos se dispara, toca redimensionar
+                self.invalidate()
+
+    def might_exist(self, code: str) -> bool:
+        """False only when `code` certainly does not exist."""
+        from .models import TRACKING_PREFIX
+
+        if code.startswith(TRACKING_PREFIX) and len(code) == len(TRACKING_PREFIX) + codes.LENGTH:
+            if not codes.is_valid(code[len(TRACKING_PREFIX):]):
+                return False
+        return code in self._bloom or cache.get(_known_key(code)) is not None
+
+
+_index = TrackingIndex()
+
+
+def get_index() -> TrackingIndex:
+    return _index.ensure_fresh()
+
+
+def _cache_key(code: str) -> str:
+    return _CACHE_PREFIX + hashlib.sha1(code.encode()).hexdigest()
+
+
+def summary(order) -> dict:
+    """What the tracking page shows, as plain cacheable values."""
+    from .models import Order, OrderStatusEvent
+
+    events = OrderStatusEvent.objects.timeline(order).values_list("status", "created_at")
+    return {
+        "tracking_code": order.tracking_code,
+        "total": order.total,
+        "status": order.status,
+        "status_display": order.get_status_display(),
+        "ship_name": order.ship_name,
+        "ship_street": order.ship_street,
+        "ship_number": order.ship_number,
+        "ship_floor": order.ship_floor,
+        "ship_city": order.ship_city,
+        "ship_postal_code": order.ship_postal_code,
+        "ship_country": order.ship_country,
+        "items": list(order.items.values("quantity", "product_name", "subtotal")),
+        "timeline": [
+            {"status": status, "status_display": Order.Status(status).label, "at": at}
+            for status, at in events
+        ],
+    }
+
+
+def normalize(code: str) -> str:
+    """Tracking code as stored: uppercase, look-alikes folded after the prefix.
+
+    Los códigos antiguos (``PT-DEMO-001``) llevan guiones y letras que
+    ``codes.normalize`` cambiaría, así que solo se pliega si el resultado es
+    un código válido.
+    """
+    from .models import TRACKING_PREFIX
+
+    code = (code or "").strip().upper()
+    if code.startswith(TRACKING_PREFIX):
+        folded = codes.normalize(code[len(TRACKING_PREFIX):])
+        if codes.is_valid(folded):
+            return TRACKING_PREFIX + folded
+    return code
+
+
+def lookup(code: str) -> dict | None:
+    """Order summary for `code`, or None when no order has it."""
+    from .models import Order
+
+    code = normalize(code)
+    if not code or not get_index().might_exist(code):
+        return None
+    key = _cache_key(code)
+    found = cache.get(key)
+    if found is None:
+        order = Order.objects.filter(tracking_code=code).first()
+        if order is None:
+            cache.set(key, _MISSING, int(getattr(settings, "ORDER_TRACKING_MISS_TTL", 60)))
+            return None
+        found = summary(order)
+        cache.set(key, found, int(getattr(settings, "ORDER_TRACKING_CACHE_TTL", 300)))
+    return None if found == _MISSING else found
+
+
+def forget(code: str) -> None:
+    cache.delete(_cache_key(code))
+
+
+def _saved(code: str, created: bool) -> None:
+    if created:
+        _index.add(code)
+    forget(code)
+
+
+def _on_order_saved(sender, instance, created, **kwargs):
+    # Tras el COMMIT: un rollback no deja marcas de un pedido que no existe, y
+    # una lectura anterior al COMMIT no vuelve a dejar en caché el estado viejo
+    code = instance.tracking_code
+    transaction.on_commit(lambda: _saved(code, created), using=kwargs.get("using"))
+
+
+def _on_order_deleted(sender, instance, **kwargs):
+    code = instance.tracking_code
+    transaction.on_commit(lambda: forget(code), using=kwargs.get("using"))
+
+
+def connect_signals() -> None:
+    from .models import Order
+
+    post_save.connect(_on_order_saved, sender=Order, dispatch_uid="orders_tracking_order_saved")
+    post_delete.connect(_on_order_deleted, sender=Order, dispatch_uid="orders_tracking_order_deleted")
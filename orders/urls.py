@@ -8,4 +8,5 @@ urlpatterns = [
     path('checkout/payment/', views.checkout_payment, name='checkout_payment'),
     path('checkout/confirm/', views.checkout_confirm, name='checkout_confirm'),
     path('track/', views.track_order, name='track_order'),
+    path('mis-pedidos/', views.my_orders, name='my_orders'),
 ]
@@ -1,24 +1,32 @@
 from django.shortcuts import render, redirect
 from django.conf import settings
-from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_GET, require_http_methods
 from django.http import JsonResponse, HttpResponseBadRequest
+from django.db.models import Prefetch, Q
+from django.utils.dateparse import parse_datetime
 from decimal import Decimal
-import stripe
+import base64
+import json
+import logging
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.db import transaction
 from django.urls import reverse
 
-from cart.utils import get_or_create_cart
+from cart.utils import get_cart, materialize_cart
 from cart.models import Cart
 from catalog.models import Product
+from core.models import EmailOutbox
+from . import payments, reservations, tracking
 from .models import Order, OrderItem
 
+logger = logging.getLogger(__name__)
+
 @require_http_methods(["GET"])
 def checkout_start(request):
 	"""Step 1: show catalog shortcut or summary with proceed button."""
-	cart = get_or_create_cart(request)
-	if not cart.items.exists():
+	cart = get_cart(request)
+	if cart is None or cart.is_empty():
 		messages.error(request, "Tu cesta está vacía. Añade productos antes de ir a pagar.")
 		return redirect('home')
 	return render(request, 'orders/checkout_start.html', {
@@ -28,8 +36,8 @@ def checkout_start(request):
 @require_http_methods(["GET", "POST"])
 def checkout_payment(request):
 	"""Step 2: shipping info + create Stripe PaymentIntent."""
-	cart = get_or_create_cart(request)
-	if not cart.items.exists():
+	cart = get_cart(request)
+	if cart is None or cart.is_empty():
 		messages.error(request, "Tu cesta está vacía. Añade productos antes de ir a pagar.")
 		return redirect('home')
 	if request.method == 'POST':
@@ -47,19 +55,25 @@ def checkout_payment(request):
 
 		amount = int(Decimal(cart.total) * 100)
 		client_secret = None
-		payment_intent_id = None
-		is_card = bool(settings.STRIPE_SECRET_KEY)
-		if is_card:
-			stripe.api_key = settings.STRIPE_SECRET_KEY
-			intent = stripe.PaymentIntent.create(
-				amount=amount,
-				currency='eur',
-				capture_method='manual',
-				automatic_payment_methods={'enabled': True},
-				metadata={'cart_id': str(cart.id)},
-			)
-			client_secret = intent.client_secret
-			payment_intent_id = intent.id
+		gateway = payments.get_gateway()
+		if gateway.enabled:
+			# Apartar el stock mientras se paga; caduca a los CHECKOUT_RESERVATION_TTL segundos
+			reservation_key = request.session.get(reservations.SESSION_KEY) or reservations.new_key()
+			if not reservations.reserve(reservation_key, {it.product_id: it.quantity for it in cart.lines()}):
+				messages.error(request, "No queda stock suficiente para alguno de los productos de tu cesta.")
+				return redirect('orders:checkout_start')
+			request.session[reservations.SESSION_KEY] = reservation_key
+			try:
+				_intent_id, client_secret = _sync_payment_intent(
+					request, gateway, amount, {'cart_id': str(cart.id or ''), 'reservation': reservation_key},
+				)
+			except payments.PaymentError:
+				reservations.release(reservation_key)
+				messages.error(request, "No se pudo iniciar el pago con tarjeta. Inténtalo de nuevo en unos minutos.")
+				return redirect('orders:checkout_payment')
+			except Exception:
+				reservations.release(reservation_key)
+				raise
 		else:
 			messages.error(request, "Stripe no está configurado. Añade STRIPE_SECRET_KEY y STRIPE_PUBLISHABLE_KEY en .env para pagar con tarjeta.")
 			# Aunque Stripe no esté configurado, devolvemos el formulario prellenado
@@ -83,7 +97,6 @@ def checkout_payment(request):
 		request.session['checkout_email'] = email
 		request.session['checkout_ship'] = ship
 		request.session['checkout_payment_method'] = payment_method
-		request.session['payment_intent_id'] = payment_intent_id
 
 		# Prellenado para mostrar datos persistidos mientras se ingresa tarjeta
 		initial = {
@@ -139,11 +152,125 @@ def checkout_payment(request):
 		'initial': initial,
 	})
 
+_INTENT_SESSION = 'payment_intent'
+# Estados en los que el intent aún espera al cliente y admite cambios
+_REUSABLE_INTENT_STATUSES = ('requires_payment_method', 'requires_confirmation', 'requires_action')
+_INTENT_CACHE_ATTR = '_payment_intents'
+
+
+def _sync_payment_intent(request, gateway, amount, metadata):
+	"""Reuse the session PaymentIntent; returns ``(id, client_secret)``.
+
+	Volver a enviar el formulario (p. ej. para corregir la dirección) no crea
+	otro intent mientras el guardado siga esperando al cliente
+	(``_REUSABLE_INTENT_STATUSES``): si importe y metadata no cambiaron se
+	reutiliza tal cual, y si cambiaron basta un ``modify``. Si ya no admite
+	cambios (autorizado, cancelado...) se crea uno nuevo, anulando antes la
+	autorización del anterior si la hubiera.
+	"""
+	intent_id = request.session.get('payment_intent_id')
+	saved = request.session.get(_INTENT_SESSION) or {}
+	if intent_id and saved.get('client_secret'):
+		try:
+			current = _retrieve_intent(request, gateway, intent_id)
+		except payments.GatewayUnavailable:
+			raise
+		except payments.PaymentError:
+			current = {'id': intent_id, 'status': None}
+		if current.get('status') in _REUSABLE_INTENT_STATUSES:
+			if saved.get('amount') == amount and saved.get('metadata') == metadata:
+				return intent_id, saved['client_secret']
+			try:
+				gateway.modify_intent(intent_id, amount, metadata)
+			except payments.GatewayUnavailable:
+				raise
+			except payments.PaymentError:
+				# Ya no es modificable: se libera la autorización, si la hubiera
+				_void_payment(gateway, {'id': intent_id})
+			else:
+				request.session[_INTENT_SESSION] = dict(saved, amount=amount, metadata=metadata)
+				return intent_id, saved['client_secret']
+		elif current.get('status') == 'requires_capture':
+			# El cliente ya autorizó el pago anterior: no se deja retenido
+			_void_payment(gateway, current)
+	intent = gateway.create_intent(amount, metadata)
+	request.session['payment_intent_id'] = intent['id']
+	request.session[_INTENT_SESSION] = {'client_secret': intent['client_secret'], 'amount': amount, 'metadata': metadata}
+	return intent['id'], intent['client_secret']
+
+
+def _retrieve_intent(request, gateway, intent_id):
+	"""``gateway.retrieve_intent`` memoized on the request."""
+	cache = request.__dict__.setdefault(_INTENT_CACHE_ATTR, {})
+	if intent_id not in cache:
+		cache[intent_id] = gateway.retrieve_intent(intent_id)
+	return cache[intent_id]
+
+
+def _void_payment(gateway, payment_intent, order=None):
+	"""Compensación: anula la autorización (o reembolsa si ya se cobró).
+
+	Si la pasarela tampoco responde a esto, el intent queda en el log como
+	ERROR con el pedido para conciliarlo después.
+	"""
+	try:
+		if payment_intent.get('status') == 'succeeded':
+			gateway.refund(payment_intent['id'])
+		else:
+			gateway.cancel(payment_intent['id'])
+	except payments.PaymentError:
+		logger.exception(
+			"No se pudo anular el PaymentIntent %s (pedido %s): pendiente de conciliar",
+			payment_intent.get('id'), getattr(order, 'pk', None),
+		)
+		return False
+	return True
+
+
+def _cancel_unpaid_order(order, quantities, gateway, payment_intent):
+	"""Compensación: la captura falló después de confirmar el stock.
+
+	Además de cancelar el pedido y devolver el stock se anula la
+	autorización, para no retener el dinero del cliente hasta que caduque.
+	"""
+	with transaction.atomic():
+		order.status = Order.Status.CANCELED
+		order.save(update_fields=['status', 'updated_at'])
+		Product.return_stock(quantities)
+		EmailOutbox.discard(_confirmation_key(order))
+	try:
+		# Una captura que agotó el tiempo pudo cobrarse igualmente: entonces toca reembolsar
+		payment_intent = gateway.retrieve_intent(payment_intent['id'])
+	except payments.PaymentError:
+		pass
+	_void_payment(gateway, payment_intent, order)
+
+
+def _confirmation_key(order):
+	return f"order-confirmation:{order.pk}"
+
+
+def _enqueue_confirmation(order, items, held=False):
+	"""Queue the confirmation mail; call it inside the order transaction."""
+	body = (
+		f"Gracias por tu compra!\n\n"
+		f"Código de seguimiento: {order.tracking_code}\n"
+		f"Importe: {order.total} €\n"
+		f"Envío a: {order.ship_name}, {order.ship_street} {order.ship_number}, {order.ship_city} {order.ship_postal_code}, {order.ship_country}\n\n"
+		"Detalles:\n" + "\n".join([f"- {it.quantity} x {it.product_name} = {it.subtotal} €" for it in items])
+	)
+	return EmailOutbox.enqueue(
+		"Confirmación de pedido PetFun", body, [order.contact_email],
+		key=_confirmation_key(order), held=held,
+	)
+
+
 @require_http_methods(["GET"]) 
 def checkout_confirm(request):
 	"""Step 3: confirmation, create order and clear cart (simulated immediate success)."""
-	cart = get_or_create_cart(request)
-	if not cart.items.exists():
+	# Un carrito anónimo (cookie/caché) pasa aquí a filas Cart/CartItem
+	cart = materialize_cart(request)
+	if cart is None or not cart.items.exists():
 		messages.error(request, "Tu cesta está vacía. Añade productos antes de ir a pagar.")
 		return redirect('home')
 	email = request.session.get('checkout_email')
@@ -155,14 +282,15 @@ def checkout_confirm(request):
 		return redirect('orders:checkout_payment')
 
 	# If paying by card, verify PaymentIntent state and amount
-	if pay_method == Order.PaymentMethod.CARD and settings.STRIPE_SECRET_KEY:
+	gateway = payments.get_gateway()
+	is_card = pay_method == Order.PaymentMethod.CARD and gateway.enabled
+	if is_card:
 		if not pi:
 			messages.error(request, "No se encontró la sesión de pago de Stripe. Vuelve a introducir el pago.")
 			return redirect('orders:checkout_payment')
 		try:
-			stripe.api_key = settings.STRIPE_SECRET_KEY
-			pi_obj = stripe.PaymentIntent.retrieve(pi)
-		except Exception:
+			pi_obj = _retrieve_intent(request, gateway, pi)
+		except payments.PaymentError:
 			messages.error(request, "No se pudo verificar el pago en Stripe. Inténtalo de nuevo.")
 			return redirect('orders:checkout_payment')
 		expected_amount = int(Decimal(cart.total) * 100)
@@ -174,109 +302,115 @@ def checkout_confirm(request):
 			messages.error(request, f"El pago no está listo (estado: {status}). Completa la autenticación o inténtalo de nuevo.")
 			return redirect('orders:checkout_payment')
 
-	
+	needs_capture = is_card and pi_obj.get('status') == 'requires_capture'
+
+	# Las llamadas a Stripe quedan fuera de la transacción: primero se toma el
+	# stock y se crea el pedido (transacción corta) y después se captura. Si el
+	# stock falla se anula la autorización; si falla la captura se cancela el
+	# pedido y se devuelve el stock.
+	order = None
 	with transaction.atomic():
-		
 		cart_items = list(cart.items.select_related('product'))
 		product_ids = [it.product_id for it in cart_items]
-		products_locked = {p.id: p for p in Product.objects.select_for_update().filter(id__in=product_ids)}
+		# Las reservas caducadas (de cualquiera) vuelven al stock antes de comprobarlo
+		reservations.release_expired(product_ids=product_ids)
+		products_locked = Product.objects.select_for_update().in_bulk(product_ids)
+		# Lo reservado en el paso de pago ya salió del stock, pero es nuestro
+		reservation_key = request.session.get(reservations.SESSION_KEY)
+		held = reservations.live(reservation_key)
 		adjustments = []
+		to_update, to_delete = [], []
 		for it in cart_items:
 			p = products_locked.get(it.product_id)
 			if not p:
-				it.delete()
-				adjustments.append(f"Se eliminó '{it.product_name or 'producto'}' (ya no disponible)")
+				to_delete.append(it)
+				adjustments.append(f"Se eliminó '{it.product.name or 'producto'}' (ya no disponible)")
 				continue
-			if p.stock <= 0:
-				it.delete()
+			available = p.stock + held.get(p.id, 0)
+			if available <= 0:
+				to_delete.append(it)
 				adjustments.append(f"Se eliminó '{p.name}' (sin stock)")
 				continue
-			if it.quantity > p.stock:
-				old_q = it.quantity
-				it.quantity = p.stock
-				it.unit_price = p.price
-				it.save()
-				adjustments.append(f"Se ajustó '{p.name}' de {old_q} → {p.stock} por stock disponible")
-			else:
+			if it.quantity > available or it.unit_price != p.price:
+				if it.quantity > available:
+					adjustments.append(f"Se ajustó '{p.name}' de {it.quantity} → {available} por stock disponible")
+					it.quantity = available
 				it.unit_price = p.price
-				it.save()
-
-		cart.recalc_total()
+				to_update.append(it)
+		# Un solo bulk UPDATE/DELETE de las líneas en lugar de un save() por item
+		cart.write_lines(updated=to_update, deleted=to_delete)
 
 		if adjustments:
-			if not cart.items.exists():
+			if not cart.item_count:
 				messages.error(request, "Algunos productos ya no están disponibles. Tu cesta ha quedado vacía.")
 			else:
 				messages.error(request, "Actualizamos tu cesta por cambios de stock/precio: " + "; ".join(adjustments))
-			return redirect('orders:checkout_start')
-
-		# For card payments with manual capture: capture now after validating stock
-		if pay_method == Order.PaymentMethod.CARD and settings.STRIPE_SECRET_KEY:
-			try:
-				stripe.api_key = settings.STRIPE_SECRET_KEY
-				current_pi = stripe.PaymentIntent.retrieve(request.session.get('payment_intent_id'))
-				if current_pi.get('status') == 'requires_capture':
-					stripe.PaymentIntent.capture(current_pi['id'])
-				elif current_pi.get('status') != 'succeeded':
-					messages.error(request, f"El pago no está listo para finalizar (estado: {current_pi.get('status')}).")
-					return redirect('orders:checkout_payment')
-			except Exception:
-				messages.error(request, "No se pudo capturar el pago en Stripe. Inténtalo de nuevo.")
-				return redirect('orders:checkout_payment')
-		order = Order.objects.create(
-			user=request.user if request.user.is_authenticated else None,
-			contact_email=email,
-			total=cart.total,
-			status=Order.Status.RECEIVED,
-			ship_name=ship.get('name',''),
-			ship_street=ship.get('street',''),
-			ship_number=ship.get('number',''),
-			ship_floor=ship.get('floor',''),
-			ship_city=ship.get('city',''),
-			ship_postal_code=ship.get('postal_code',''),
-			ship_country=ship.get('country',''),
-			payment_method=pay_method,
-		)
-		for it in cart.items.select_related('product').all():
-			p = products_locked[it.product_id]
-			# Final guard: if somehow stock changed, abort
-			if it.quantity > p.stock:
-				messages.error(request, f"Stock insuficiente para '{p.name}'. Inténtalo de nuevo.")
-				return redirect('orders:checkout_start')
-			OrderItem.objects.create(
-				order=order,
-				product=p,
-				product_name=p.name,
-				quantity=it.quantity,
-				unit_price=it.unit_price,
-				subtotal=it.subtotal,
+		else:
+			order = Order.objects.create(
+				user=request.user if request.user.is_authenticated else None,
+				contact_email=email,
+				total=cart.total,
+				status=Order.Status.RECEIVED,
+				ship_name=ship.get('name',''),
+				ship_street=ship.get('street',''),
+				ship_number=ship.get('number',''),
+				ship_floor=ship.get('floor',''),
+				ship_city=ship.get('city',''),
+				ship_postal_code=ship.get('postal_code',''),
+				ship_country=ship.get('country',''),
+				payment_method=pay_method,
 			)
-			p.stock = max(0, p.stock - it.quantity)
-			p.save()
+			order_items = OrderItem.objects.bulk_create([
+				OrderItem(
+					order=order,
+					product=products_locked[it.product_id],
+					product_name=products_locked[it.product_id].name,
+					quantity=it.quantity,
+					unit_price=it.unit_price,
+					subtotal=it.subtotal,
+				)
+				for it in cart_items
+			])
+			# El correo sale de la cola (comando send_outbox), no de esta petición.
+			# Si falta capturar el pago queda retenido hasta que se cobre
+			_enqueue_confirmation(order, order_items, held=needs_capture)
+			wanted = {it.product_id: it.quantity for it in cart_items}
+			# Con la reserva viva basta con convertirla. Si caducó, se devuelve lo
+			# que quede y se toma el stock con UPDATE ... SET stock = stock - q
+			# WHERE stock >= q; si alguna fila no se actualiza, se deshace todo
+			if not reservations.convert(reservation_key, wanted):
+				reservations.release(reservation_key)
+				if not Product.take_stock(wanted):
+					transaction.set_rollback(True)
+					order = None
 
-		cart.items.all().delete()
-		cart.recalc_total()
+	if order is None:
+		# Sin pedido la autorización no se va a capturar: se anula ya para no
+		# retener el dinero del cliente hasta que caduque
+		if is_card:
+			_void_payment(gateway, pi_obj)
+			request.session.pop('payment_intent_id', None)
+			request.session.pop(_INTENT_SESSION, None)
+		if not adjustments:
+			messages.error(request, "Stock insuficiente para completar el pedido. Inténtalo de nuevo.")
+		return redirect('orders:checkout_start')
 
-	for k in ['checkout_email','checkout_ship','payment_intent_id','checkout_payment_method']:
-		request.session.pop(k, None)
+	# For card payments with manual capture: capture now, once stock is committed
+	if needs_capture:
+		try:
+			gateway.capture(pi_obj['id'])
+		except payments.PaymentError:
+			_cancel_unpaid_order(order, wanted, gateway, pi_obj)
+			request.session.pop('payment_intent_id', None)
+			request.session.pop(_INTENT_SESSION, None)
+			messages.error(request, "No se pudo capturar el pago en Stripe. Inténtalo de nuevo.")
+			return redirect('orders:checkout_payment')
+		EmailOutbox.release(_confirmation_key(order))
 
-	try:
-		body = (
-			f"Gracias por tu compra!\n\n"
-			f"Código de seguimiento: {order.tracking_code}\n"
-			f"Importe: {order.total} €\n"
-			f"Envío a: {order.ship_name}, {order.ship_street} {order.ship_number}, {order.ship_city} {order.ship_postal_code}, {order.ship_country}\n\n"
-			"Detalles:\n" + "\n".join([f"- {it.quantity} x {it.product_name} = {it.subtotal} €" for it in order.items.all()])
-		)
-		send_mail(
-			"Confirmación de pedido PetFun",
-			body,
-			settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'no-reply@petfun.local',
-			[order.contact_email],
-			fail_silently=not settings.DEBUG,
-		)
-	except Exception:
-		pass
+	cart.clear()
+
+	for k in ['checkout_email','checkout_ship','payment_intent_id',_INTENT_SESSION,'checkout_payment_method', reservations.SESSION_KEY]:
+		request.session.pop(k, None)
 
 	return render(request, 'orders/checkout_confirm.html', {
 		'order': order,
@@ -284,13 +418,67 @@ def checkout_confirm(request):
 
 @require_http_methods(["GET", "POST"])
 def track_order(request):
-	"""Public order tracking by tracking_code."""
+	"""Public order tracking by tracking_code (Bloom filter + cached summary)."""
 	code = ""
 	order = None
 	if request.method == 'POST':
 		code = (request.POST.get('code') or '').strip()
 		if code:
-			order = Order.objects.filter(tracking_code=code).first()
+			order = tracking.lookup(code)
 			if not order:
 				messages.error(request, "No se ha encontrado ningún pedido con ese código.")
 	return render(request, 'orders/track.html', {"order": order, "code": code})
+
+
+def _orders_page_size() -> int:
+	return max(1, int(getattr(settings, 'ORDERS_PAGE_SIZE', 10)))
+
+
+def _encode_order_cursor(order) -> str:
+	"""Opaque keyset cursor pointing right after `order` in (-created_at, -id) order."""
+	raw = json.dumps([order.created_at.isoformat(), order.pk]).encode('utf-8')
+	return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_order_cursor(token: str):
+	try:
+		created_at, pk = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+		created_at = parse_datetime(created_at)
+		return (created_at, int(pk)) if created_at else None
+	except Exception:
+		return None
+
+
+@login_required
+@require_GET
+def my_orders(request):
+	"""Historial "Mis pedidos" del usuario, paginado por keyset.
+
+	Sigue el índice (user, -created_at, -id): cada página cuesta lo mismo
+	aunque el cliente tenga cientos de pedidos. Solo se leen las columnas que
+	pinta la plantilla y las líneas llegan en un único prefetch.
+	"""
+	orders = (
+		Order.objects.filter(user=request.user)
+		.only('id', 'tracking_code', 'status', 'total', 'created_at')
+		.order_by('-created_at', '-id')
+		.prefetch_related(Prefetch(
+			'items', queryset=OrderItem.objects.only('id', 'order_id', 'product_name', 'quantity', 'subtotal').order_by('id'),
+		))
+	)
+	after = request.GET.get('after', '')
+	if after:
+		cursor = _decode_order_cursor(after)
+		if cursor is None:
+			return HttpResponseBadRequest('Invalid cursor')
+		created_at, pk = cursor
+		orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+	size = _orders_page_size()
+	page = list(orders[:size + 1])
+	has_more = len(page) > size
+	page = page[:size]
+	return render(request, 'orders/my_orders.html', {
+		'orders': page,
+		'next_cursor': _encode_order_cursor(page[-1]) if has_more else None,
+		'is_first_page': not after,
+	})
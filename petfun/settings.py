@@ -80,6 +80,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "cart.middleware.AnonymousCartMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -157,6 +158,60 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [
     BASE_DIR / "Images",
 ]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Nombres con hash de contenido (Logo.<hash>.png) resueltos por el manifest de
+# collectstatic. Opcional: exige ejecutar `collectstatic` en cada despliegue (sin
+# manifest las plantillas fallan) y que el servidor web sirva STATIC_ROOT con
+# Cache-Control immutable para los nombres con hash. En DEBUG se pueden probar
+# con `runserver --nostatic` (core.views.static_asset).
+STATIC_HASHED_NAMES = os.getenv("STATIC_HASHED_NAMES", "0").lower() in ("1", "true", "yes", "y", "on")
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "core.storage.HashedStaticStorage"
+        if STATIC_HASHED_NAMES
+        else "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# Segundos entre comprobaciones del mtime de Images/ para refrescar el manifest de imágenes
+CATALOG_IMAGE_MANIFEST_CHECK = float(os.getenv("CATALOG_IMAGE_MANIFEST_CHECK", "2"))
+
+# Variantes redimensionadas de las imágenes (/img/<sku>/<w>x<h>.<fmt>) y su caché en disco (LRU)
+CATALOG_IMAGE_SIZES = ((80, 80), (160, 160), (400, 400), (800, 800))
+CATALOG_IMAGE_CACHE_DIR = os.getenv("CATALOG_IMAGE_CACHE_DIR", str(MEDIA_ROOT / "variants"))
+CATALOG_IMAGE_CACHE_MAX_BYTES = int(os.getenv("CATALOG_IMAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Catalog listing: products per section page
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "24"))
+# Segundos antes de reconstruir el índice de facetas en memoria (recoge cambios de otros procesos)
+CATALOG_FACET_INDEX_TTL = int(os.getenv("CATALOG_FACET_INDEX_TTL", "60"))
+
+# Pedidos por página en "Mis pedidos"
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "10"))
+
+# Seguimiento público: caché del resumen y filtro de Bloom de códigos (orders.tracking)
+ORDER_TRACKING_CACHE_TTL = int(os.getenv("ORDER_TRACKING_CACHE_TTL", "300"))
+ORDER_TRACKING_BLOOM_TTL = int(os.getenv("ORDER_TRACKING_BLOOM_TTL", "600"))
+ORDER_TRACKING_BLOOM_ERROR_RATE = float(os.getenv("ORDER_TRACKING_BLOOM_ERROR_RATE", "0.001"))
+ORDER_TRACKING_MISS_TTL = int(os.getenv("ORDER_TRACKING_MISS_TTL", "60"))
+
+# Máximo de operaciones por POST a /cart/batch/
+CART_BATCH_MAX_OPS = int(os.getenv("CART_BATCH_MAX_OPS", "50"))
+
+# Carritos anónimos: "cookie" (cookie firmada), "cache" (caché de Django) o
+# "db" (filas Cart/CartItem). Pasan a la BD al confirmar el pedido o al entrar.
+CART_ANONYMOUS_STORAGE = os.getenv("CART_ANONYMOUS_STORAGE", "cookie")
+CART_ANONYMOUS_MAX_AGE = int(os.getenv("CART_ANONYMOUS_MAX_AGE", str(60 * 60 * 24 * 30)))
+CART_COOKIE_NAME = "petfun_cart"
+CART_COOKIE_MAX_BYTES = int(os.getenv("CART_COOKIE_MAX_BYTES", "3800"))
+
+# Limpieza de carritos abandonados (comando purge_carts). Con un intervalo en
+# segundos > 0 también corre en un hilo de cada proceso web.
+CART_ABANDONED_DAYS = int(os.getenv("CART_ABANDONED_DAYS", "30"))
+CART_CLEANUP_BATCH_SIZE = int(os.getenv("CART_CLEANUP_BATCH_SIZE", "500"))
+CART_CLEANUP_INTERVAL = int(os.getenv("CART_CLEANUP_INTERVAL", "0"))
 
 # Where to redirect after login/logout (can be overridden per-view)
 LOGIN_URL = "/login/"
@@ -174,6 +229,21 @@ AUTH_USER_MODEL = "accounts.User"
 # Stripe (set your keys via environment variables in production)
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY", "")
+# Pasarela de pago: "stripe", "fake" (en memoria, sin red) o ruta a una clase
+PAYMENT_GATEWAY = os.getenv("PAYMENT_GATEWAY", "stripe")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))
+STRIPE_TIMEOUT = float(os.getenv("STRIPE_TIMEOUT", "10"))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+STRIPE_RETRY_BACKOFF = float(os.getenv("STRIPE_RETRY_BACKOFF", "0.25"))
+STRIPE_BREAKER_THRESHOLD = int(os.getenv("STRIPE_BREAKER_THRESHOLD", "5"))
+STRIPE_BREAKER_RESET = float(os.getenv("STRIPE_BREAKER_RESET", "30"))
+
+# Segundos que se aparta el stock entre el paso de pago y la confirmación
+CHECKOUT_RESERVATION_TTL = int(os.getenv("CHECKOUT_RESERVATION_TTL", str(15 * 60)))
+CHECKOUT_RESERVATION_BATCH_SIZE = int(os.getenv("CHECKOUT_RESERVATION_BATCH_SIZE", "200"))
+# Segundos entre pasadas de `release_reservations --loop`
+CHECKOUT_RESERVATION_SWEEP_INTERVAL = float(os.getenv("CHECKOUT_RESERVATION_SWEEP_INTERVAL", "30"))
 
 # Email configuration (env-driven; falls back to console in DEBUG if not provided)
 EMAIL_BACKEND = os.getenv("EMAIL_BACKEND")
@@ -188,6 +258,12 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "0").lower() in ("1", "true", "yes")
 EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", "0").lower() in ("1", "true", "yes")
 
+# Cola de correo (EmailOutbox): la vacía el comando send_outbox
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "100"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_BACKOFF = float(os.getenv("EMAIL_OUTBOX_BACKOFF", "60"))
+EMAIL_OUTBOX_INTERVAL = float(os.getenv("EMAIL_OUTBOX_INTERVAL", "5"))
+
 # Ensure Django discovers tests without labels by default on Windows
 # Custom test runner sets an explicit top-level directory for unittest discovery.
 TEST_RUNNER = "petfun.test_runner.CustomDiscoverRunner"
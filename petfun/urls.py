@@ -15,19 +15,32 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import re
+
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from catalog import views as catalog_views
+from core import views as core_views
+
 urlpatterns = [
     path("", include("core.urls")),
     path("", include("accounts.urls")),
     path("catalog/", include("catalog.urls")),
     path("cart/", include("cart.urls")),
     path("", include("orders.urls")),
+    path("img/<str:sku>/<int:width>x<int:height>.<str:fmt>", catalog_views.image_variant, name="image_variant"),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
+# Solo desarrollo: estáticos con hash desde STATIC_ROOT (`runserver --nostatic`).
+# En producción STATIC_ROOT lo sirve el servidor web, no Django.
+if settings.STATIC_HASHED_NAMES and settings.DEBUG:
+    urlpatterns.append(
+        re_path(r"^%s(?P<path>.+)$" % re.escape(settings.STATIC_URL.lstrip("/")), core_views.static_asset)
+    )
+
 # Admin only in development
 if settings.DEBUG:
     urlpatterns.insert(0, path("admin/", admin.site.urls))